@@ -3,6 +3,12 @@
 # pylint: disable=W0212,C0301
 
 
+import time
+import uuid
+import diskcache
+import requests
+from flask import Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 import dash_mantine_components as dmc
 from dash_iconify import DashIconify
 from dash import (
@@ -17,24 +23,56 @@ from dash import (
     Patch,
     dcc,
     State,
+    DiskcacheManager,
+    ALL,
+    ctx,
 )
 from utils.app_helper import (
-    chroma_df,
+    load_catalog,
     make_ext_button,
-    make_file_display,
+    get_ext_button_class,
+    get_page,
+    get_page_count,
     create_weaver_message,
     create_user_message,
-    make_df_from_vectorstore,
-    chat_ai,
+    search_sources,
+    config,
+    stream_chat_ai,
 )
+from utils import tracing
 
 
 _dash_renderer._set_react_version("18.2.0")
 
+# Chat answers are generated in background processes so they don't tie up a worker
+background_callback_manager = DiskcacheManager(diskcache.Cache("./.dash_cache"))
+
 # Initialize the Dash app
-app = Dash(__name__, external_stylesheets=dmc.styles.ALL + ["assets/tailwind.min.css"])
+app = Dash(
+    __name__,
+    external_stylesheets=dmc.styles.ALL + ["assets/tailwind.min.css"],
+    background_callback_manager=background_callback_manager,
+)
+
+# Metrics and per-callback traces. Background callbacks run in worker processes,
+# so their timings only reach the trace log, not /metrics.
+tracing.configure(**config["metrics"])
+
+
+@app.server.route("/metrics")
+def metrics_endpoint():
+    """Expose the app's metrics in the Prometheus text format."""
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
 
-app.layout = dmc.MantineProvider(
+
+@app.server.route("/index/reload", methods=["POST"])
+def reload_index():
+    """Re-read the catalog of a newly published build before the next page load."""
+    load_catalog()
+    return Response(status=204)
+
+
+layout = dmc.MantineProvider(
     children=[
         # Main
         html.Div(
@@ -126,21 +164,24 @@ app.layout = dmc.MantineProvider(
                                         html.Div(
                                             className="w-full flex flex-col gap-4",
                                             children=[
+                                                # Active extension filter
+                                                dcc.Store(id="ext-filter"),
                                                 dmc.TextInput(
                                                     size="lg",
                                                     placeholder="Search documents",
                                                     id="doc-search-input",
+                                                    debounce=config["app"][
+                                                        "search_debounce_ms"
+                                                    ],
                                                     rightSection=DashIconify(
                                                         icon="mdi:magnify",
                                                         width=20,
                                                     ),
                                                 ),
+                                                # Filled from the catalog on every page load
                                                 html.Div(
+                                                    id="ext-buttons",
                                                     className="grid grid-flow-row grid-cols-3 md:grid-cols-4 lg:grid-cols-6 xl:grid-cols-8 2xl:grid-cols-10 gap-2",
-                                                    children=[
-                                                        make_ext_button(ext)
-                                                        for ext in chroma_df.ext.unique()
-                                                    ],
                                                 ),
                                             ],
                                         ),
@@ -151,14 +192,16 @@ app.layout = dmc.MantineProvider(
                                                     html.Div(
                                                         id="file-display",
                                                         className="grid grid-flow-row grid-cols-3 md:grid-cols-4 lg:grid-cols-5 xl:grid-cols-6 2xl:grid-cols-7 gap-4",
-                                                        children=[
-                                                            make_file_display(file)
-                                                            for file in chroma_df.source.unique()
-                                                        ],
                                                     )
                                                 ],
                                             ],
                                         ),
+                                        dmc.Pagination(
+                                            id="file-pagination",
+                                            className="flex justify-center",
+                                            total=1,
+                                            value=1,
+                                        ),
                                     ],
                                 ),
                                 # Right Column
@@ -167,12 +210,18 @@ app.layout = dmc.MantineProvider(
                                     children=[
                                         # Chat Card
                                         html.Div(
-                                            id="chat-cards",
                                             className="flex-grow border border-gray-200 shadow-sm rounded-lg p-4 h-full max-h-full overflow-y-auto",
                                             children=[
-                                                create_weaver_message(
-                                                    "Hi, I'm Weaver. Ask me anything!"
+                                                html.Div(
+                                                    id="chat-cards",
+                                                    children=[
+                                                        create_weaver_message(
+                                                            "Hi, I'm Weaver. Ask me anything!"
+                                                        ),
+                                                    ],
                                                 ),
+                                                # Answer being streamed
+                                                html.Div(id="weaver-stream"),
                                             ],
                                         ),
                                         # Chat Input
@@ -193,7 +242,8 @@ app.layout = dmc.MantineProvider(
                                             disabled=True,
                                             children=[
                                                 DashIconify(
-                                                    icon="mdi:right", className="mr-2"
+                                                    icon="mdi:right",
+                                                    className="mr-2",
                                                 ),
                                                 html.Span("Send"),
                                             ],
@@ -210,18 +260,67 @@ app.layout = dmc.MantineProvider(
 )
 
 
+def serve_layout():
+    """Return the layout with a chat session id of its own for every page load."""
+    return html.Div(
+        [
+            layout,
+            # The API keeps the chat's history under this id
+            dcc.Store(id="chat-session", data=uuid.uuid4().hex),
+        ]
+    )
+
+
+app.layout = serve_layout
+
+
 @callback(
-    Output("file-display", "children"),
-    Input("doc-search-input", "value"),
+    Output("ext-filter", "data"),
+    Output({"type": "ext-button", "index": ALL}, "className"),
+    Input({"type": "ext-button", "index": ALL}, "n_clicks"),
+    State("ext-filter", "data"),
     prevent_initial_call=True,
 )
-def update_file_display(search_value):
-    return [
-        make_file_display(file)
-        for file in make_df_from_vectorstore(search_value).source.unique()
+def update_ext_filter(n_clicks, current_ext):
+    # Clicking the active extension clears the filter
+    clicked_ext = ctx.triggered_id["index"]
+    ext = None if clicked_ext == current_ext else clicked_ext
+    return ext, [
+        get_ext_button_class(button["id"]["index"], button["id"]["index"] == ext)
+        for button in ctx.inputs_list[0]
     ]
 
 
+@callback(
+    Output("ext-buttons", "children"),
+    Input("chat-session", "data"),
+)
+def update_ext_buttons(session_id):
+    # One button per type in the current catalog, loaded on every page load
+    return [make_ext_button(ext) for ext in load_catalog().ext.unique()]
+
+
+@callback(
+    Output("file-display", "children"),
+    Output("file-pagination", "total"),
+    Output("file-pagination", "value"),
+    Input("doc-search-input", "value"),
+    Input("ext-filter", "data"),
+    Input("file-pagination", "value"),
+)
+def update_file_display(search_value, ext, page):
+    with tracing.RequestTrace("update_file_display", ext=ext):
+        # A new search or filter starts back at the first page
+        if ctx.triggered_id != "file-pagination":
+            page = 1
+        with tracing.span("search"):
+            sources = search_sources(search_value, ext)
+        page_count = get_page_count(sources)
+        page = min(page or 1, page_count)
+        with tracing.span("render"):
+            return get_page(sources, page), page_count, page
+
+
 clientside_callback(
     """(input) => '';""",
     Output("chat-input", "value"),
@@ -245,13 +344,43 @@ def update_user_chat(n_clicks, user_input):
     Output("chat-cards", "children", allow_duplicate=True),
     Input("send-chat-btn", "n_clicks"),
     State("chat-input", "value"),
+    State("chat-session", "data"),
+    background=True,
+    progress=Output("weaver-stream", "children"),
+    progress_default=None,
+    running=[(Output("send-chat-btn", "loading"), True, False)],
+    interval=250,
     prevent_initial_call=True,
 )
-def update_weaver_chat(n_clicks, user_input):
-    chat_cards = Patch()
-    chat_response = chat_ai(user_input)
-    chat_cards.append(create_weaver_message(chat_response))
-    return chat_cards
+def update_weaver_chat(set_progress, n_clicks, user_input, session_id):
+    with tracing.RequestTrace("update_weaver_chat") as trace:
+        chat_cards = Patch()
+        chat_response = ""
+        set_progress(create_weaver_message("..."))
+        start = time.perf_counter()
+        try:
+            for token in stream_chat_ai(user_input, session_id):
+                if not chat_response:
+                    tracing.record_span(
+                        "first_token", start, time.perf_counter() - start
+                    )
+                chat_response += token
+                set_progress(create_weaver_message(chat_response))
+        except (requests.RequestException, ValueError, RuntimeError) as e:
+            # Keep what was streamed, then say the answer stopped.
+            trace.attrs["error"] = str(e)
+            trace.finish("error")
+            if chat_response:
+                chat_cards.append(create_weaver_message(chat_response))
+            chat_cards.append(
+                create_weaver_message(
+                    "Sorry, something went wrong while answering. Please try again."
+                )
+            )
+            return chat_cards
+        tracing.record_span("answer", start, time.perf_counter() - start)
+        chat_cards.append(create_weaver_message(chat_response))
+        return chat_cards
 
 
 @callback(
@@ -0,0 +1,287 @@
+"""
+Offline retrieval and RAG API benchmarks, with regression checks against a baseline.
+
+Everything runs against `stub_ollama.py`, in a throwaway copy of the repo, so no
+model server or network access is needed. It reports:
+
+- ingestion: chunks/sec of a full rebuild, and the time of an unchanged re-index
+- search: p50/p95/p99 latency of the retriever in keyword, vector and hybrid mode,
+  and of the `/search` endpoint the Dash search box calls
+- query: `/query` throughput and latency under N concurrent clients
+- stream: time-to-first-token of `/query/stream`
+
+```
+python benchmarks/run_benchmarks.py --save-baseline  # record benchmarks/baseline.json
+python benchmarks/run_benchmarks.py                  # compare; exits 1 on regression
+```
+
+Comparing needs a baseline recorded on the same machine; without one the run
+fails before benchmarking anything.
+"""
+
+# pylint: disable=C0413, C0415
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import logging
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(base_dir)
+sys.path.insert(0, base_dir)
+from stub_ollama import StubOllamaServer
+
+parser = argparse.ArgumentParser(description="Benchmark ingestion, search and /query.")
+parser.add_argument(
+    "--docs",
+    default=os.path.join(parent_dir, "assets", "rag_docs"),
+    help="Directory of documents to ingest",
+)
+parser.add_argument("--queries", type=int, default=50, help="Distinct search queries")
+parser.add_argument("--clients", type=int, default=8, help="Concurrent /query clients")
+parser.add_argument("--requests", type=int, default=64, help="Total /query requests")
+parser.add_argument("--tokens", type=int, default=32, help="Tokens per stub answer")
+parser.add_argument("--token-latency", type=float, default=0.005)
+parser.add_argument("--embed-latency", type=float, default=0.002)
+parser.add_argument(
+    "--output", default=os.path.join(base_dir, "results.json"), help="Results file"
+)
+parser.add_argument(
+    "--baseline", default=os.path.join(base_dir, "baseline.json"), help="Baseline file"
+)
+parser.add_argument(
+    "--save-baseline", action="store_true", help="Store the results as the baseline"
+)
+parser.add_argument(
+    "--tolerance",
+    type=float,
+    default=0.2,
+    help="Relative slowdown allowed before a metric counts as a regression",
+)
+
+
+def percentiles(samples: list) -> dict:
+    """Summarize latencies (in seconds) as p50/p95/p99 milliseconds."""
+    if len(samples) < 2:
+        samples = samples * 2
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {
+        "p50_ms": round(cuts[49] * 1000, 3),
+        "p95_ms": round(cuts[94] * 1000, 3),
+        "p99_ms": round(cuts[98] * 1000, 3),
+    }
+
+
+def timed(fn, *fn_args, **fn_kwargs) -> float:
+    """Return how many seconds a call takes."""
+    start = time.perf_counter()
+    fn(*fn_args, **fn_kwargs)
+    return time.perf_counter() - start
+
+
+def prepare_workspace(workdir: str, docs: str):
+    """Copy the code, config and documents into a throwaway workspace."""
+    shutil.copytree(
+        os.path.join(parent_dir, "utils"),
+        os.path.join(workdir, "utils"),
+        ignore=shutil.ignore_patterns("__pycache__"),
+    )
+    for file_name in ["config.toml", "llm_api.py"]:
+        shutil.copy(os.path.join(parent_dir, file_name), workdir)
+    shutil.copytree(docs, os.path.join(workdir, "assets", "rag_docs"))
+
+
+def bench_ingestion(workdir: str) -> dict:
+    """Time a full rebuild and an unchanged re-index of the workspace."""
+    from utils.retrieval import CATALOG_FILE, current_index_dir
+
+    command = [
+        sys.executable,
+        os.path.join("utils", "setup_chroma_db.py"),
+        "--skip-wikipedia",
+    ]
+    rebuild_seconds = timed(
+        subprocess.run, command + ["--rebuild"], cwd=workdir, check=True
+    )
+    unchanged_seconds = timed(subprocess.run, command, cwd=workdir, check=True)
+
+    catalog_path = os.path.join(current_index_dir("chroma"), CATALOG_FILE)
+    with open(catalog_path, encoding="utf-8") as f:
+        chunks = sum(entry["chunk_count"] for entry in json.load(f))
+    return {
+        "chunks": chunks,
+        "chunks_per_sec": round(chunks / rebuild_seconds, 3),
+        "rebuild_seconds": round(rebuild_seconds, 3),
+        "reindex_unchanged_seconds": round(unchanged_seconds, 3),
+    }
+
+
+def bench_search(api_url: str, queries: list) -> dict:
+    """Time the retriever in each mode and the search endpoint."""
+    import llm_api
+    from utils.api_client import RagApiClient
+
+    results = {}
+    retriever = llm_api.retrieval.retriever
+    configured_mode = retriever.mode
+    for mode in ["keyword", "vector", "hybrid"]:
+        retriever.mode = mode
+        # Suffix the queries per mode so no mode reuses cached query embeddings.
+        mode_queries = [f"{query} {mode}" for query in queries]
+        results[mode] = percentiles([timed(retriever.invoke, q) for q in mode_queries])
+    retriever.mode = configured_mode
+
+    # The Dash app searches through the API. Suffix the queries so it starts
+    # with cold caches.
+    client = RagApiClient(api_url, **llm_api.config["llm"]["client"])
+    api_queries = [f"{query} api" for query in queries]
+    results["api"] = percentiles([timed(client.search, q) for q in api_queries])
+    return results
+
+
+def bench_query(api_url: str, queries: list, clients: int, requests_total: int):
+    """Measure /query throughput and latency under concurrent clients."""
+    import requests
+
+    session = requests.Session()
+
+    def ask(i):
+        # Unique questions, so the answer cache never short-circuits the chain.
+        question = f"{queries[i % len(queries)]} #{i}"
+        start = time.perf_counter()
+        response = session.post(f"{api_url}/query", json={"input": question})
+        response.raise_for_status()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        latencies = list(pool.map(ask, range(requests_total)))
+    elapsed = time.perf_counter() - start
+    return {
+        "clients": clients,
+        "requests": requests_total,
+        "requests_per_sec": round(requests_total / elapsed, 3),
+        **percentiles(latencies),
+    }
+
+
+def bench_stream(api_url: str, queries: list) -> dict:
+    """Measure time-to-first-token of /query/stream."""
+    import requests
+
+    ttfts = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        with requests.post(
+            f"{api_url}/query/stream", json={"input": f"{query} ttft {i}"}, stream=True
+        ) as response:
+            for line in response.iter_lines():
+                if line and "answer" in json.loads(line):
+                    ttfts.append(time.perf_counter() - start)
+                    break
+    return {"ttft": percentiles(ttfts)}
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    """Flatten nested results into ``{"a.b.c": value}`` metrics."""
+    metrics = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            metrics.update(flatten(value, f"{prefix}{key}."))
+        else:
+            metrics[f"{prefix}{key}"] = value
+    return metrics
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """List the metrics that regressed beyond the tolerance.
+
+    Throughputs (``*_per_sec``) must not drop, and latencies (``*_ms``,
+    ``*_seconds``) must not grow, by more than ``tolerance``.
+    """
+    regressions = []
+    current = flatten(results)
+    for metric, base_value in flatten(baseline).items():
+        value = current.get(metric)
+        if value is None or not base_value:
+            continue
+        change = (value - base_value) / base_value
+        if metric.endswith("_per_sec") and change < -tolerance:
+            regressions.append(f"{metric}: {base_value} -> {value} ({change:+.0%})")
+        elif metric.endswith(("_ms", "_seconds")) and change > tolerance:
+            regressions.append(f"{metric}: {base_value} -> {value} ({change:+.0%})")
+    return regressions
+
+
+def main():
+    """Run every benchmark, write the results and check them against the baseline."""
+    args = parser.parse_args()
+    if not args.save_baseline and not os.path.isfile(args.baseline):
+        sys.exit(f"No baseline at {args.baseline}; record one with --save-baseline.")
+    stub = StubOllamaServer(
+        embed_latency=args.embed_latency,
+        token_latency=args.token_latency,
+        tokens=args.tokens,
+    ).start()
+    os.environ["OLLAMA_HOST"] = stub.url
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        prepare_workspace(workdir, args.docs)
+
+        # The API and Dash helpers load config.toml and chroma/ from the cwd.
+        os.chdir(workdir)
+        sys.path.insert(0, workdir)
+        print("Benchmarking ingestion...")
+        results["ingestion"] = bench_ingestion(workdir)
+
+        import llm_api
+        from werkzeug.serving import make_server
+
+        docs = llm_api.retrieval.retriever.keyword_index.get(limit=args.queries)
+        queries = [" ".join(doc.page_content.split()[:5]) for doc in docs]
+
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        api_server = make_server("127.0.0.1", 0, llm_api.app, threaded=True)
+        api_url = f"http://127.0.0.1:{api_server.server_port}"
+        with ThreadPoolExecutor(1) as pool:
+            pool.submit(api_server.serve_forever)
+            print("Benchmarking search...")
+            results["search"] = bench_search(api_url, queries)
+            print("Benchmarking /query...")
+            results["query"] = bench_query(
+                api_url, queries, args.clients, args.requests
+            )
+            print("Benchmarking /query/stream...")
+            results["stream"] = bench_stream(api_url, queries)
+            api_server.shutdown()
+        os.chdir(parent_dir)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.save_baseline:
+        shutil.copy(args.output, args.baseline)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        regressions = compare(results, json.load(f), args.tolerance)
+    if regressions:
+        print("Regressions against the baseline:")
+        print("\n".join(f"  {regression}" for regression in regressions))
+        sys.exit(1)
+    print("No regressions against the baseline.")
+
+
+if __name__ == "__main__":
+    main()
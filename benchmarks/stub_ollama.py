@@ -0,0 +1,177 @@
+"""Stub Ollama server for offline benchmarks.
+
+Implements the parts of the Ollama HTTP API that `OllamaEmbeddings` and
+`ChatOllama` use (`/api/embed` and `/api/chat`), with deterministic vectors and
+configurable latencies, so benchmarks measure this repo rather than a model.
+
+```
+python benchmarks/stub_ollama.py --port 11435 --token-latency 0.01
+OLLAMA_HOST=http://127.0.0.1:11435 python llm_api.py
+```
+"""
+
+import json
+import time
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Answer embedding and chat requests like a (very fast, very dull) model."""
+
+    protocol_version = "HTTP/1.1"
+    server: "StubOllamaServer"
+
+    def log_message(self, format, *args):  # pylint: disable=W0622
+        pass
+
+    def _send_json(self, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):  # pylint: disable=C0103
+        """Answer model listing requests."""
+        self._send_json({"models": []})
+
+    def do_POST(self):  # pylint: disable=C0103
+        """Dispatch embedding and chat requests."""
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if self.path == "/api/embed":
+            self._embed(payload)
+        elif self.path == "/api/chat":
+            self._chat(payload)
+        else:
+            self.send_error(404)
+
+    def _embed(self, payload: dict):
+        texts = payload.get("input", [])
+        if isinstance(texts, str):
+            texts = [texts]
+        time.sleep(self.server.embed_latency)
+        self._send_json(
+            {
+                "model": payload.get("model"),
+                "embeddings": [self.server.embed(text) for text in texts],
+            }
+        )
+
+    def _chat(self, payload: dict):
+        created_at = datetime.now(timezone.utc).isoformat()
+        done = {
+            "model": payload.get("model"),
+            "created_at": created_at,
+            "message": {"role": "assistant", "content": ""},
+            "done": True,
+            "done_reason": "stop",
+            "prompt_eval_count": sum(
+                len(message.get("content", "").split())
+                for message in payload.get("messages", [])
+            ),
+            "eval_count": self.server.tokens,
+        }
+        tokens = [f"token{i} " for i in range(self.server.tokens)]
+
+        if not payload.get("stream", True):
+            time.sleep(self.server.token_latency * len(tokens))
+            done["message"]["content"] = "".join(tokens)
+            self._send_json(done)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for token in tokens:
+            time.sleep(self.server.token_latency)
+            self._write_chunk(
+                {
+                    "model": payload.get("model"),
+                    "created_at": created_at,
+                    "message": {"role": "assistant", "content": token},
+                    "done": False,
+                }
+            )
+        self._write_chunk(done)
+        self.wfile.write(b"0\r\n\r\n")
+
+    def _write_chunk(self, payload: dict):
+        line = (json.dumps(payload) + "\n").encode("utf-8")
+        self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+        self.wfile.flush()
+
+
+class StubOllamaServer(ThreadingHTTPServer):
+    """Threaded stub Ollama server.
+
+    Args:
+        address (tuple): ``(host, port)`` to listen on; port 0 picks a free one.
+        dimensions (int): Size of the returned embedding vectors.
+        embed_latency (float): Seconds added to every embedding request.
+        token_latency (float): Seconds between generated tokens.
+        tokens (int): Number of tokens in every answer.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple = ("127.0.0.1", 0),
+        dimensions: int = 64,
+        embed_latency: float = 0.0,
+        token_latency: float = 0.0,
+        tokens: int = 32,
+    ):
+        super().__init__(address, StubOllamaHandler)
+        self.dimensions = dimensions
+        self.embed_latency = embed_latency
+        self.token_latency = token_latency
+        self.tokens = tokens
+
+    @property
+    def url(self) -> str:
+        """The base URL to use as ``OLLAMA_HOST``."""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def embed(self, text: str) -> list:
+        """Return a deterministic pseudo-embedding of the text."""
+        digest = b""
+        counter = 0
+        while len(digest) < self.dimensions:
+            digest += hashlib.sha256(f"{counter}:{text}".encode("utf-8")).digest()
+            counter += 1
+        return [byte / 255 - 0.5 for byte in digest[: self.dimensions]]
+
+    def start(self) -> "StubOllamaServer":
+        """Serve from a daemon thread and return the server."""
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a stub Ollama server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--dimensions", type=int, default=64)
+    parser.add_argument("--embed-latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    server = StubOllamaServer(
+        (args.host, args.port),
+        dimensions=args.dimensions,
+        embed_latency=args.embed_latency,
+        token_latency=args.token_latency,
+        tokens=args.tokens,
+    )
+    print(f"Stub Ollama server listening on {server.url}")
+    server.serve_forever()
@@ -14,46 +14,187 @@ response.raise_for_status()  # Raise an error for HTTP issues
 data = response.json()
 data_out = data.get('response', 'No response received')
 ```
+
+The streaming, batch, table and search endpoints, conversations, admission
+limits and metrics are described in README.md.
 """
 
 # pylint: disable=W0718
 
+import os
+import json
 import tomllib
-from flask import Flask, request, jsonify
-from langchain_core.prompts import ChatPromptTemplate
+import sqlite3
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import closing
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from langchain_core.documents import Document
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.chains.retrieval import create_retrieval_chain
+from langchain.chains.history_aware_retriever import create_history_aware_retriever
 from langchain.chains.combine_documents import create_stuff_documents_chain
 from langchain_ollama import ChatOllama
 from langchain_ollama import OllamaEmbeddings
-from langchain_chroma import Chroma
+from utils.embedding_cache import CachedEmbeddings
+from utils.request_limiter import RequestLimiter, ServerBusy
+from utils.answer_cache import AnswerCache
+from utils.retrieval import RetrievalService, TABLE_STORE_FILE
+from utils.table_store import TableStore, extract_sql
+from utils.tabular_loader import format_row
+from utils.context_assembly import ContextAssemblyRetriever
+from utils.summary_store import SummaryTierRetriever
+from utils.conversation import ConversationStore
+from utils import tracing
 
 # Load config
 with open("config.toml", "rb") as f:
     config = tomllib.load(f)
 
-# Get vectorstore
+# Get the retrieval service, which swaps in new index builds as they are published
 embedding_model_id = config["utils"]["chroma"]["embedding_model_id"]
 collection_name = config["utils"]["chroma"]["collection_name"]
-embedding_model = OllamaEmbeddings(model=embedding_model_id)
-vectorstore = Chroma(
-    collection_name=collection_name,
-    embedding_function=embedding_model,
-    persist_directory="chroma",
+embedding_model = CachedEmbeddings(
+    OllamaEmbeddings(model=embedding_model_id),
+    model_id=embedding_model_id,
+    **config["utils"]["chroma"]["embedding_cache"],
+)
+retrieval = RetrievalService(
+    "chroma",
+    collection_name,
+    embedding_model,
+    vector_backend=config["utils"]["chroma"]["vector_backend"],
+    quantized=config["utils"]["chroma"]["quantized"],
+    **config["utils"]["chroma"]["retrieval"],
+)
+# Overview questions naming a source are answered from its precomputed
+# summary, when the build has summaries; the rest from assembled chunks.
+context_retriever = SummaryTierRetriever(
+    retriever=ContextAssemblyRetriever(retriever=retrieval, **config["llm"]["context"]),
+    service=retrieval,
+    **config["llm"]["summaries"],
 )
-retriever = vectorstore.as_retriever()
 
 # Build LLM and RAG chain
 prompt = ChatPromptTemplate.from_messages(
     [
         ("system", config["llm"]["system_prompt"]),
+        MessagesPlaceholder("chat_history", optional=True),
         ("human", "{input}"),
     ]
 )
 llm = ChatOllama(model=config["llm"]["model_id"], **config["llm"]["chat_kwargs"])
 question_answer_chain = create_stuff_documents_chain(llm, prompt)
-rag_chain = create_retrieval_chain(retriever, question_answer_chain)
+
+# Follow-up questions are rewritten into standalone ones before retrieval;
+# without history the question goes to the retriever as it is.
+config_conversation = config["llm"]["conversation"]
+conversation_llm = ChatOllama(
+    model=config["llm"]["model_id"], **config_conversation["chat_kwargs"]
+)
+rewrite_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", config_conversation["rewrite_prompt"]),
+        MessagesPlaceholder("chat_history"),
+        ("human", "{input}"),
+    ]
+)
+history_aware_retriever = create_history_aware_retriever(
+    conversation_llm.with_config(tags=[tracing.REWRITE_TAG]),
+    context_retriever,
+    rewrite_prompt,
+)
+rag_chain = create_retrieval_chain(history_aware_retriever, question_answer_chain)
+config_tables = config["llm"]["tables"]
+sql_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", config_tables["sql_prompt"]),
+        ("human", "{input}"),
+    ]
+)
+sql_chain = (
+    sql_prompt
+    | ChatOllama(model=config["llm"]["model_id"], **config_tables["chat_kwargs"])
+    | StrOutputParser()
+)
+answer_cache = AnswerCache(
+    embedding_model,
+    version_path=os.path.join("chroma", "index_version"),
+    **config["llm"]["answer_cache"],
+)
 
 app = Flask(__name__)
+config_serving = config["llm"]["serving"]
+config_batch = config["llm"]["batch"]
+limiter = RequestLimiter(
+    max_in_flight=config_serving["max_in_flight"],
+    max_queued=config_serving["max_queued"],
+    queue_timeout=config_serving["queue_timeout"],
+)
+
+summary_prompt = ChatPromptTemplate.from_messages(
+    [
+        ("system", config_conversation["summary_prompt"]),
+        ("human", "{turns}"),
+    ]
+)
+summary_chain = summary_prompt | conversation_llm | StrOutputParser()
+
+
+def summarize(summary: str, turns: list) -> str:
+    """Fold chat turns into a conversation's running summary."""
+    with limiter, tracing.span("summarize"):
+        return summary_chain.invoke(
+            {
+                "summary": summary or "(none)",
+                "turns": "\n".join(f"User: {q}\nWeaver: {a}" for q, a in turns),
+            }
+        )
+
+
+conversations = ConversationStore(
+    summarize,
+    window_turns=config_conversation["window_turns"],
+    max_history_tokens=config_conversation["max_history_tokens"],
+    summary_tokens=config_conversation["summary_tokens"],
+    chars_per_token=config["llm"]["context"]["chars_per_token"],
+    max_sessions=config_conversation["max_sessions"],
+    ttl=config_conversation["ttl"],
+    fold_workers=config_conversation["fold_workers"],
+)
+
+# Metrics and per-request traces
+tracing.configure(**config["metrics"])
+tracing.watch_cache("answer", lambda: (answer_cache.hits, answer_cache.misses))
+tracing.watch_cache("embedding", lambda: (embedding_model.hits, embedding_model.misses))
+tracing.LIMITER_REQUESTS.labels(state="in_flight").set_function(
+    lambda: limiter.in_flight
+)
+tracing.LIMITER_REQUESTS.labels(state="waiting").set_function(lambda: limiter.waiting)
+
+
+@app.before_request
+def start_trace():
+    """Trace every API request but metric scrapes."""
+    if request.url_rule and request.url_rule.rule != "/metrics":
+        g.trace = tracing.RequestTrace(request.url_rule.rule)
+
+
+@app.after_request
+def finish_trace(response):
+    """Record the request once its response, streamed or not, is closed."""
+    trace = g.pop("trace", None)
+    if trace:
+        response.call_on_close(lambda: trace.finish(response.status_code))
+    return response
+
+
+@app.errorhandler(ServerBusy)
+def server_busy(e):
+    """Reject requests the limiter couldn't admit."""
+    return jsonify({"error": str(e)}), e.status, {"Retry-After": "1"}
 
 
 def format_result(result):
@@ -73,15 +214,309 @@ def query():
     input_text = data.get("input")
     if not input_text:
         return jsonify({"error": "Missing 'input' in request"}), 400
+    session_id = data.get("session_id")
+    chat_history = conversations.history(session_id) if session_id else []
+
+    # Cached answers were given without history, so only match first questions.
+    cached_result = None
+    cache_version = answer_cache.version()
+    if not chat_history:
+        with tracing.span("answer_cache"):
+            cached_result = answer_cache.get(input_text)
+    if cached_result:
+        if session_id:
+            conversations.add_turn(session_id, input_text, cached_result["answer"])
+        return jsonify({"response": {**cached_result, "input": input_text}})
 
     # Run the chain
+    with tracing.span("queue"):
+        limiter.acquire()
     try:
-        result = rag_chain.invoke({"input": input_text})
+        result = rag_chain.invoke(
+            {"input": input_text, "chat_history": chat_history},
+            config={"callbacks": [tracing.LLMMetricsHandler()]},
+        )
         formatted_result = format_result(result)
+        if not chat_history:
+            answer_cache.put(input_text, formatted_result, cache_version)
+        if session_id:
+            conversations.add_turn(session_id, input_text, formatted_result["answer"])
         return jsonify({"response": formatted_result})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    finally:
+        limiter.release()
+
+
+@app.route("/query/stream", methods=["POST"])
+def query_stream():
+    """Endpoint for querying the LLM, streaming the answer as NDJSON."""
+    data = request.json
+    input_text = data.get("input")
+    if not input_text:
+        return jsonify({"error": "Missing 'input' in request"}), 400
+    session_id = data.get("session_id")
+    chat_history = conversations.history(session_id) if session_id else []
+
+    cached_result = None
+    cache_version = answer_cache.version()
+    if not chat_history:
+        with tracing.span("answer_cache"):
+            cached_result = answer_cache.get(input_text)
+    if cached_result:
+        if session_id:
+            conversations.add_turn(session_id, input_text, cached_result["answer"])
+        lines = [
+            json.dumps({"context": cached_result["context"]}),
+            json.dumps({"answer": cached_result["answer"]}),
+        ]
+        return Response("\n".join(lines) + "\n", mimetype="application/x-ndjson")
+
+    # Hold the slot until the response, streamed or aborted, is closed.
+    with tracing.span("queue"):
+        limiter.acquire()
+    trace = g.get("trace")
+
+    def generate():
+        result = {"input": input_text, "context": [], "answer": ""}
+        try:
+            for chunk in rag_chain.stream(
+                {"input": input_text, "chat_history": chat_history},
+                config={"callbacks": [tracing.LLMMetricsHandler()]},
+            ):
+                if "context" in chunk:
+                    result["context"] = [doc.metadata for doc in chunk["context"]]
+                    yield json.dumps({"context": result["context"]}) + "\n"
+                elif chunk.get("answer"):
+                    result["answer"] += chunk["answer"]
+                    yield json.dumps({"answer": chunk["answer"]}) + "\n"
+            if not chat_history:
+                answer_cache.put(input_text, result, cache_version)
+            if session_id:
+                conversations.add_turn(session_id, input_text, result["answer"])
+        except Exception as e:
+            if trace:
+                trace.attrs["error"] = str(e)
+            yield json.dumps({"error": str(e)}) + "\n"
+
+    response = Response(
+        stream_with_context(generate()), mimetype="application/x-ndjson"
+    )
+    response.call_on_close(limiter.release)
+    return response
+
+
+@app.route("/search", methods=["POST"])
+def search():
+    """Endpoint searching the index for the chunks matching an input."""
+    data = request.json
+    input_text = data.get("input")
+    if not input_text:
+        return jsonify({"error": "Missing 'input' in request"}), 400
+
+    try:
+        docs = retrieval.search(input_text, data.get("source_type"), data.get("k"))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify(
+        {
+            "results": [
+                {"id": doc.id, "content": doc.page_content, "metadata": doc.metadata}
+                for doc in docs
+            ]
+        }
+    )
+
+
+@app.route("/index/reload", methods=["POST"])
+def reload_index():
+    """Endpoint switching to the published index build now, not on the next search."""
+    try:
+        index_dir = retrieval.index_dir
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"index_dir": index_dir})
+
+
+@app.route("/query/batch", methods=["POST"])
+def query_batch():
+    """Endpoint answering a list of questions, in order or streamed as NDJSON."""
+    data = request.json
+    inputs = data.get("inputs")
+    if not inputs or not isinstance(inputs, list):
+        return jsonify({"error": "Missing 'inputs' list in request"}), 400
+    if not all(isinstance(input_text, str) and input_text for input_text in inputs):
+        return jsonify({"error": "Every input must be a non-empty string"}), 400
+    if len(inputs) > config_batch["max_inputs"]:
+        return (
+            jsonify(
+                {"error": f"At most {config_batch['max_inputs']} inputs per batch"}
+            ),
+            413,
+        )
+
+    try:
+        # Embed every question in one call; the caches and retriever reuse them.
+        with tracing.span("embed"):
+            embedding_model.embed_documents(inputs)
+        outcomes = {}
+        cache_version = answer_cache.version()
+        with tracing.span("answer_cache"):
+            for i, input_text in enumerate(inputs):
+                cached_result = answer_cache.get(input_text)
+                if cached_result:
+                    outcomes[i] = {"response": {**cached_result, "input": input_text}}
+        pending = [i for i in range(len(inputs)) if i not in outcomes]
+        contexts = context_retriever.batch_search([inputs[i] for i in pending])
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    def answer(i, context):
+        with limiter:
+            answer_text = question_answer_chain.invoke(
+                {"input": inputs[i], "context": context},
+                config={"callbacks": [tracing.LLMMetricsHandler()]},
+            )
+        result = format_result(
+            {"input": inputs[i], "context": context, "answer": answer_text}
+        )
+        answer_cache.put(inputs[i], result, cache_version)
+        return result
+
+    def generate_outcomes():
+        """Yield ``(index, outcome)`` pairs, cache hits first, then as answered."""
+        yield from outcomes.items()
+        pool = ThreadPoolExecutor(config_batch["max_concurrency"])
+        try:
+            futures = {
+                pool.submit(contextvars.copy_context().run, answer, i, context): i
+                for i, context in zip(pending, contexts)
+            }
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], {"response": future.result()}
+                except Exception as e:
+                    yield futures[future], {"error": str(e)}
+        finally:
+            # Stop answering if the client went away mid-stream.
+            pool.shutdown(cancel_futures=True)
+
+    if data.get("stream"):
+        lines = (
+            json.dumps({"index": i, **outcome}) + "\n"
+            for i, outcome in generate_outcomes()
+        )
+        return Response(stream_with_context(lines), mimetype="application/x-ndjson")
+
+    responses = [None] * len(inputs)
+    for i, outcome in generate_outcomes():
+        responses[i] = outcome
+    return jsonify({"responses": responses})
+
+
+def generate_and_run_sql(store: TableStore, input_text: str, schema: str) -> tuple:
+    """Have the model write a query for a question and run it.
+
+    A failing query is sent back to the model with its error, up to
+    ``sql_retries`` times.
+
+    Returns:
+        tuple: The SQL and its result (see ``TableStore.query``).
+    """
+    question = input_text
+    for attempt in range(config_tables["sql_retries"] + 1):
+        with tracing.span("sql_generate"):
+            sql = extract_sql(sql_chain.invoke({"input": question, "schema": schema}))
+        try:
+            with tracing.span("sql_execute"):
+                return sql, store.query(
+                    sql, config_tables["max_rows"], config_tables["timeout"]
+                )
+        except sqlite3.Error as e:
+            if attempt == config_tables["sql_retries"]:
+                raise ValueError(f"Query failed: {e}\n{sql}") from e
+            question = f"{input_text}\n\nThis query failed with `{e}`, fix it:\n{sql}"
+
+
+@app.route("/query/table", methods=["POST"])
+def query_table():
+    """Endpoint answering a question about the tabular sources with SQL."""
+    data = request.json
+    input_text = data.get("input")
+    if not input_text:
+        return jsonify({"error": "Missing 'input' in request"}), 400
+
+    try:
+        tables_path = os.path.join(retrieval.index_dir, TABLE_STORE_FILE)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    if not os.path.isfile(tables_path):
+        return jsonify({"error": "No tables are indexed"}), 404
+
+    with tracing.span("queue"):
+        limiter.acquire()
+    try:
+        with closing(TableStore(tables_path, readonly=True)) as store:
+            tables = store.select_tables(
+                input_text, data.get("tables"), config_tables["max_tables"]
+            )
+            if not tables:
+                return jsonify({"error": "No matching tables"}), 404
+            schema = store.describe(tables, config_tables["sample_rows"])
+            sql, table = generate_and_run_sql(store, input_text, schema)
+
+        # The result table is the whole context, so the answer is grounded in it.
+        lines = [format_row(table["columns"]), *map(format_row, table["rows"])]
+        if table["truncated"]:
+            lines.append(f"(first {config_tables['max_rows']} rows only)")
+        context = [
+            Document(
+                page_content=f"Result of `{sql}`:\n" + "\n".join(lines),
+                metadata={"source": tables[0]["source"], "sql": sql},
+            )
+        ]
+        answer_text = question_answer_chain.invoke(
+            {"input": input_text, "context": context},
+            config={"callbacks": [tracing.LLMMetricsHandler()]},
+        )
+        return jsonify(
+            {
+                "response": {
+                    **format_result(
+                        {"input": input_text, "context": context, "answer": answer_text}
+                    ),
+                    "sql": sql,
+                    **table,
+                }
+            }
+        )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    finally:
+        limiter.release()
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    """Endpoint exposing the API's metrics in the Prometheus text format."""
+    return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
 
 
 if __name__ == "__main__":
-    app.run(host=config["llm"]["host"], port=config["llm"]["port"])
+    if config_serving["server"] == "waitress":
+        from waitress import serve
+
+        # Waitress queues requests beyond its threads before the limiter sees
+        # them, so too few threads would make the 429 and 503 paths unreachable.
+        threads = max(
+            config_serving["threads"],
+            config_serving["max_in_flight"] + config_serving["max_queued"] + 1,
+        )
+        serve(
+            app,
+            host=config["llm"]["host"],
+            port=config["llm"]["port"],
+            threads=threads,
+        )
+    else:
+        app.run(host=config["llm"]["host"], port=config["llm"]["port"], threaded=True)
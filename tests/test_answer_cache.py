@@ -0,0 +1,85 @@
+"""AnswerCache: exact and near-duplicate hits, expiry and index invalidation."""
+
+import os
+import re
+import time
+import pytest
+from langchain_core.embeddings import Embeddings
+from utils.answer_cache import AnswerCache
+
+RESULT = {"answer": "Qapla'", "context": []}
+
+
+class WordEmbeddings(Embeddings):
+    """One dimension per known word, so similar questions have similar vectors."""
+
+    WORDS = ["klingon", "dictionary", "verbs", "weather", "today", "the", "about"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        words = re.findall(r"\w+", text.lower())
+        return [float(words.count(word)) for word in self.WORDS] + [0.01]
+
+
+@pytest.fixture
+def version_path(tmp_path):
+    path = tmp_path / "index_version"
+    path.write_text("v1", encoding="utf-8")
+    return str(path)
+
+
+def make_cache(version_path, **kwargs):
+    options = dict(similarity_threshold=0.95, ttl=60, max_entries=10)
+    return AnswerCache(WordEmbeddings(), version_path, **{**options, **kwargs})
+
+
+def publish(version_path):
+    """Rewrite the version file, as setup_chroma_db.py does on a new build."""
+    stat = os.stat(version_path)
+    with open(version_path, "w", encoding="utf-8") as file:
+        file.write("v2")
+    os.utime(version_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+
+
+def test_exact_and_near_duplicate_hits(version_path):
+    cache = make_cache(version_path)
+    cache.put("What is the Klingon dictionary about?", RESULT, cache.version())
+
+    assert cache.get("what is the klingon dictionary about") == RESULT
+    assert cache.get("The Klingon dictionary: what is it about?") == RESULT
+    assert cache.get("What is the weather today?") is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_new_index_clears_the_cache(version_path):
+    cache = make_cache(version_path)
+    cache.put("Klingon verbs?", RESULT, cache.version())
+
+    publish(version_path)
+
+    assert cache.get("Klingon verbs?") is None
+
+
+def test_answer_from_previous_index_is_not_cached(version_path):
+    cache = make_cache(version_path)
+    version = cache.version()
+    # A new build is published while the answer is being generated.
+    publish(version_path)
+    cache.put("Klingon verbs?", RESULT, version)
+
+    assert cache.get("Klingon verbs?") is None
+    cache.put("Klingon verbs?", RESULT, cache.version())
+    assert cache.get("Klingon verbs?") == RESULT
+
+
+def test_entries_expire_and_are_evicted(version_path):
+    cache = make_cache(version_path, ttl=0.05, max_entries=2)
+    for question in ["klingon", "verbs", "weather"]:
+        cache.put(question, {**RESULT, "input": question}, cache.version())
+
+    assert cache.get("klingon") is None
+    assert cache.get("weather")["input"] == "weather"
+    time.sleep(0.1)
+    assert cache.get("weather") is None
@@ -0,0 +1,93 @@
+"""Context assembly: merging overlapping chunks, reranking and packing."""
+
+from langchain_core.documents import Document
+from utils.context_assembly import (
+    ContextAssemblyRetriever,
+    merge_overlapping,
+    pack,
+    rerank,
+)
+
+TEXT = (
+    "Klingon is the constructed language spoken by the Klingons in Star Trek. "
+    "It was designed by Marc Okrand, who also wrote The Klingon Dictionary. "
+    "Its verbs take prefixes marking both the subject and the object."
+)
+
+
+def chunk(start, stop, source="/docs/klingon.txt"):
+    return Document(page_content=TEXT[start:stop], metadata={"source": source})
+
+
+class ListRetriever:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def search(self, query, k=None):  # pylint: disable=W0613
+        return self.docs[:k]
+
+    def batch_search(self, queries, k=None):
+        return [self.search(query, k) for query in queries]
+
+
+def test_neighbouring_chunks_are_merged_without_their_overlap():
+    # Chunks of 100 characters overlapping by 40, retrieved out of order.
+    docs = [chunk(60, 160), chunk(0, 100), chunk(120, len(TEXT))]
+
+    ((merged, rank),) = merge_overlapping(docs)
+    assert merged.page_content == TEXT
+    assert rank == 0
+
+
+def test_contained_and_duplicate_chunks_are_dropped():
+    docs = [
+        chunk(0, 100),
+        chunk(10, 60),
+        chunk(0, 100, source="/docs/copy.txt"),
+        chunk(150, len(TEXT), source="/docs/other.txt"),
+    ]
+
+    merged = merge_overlapping(docs)
+    assert [(doc.page_content, rank) for doc, rank in merged] == [
+        (TEXT[:100], 0),
+        (TEXT[150:], 3),
+    ]
+
+
+def test_chunks_of_other_sources_are_not_joined():
+    docs = [chunk(0, 100), chunk(60, 160, source="/docs/other.txt")]
+
+    assert len(merge_overlapping(docs)) == 2
+
+
+def test_rerank_weighs_query_terms_against_retrieval_rank():
+    candidates = [
+        (Document(page_content="Star Trek episodes and their air dates"), 0),
+        (Document(page_content="The Klingon Dictionary by Marc Okrand"), 1),
+    ]
+    query = "Who wrote the Klingon Dictionary?"
+
+    assert rerank(query, candidates, 1.0)[0].page_content.startswith("The Klingon")
+    assert rerank(query, candidates, 0.0)[0].page_content.startswith("Star Trek")
+
+
+def test_pack_fits_the_budget_and_truncates_a_single_large_document():
+    docs = [Document(page_content="x" * 30), Document(page_content="y" * 10)]
+
+    assert [doc.page_content for doc in pack(docs, 4, 4.0)] == ["y" * 10]
+    assert [doc.page_content for doc in pack(docs, 12, 4.0)] == ["x" * 30, "y" * 10]
+
+    (truncated,) = pack([Document(page_content=TEXT)], 5, 4.0)
+    assert TEXT.startswith(truncated.page_content)
+    assert len(truncated.page_content) <= 20
+
+
+def test_retriever_assembles_the_context_of_each_question():
+    docs = [chunk(0, 100), chunk(60, 160), chunk(120, len(TEXT))]
+    retriever = ContextAssemblyRetriever(
+        retriever=ListRetriever(docs), candidates=2, max_tokens=1024
+    )
+
+    (context,) = retriever.invoke("Who designed Klingon?")
+    assert context.page_content == TEXT[:160]
+    assert retriever.batch_search(["Who designed Klingon?"]) == [[context]]
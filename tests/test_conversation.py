@@ -0,0 +1,101 @@
+"""ConversationStore keeps the replayed history within its token budget."""
+
+import time
+import threading
+import pytest
+from utils.conversation import ConversationStore
+
+
+def history_chars(store, session_id) -> int:
+    return sum(len(message.content) for message in store.history(session_id))
+
+
+def wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def folds():
+    """A summarize function that blocks until released, recording its calls."""
+    release = threading.Event()
+    calls = []
+
+    def summarize(summary, turns):
+        calls.append(len(turns))
+        release.wait(10)
+        return f"{summary} {len(turns)} turns".strip()
+
+    summarize.release = release
+    summarize.calls = calls
+    yield summarize
+    release.set()
+
+
+def make_store(summarize, **kwargs):
+    options = dict(
+        window_turns=2,
+        max_history_tokens=100,
+        summary_tokens=25,
+        chars_per_token=4,
+        max_sessions=10,
+        ttl=60,
+    )
+    return ConversationStore(summarize, **{**options, **kwargs})
+
+
+def test_history_stays_within_budget_while_folding(folds):
+    store = make_store(folds)
+    for i in range(20):
+        store.add_turn("chat", f"question {i} " * 3, f"answer {i} " * 5)
+
+    # The first fold is still running: later turns wait for the next one.
+    wait_for(lambda: folds.calls)
+    assert folds.calls == [1]
+    assert history_chars(store, "chat") <= store.max_history_chars
+    assert store.history("chat")[-1].content == "answer 19 " * 5
+
+    folds.release.set()
+    store._pool.shutdown(wait=True)  # pylint: disable=W0212
+    # The turns added during the first fold were folded together.
+    assert folds.calls == [1, 17]
+    history = store.history("chat")
+    assert history[0].content.endswith("1 turns 17 turns")
+    assert len(history) == 1 + 2 * store.window_turns
+
+
+def test_oversized_turn_is_truncated():
+    store = make_store(lambda summary, turns: summary)
+    store.add_turn("chat", "why? " * 100, "because " * 1000)
+
+    question, answer = store.history("chat")
+    budget = store.max_history_chars - store.max_summary_chars
+    assert len(question.content) + len(answer.content) <= budget
+    assert len(question.content) <= budget // 2
+    assert answer.content.startswith("because ")
+
+
+def test_sessions_fold_independently(folds):
+    store = make_store(folds, fold_workers=2)
+    for i in range(3):
+        store.add_turn("first", f"question {i}", f"answer {i}")
+        store.add_turn("second", f"question {i}", f"answer {i}")
+
+    # Each session has one fold running; neither waits on the other.
+    wait_for(lambda: len(folds.calls) == 2)
+    assert folds.calls == [1, 1]
+
+
+def test_failed_summary_keeps_latest_turns():
+    def summarize(summary, turns):
+        raise ConnectionError("model server unavailable")
+
+    store = make_store(summarize)
+    for i in range(10):
+        store.add_turn("chat", f"question {i}", f"answer {i}")
+    store._pool.shutdown(wait=True)  # pylint: disable=W0212
+
+    summary = store.history("chat")[0].content
+    assert "answer 7" in summary
+    assert len(summary) <= len("Summary of the earlier conversation: ") + 100
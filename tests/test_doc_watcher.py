@@ -0,0 +1,69 @@
+"""DirectoryWatcher: debounced batches, merging and ignored files."""
+
+import os
+import time
+import threading
+import pytest
+from utils.doc_watcher import DirectoryWatcher
+
+POLL = 0.02
+DEBOUNCE = 0.1
+
+
+@pytest.fixture
+def watcher(tmp_path):
+    (tmp_path / "old.txt").write_text("old", encoding="utf-8")
+    watcher = DirectoryWatcher(
+        str(tmp_path), poll_interval=POLL, debounce=DEBOUNCE, max_batches=1
+    )
+    watcher.start()
+    yield watcher
+    watcher.stop()
+
+
+def next_batch(watcher, timeout=2.0) -> set:
+    """Return the next batch, or an empty set if none comes in time."""
+    timer = threading.Timer(timeout, watcher.stop)
+    timer.start()
+    try:
+        return next(watcher.batches(), set())
+    finally:
+        timer.cancel()
+
+
+def test_burst_of_changes_is_one_batch(watcher, tmp_path):
+    for i in range(3):
+        (tmp_path / f"new{i}.txt").write_text("new", encoding="utf-8")
+        time.sleep(DEBOUNCE / 4)
+    os.remove(tmp_path / "old.txt")
+
+    assert next_batch(watcher) == {
+        str(tmp_path / "new0.txt"),
+        str(tmp_path / "new1.txt"),
+        str(tmp_path / "new2.txt"),
+        str(tmp_path / "old.txt"),
+    }
+
+
+def test_hidden_and_lock_files_are_ignored(watcher, tmp_path):
+    (tmp_path / ".old.txt.swp").write_text("swap", encoding="utf-8")
+    (tmp_path / "~$report.docx").write_text("lock", encoding="utf-8")
+    (tmp_path / "old.txt").write_text("edited", encoding="utf-8")
+
+    assert next_batch(watcher) == {str(tmp_path / "old.txt")}
+
+
+def test_batches_waiting_on_a_slow_consumer_are_merged(watcher, tmp_path):
+    (tmp_path / "first.txt").write_text("1", encoding="utf-8")
+    time.sleep(DEBOUNCE * 3)
+    # The queue holds one batch; later changes are merged into the next one.
+    (tmp_path / "second.txt").write_text("2", encoding="utf-8")
+    time.sleep(DEBOUNCE * 3)
+    (tmp_path / "third.txt").write_text("3", encoding="utf-8")
+    time.sleep(DEBOUNCE * 3)
+
+    assert next_batch(watcher) == {str(tmp_path / "first.txt")}
+    assert next_batch(watcher) == {
+        str(tmp_path / "second.txt"),
+        str(tmp_path / "third.txt"),
+    }
@@ -0,0 +1,86 @@
+"""The loader registry: type detection, parts and per-page PDF loading."""
+
+import zipfile
+import pytest
+from pypdf import PdfWriter
+from langchain_core.documents import Document
+from utils import document_loaders
+from utils.document_loaders import (
+    DOCX,
+    get_mime_type,
+    get_parts,
+    load_document,
+    register_loader,
+)
+
+
+@pytest.fixture
+def pdf(tmp_path):
+    path = tmp_path / "manual.pdf"
+    writer = PdfWriter()
+    for _ in range(5):
+        writer.add_blank_page(width=200, height=200)
+    with open(path, "wb") as file:
+        writer.write(file)
+    return str(path)
+
+
+def test_type_from_extension_or_content(tmp_path, pdf):
+    notes = tmp_path / "NOTES"
+    notes.write_text("plain text, no extension", encoding="utf-8")
+    blob = tmp_path / "blob"
+    blob.write_bytes(b"\0\1\2binary")
+    document = tmp_path / "report"
+    with zipfile.ZipFile(document, "w") as archive:
+        archive.writestr("word/document.xml", "<w:document/>")
+
+    assert get_mime_type(pdf) == "application/pdf"
+    assert get_mime_type(str(notes)) == "text/plain"
+    assert get_mime_type(str(document)) == DOCX
+    assert get_mime_type(str(blob)) is None
+
+
+def test_unsupported_files_have_no_parts(tmp_path):
+    blob = tmp_path / "blob"
+    blob.write_bytes(b"\0\1\2binary")
+
+    assert get_parts(str(blob)) == []
+    with pytest.raises(ValueError):
+        list(load_document(str(blob)))
+
+
+def test_text_like_types_load_as_text(tmp_path):
+    script = tmp_path / "job.py"
+    script.write_text("print('hello')", encoding="utf-8")
+
+    assert get_parts(str(script)) == [None]
+    (doc,) = load_document(str(script))
+    assert doc.page_content == "print('hello')"
+    assert doc.metadata == {"source": str(script)}
+
+
+def test_pdf_is_loaded_in_page_ranges(pdf):
+    parts = get_parts(pdf, part_size=2)
+    assert parts == [(0, 2), (2, 4), (4, 5)]
+
+    pages = [doc for part in parts for doc in load_document(pdf, part)]
+    assert [doc.metadata["page"] for doc in pages] == [0, 1, 2, 3, 4]
+    assert [doc.metadata["page_label"] for doc in pages] == ["1", "2", "3", "4", "5"]
+    assert {doc.metadata["total_pages"] for doc in pages} == {5}
+    assert {doc.metadata["source"] for doc in pages} == {pdf}
+
+
+def test_registered_loader_is_used(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_loaders, "_loaders", dict(document_loaders._loaders))
+    monkeypatch.setattr(
+        document_loaders, "_extensions", dict(document_loaders._extensions)
+    )
+
+    @register_loader("application/x-shout", extensions=(".shout",))
+    def load_shout(file_path, part=None):
+        with open(file_path, encoding="utf-8") as file:
+            yield Document(page_content=file.read().upper())
+
+    path = tmp_path / "greeting.shout"
+    path.write_text("hello", encoding="utf-8")
+    assert [doc.page_content for doc in load_document(str(path))] == ["HELLO"]
@@ -0,0 +1,90 @@
+"""CachedEmbeddings: hits, shared entries, size accounting and eviction."""
+
+import pytest
+from langchain_core.embeddings import Embeddings
+from utils.embedding_cache import CachedEmbeddings
+
+DIM = 16
+# Vectors are stored as float64.
+VECTOR_BYTES = DIM * 8
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded += texts
+        return [[float(len(text))] * DIM for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "cache.sqlite3")
+
+
+def cache(path, model_id="model", max_size_mb=1.0):
+    return CachedEmbeddings(CountingEmbeddings(), model_id, path, max_size_mb)
+
+
+def stored_bytes(embeddings) -> tuple:
+    """The running total, and the actual size of the stored vectors."""
+    conn = embeddings._conn  # pylint: disable=W0212
+    (total,) = conn.execute("SELECT bytes FROM embeddings_size").fetchone()
+    (actual,) = conn.execute(
+        "SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+    ).fetchone()
+    return total, actual
+
+
+def test_only_missing_texts_are_embedded(path):
+    embeddings = cache(path)
+    embeddings.embed_documents(["a", "bb"])
+    assert embeddings.embed_documents(["bb", "ccc", "a"]) == [
+        [2.0] * DIM,
+        [3.0] * DIM,
+        [1.0] * DIM,
+    ]
+    assert embeddings.embedding.embedded == ["a", "bb", "ccc"]
+    assert (embeddings.hits, embeddings.misses) == (2, 3)
+
+
+def test_entries_are_shared_per_model(path):
+    cache(path).embed_query("a")
+
+    same_model = cache(path)
+    same_model.embed_query("a")
+    other_model = cache(path, model_id="other")
+    other_model.embed_query("a")
+
+    assert same_model.embedding.embedded == []
+    assert other_model.embedding.embedded == ["a"]
+
+
+def test_size_is_tracked_across_connections(path):
+    first, second = cache(path), cache(path)
+    first.embed_documents([f"first {i}" for i in range(10)])
+    second.embed_documents([f"second {i}" for i in range(5)])
+    # Stored again under the same key: replaced, not counted twice.
+    first._store({first._hash("first 0"): [0.0] * DIM})  # pylint: disable=W0212
+
+    assert stored_bytes(first) == (15 * VECTOR_BYTES, 15 * VECTOR_BYTES)
+
+
+def test_least_recently_used_entries_are_evicted(path):
+    max_size_mb = 10 * VECTOR_BYTES / 1024 / 1024
+    embeddings = cache(path, max_size_mb=max_size_mb)
+    embeddings.embed_documents([f"old {i}" for i in range(9)])
+    embeddings.embed_query("old 0")  # Now the most recently used.
+    embeddings.embed_documents(["new 0", "new 1"])
+
+    total, actual = stored_bytes(embeddings)
+    assert total == actual <= 9 * VECTOR_BYTES
+    embeddings.embedding.embedded.clear()
+    embeddings.embed_documents(["old 0", "new 0", "new 1"])
+    assert embeddings.embedding.embedded == []
+    embeddings.embed_query("old 1")
+    assert embeddings.embedding.embedded == ["old 1"]
@@ -0,0 +1,121 @@
+"""KeywordIndex BM25 search, and HybridRetriever in each mode."""
+
+import re
+import zlib
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from utils.keyword_index import KeywordIndex
+from utils.quantized_index import QuantizedIndex, QuantizedIndexWriter
+from utils.hybrid_retriever import HybridRetriever, reciprocal_rank_fusion
+
+CHUNKS = {
+    "klingon": ("txt", "The Klingon word Qapla' means success."),
+    "verbs": ("txt", "Klingon verbs take prefixes for subject and object."),
+    "chile": ("csv", "customer_id 4512 lives in Santiago, Chile."),
+    "weather": ("txt", "Tomorrow the weather in Santiago will be sunny."),
+}
+
+
+class WordEmbeddings(Embeddings):
+    """Hashes each word to a dimension, so texts sharing words are similar."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self.calls += 1
+        return self._embed(text)
+
+    def _embed(self, text):
+        vector = [0.0] * 32
+        for word in re.findall(r"\w+", text.lower()):
+            vector[zlib.crc32(word.encode()) % 32] += 1.0
+        return vector
+
+
+@pytest.fixture
+def keyword_index(tmp_path):
+    index = KeywordIndex(str(tmp_path / "keyword_index.sqlite3"))
+    index.add(
+        list(CHUNKS),
+        [
+            Document(page_content=text, metadata={"source_type": source_type})
+            for source_type, text in CHUNKS.values()
+        ],
+    )
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def retriever(tmp_path, keyword_index):
+    embeddings = WordEmbeddings()
+    writer = QuantizedIndexWriter(str(tmp_path / "vectors"))
+    writer.upsert(
+        ids=list(CHUNKS),
+        embeddings=embeddings.embed_documents([text for _, text in CHUNKS.values()]),
+        metadatas=[{"source_type": source_type} for source_type, _ in CHUNKS.values()],
+    )
+    writer.finalize()
+    embeddings.calls = 0
+    vectorstore = QuantizedIndex(str(tmp_path / "vectors"), embeddings)
+    return HybridRetriever(
+        vectorstore=vectorstore, keyword_index=keyword_index, k=2, fetch_k=4
+    )
+
+
+def test_exact_terms_are_found_by_bm25(keyword_index):
+    assert [doc.id for doc in keyword_index.search("4512", k=4)] == ["chile"]
+    assert [doc.id for doc in keyword_index.search("Qapla'", k=4)][0] == "klingon"
+    assert keyword_index.search("  ?! ", k=4) == []
+
+
+def test_keyword_search_filters_and_forgets_deleted_chunks(keyword_index):
+    assert [doc.id for doc in keyword_index.search("Santiago", source_type="csv")] == [
+        "chile"
+    ]
+    keyword_index.delete(["chile"])
+    assert [doc.id for doc in keyword_index.search("Santiago")] == ["weather"]
+    assert [doc.id for doc in keyword_index.get(["weather", "chile", "klingon"])] == [
+        "weather",
+        "klingon",
+    ]
+
+
+def test_reciprocal_rank_fusion_favours_documents_in_both_lists():
+    a, b, c = (Document(id=i, page_content=i) for i in "abc")
+
+    fused = reciprocal_rank_fusion([[a, b], [c, b]], k=3)
+    assert [doc.id for doc in fused] == ["b", "a", "c"]
+
+
+def test_keyword_mode_never_embeds(retriever):
+    retriever.mode = "keyword"
+
+    docs = retriever.search("customer 4512")
+    assert [doc.id for doc in docs] == ["chile"]
+    assert retriever.vectorstore.embeddings.calls == 0
+
+
+@pytest.mark.parametrize("mode", ["vector", "hybrid"])
+def test_vector_and_hybrid_modes(retriever, mode):
+    retriever.mode = mode
+
+    docs = retriever.search("Klingon verbs take prefixes")
+    assert docs[0].id == "verbs"
+    assert docs[0].page_content == CHUNKS["verbs"][1]
+    assert retriever.vectorstore.embeddings.calls == 1
+    assert [doc.id for doc in retriever.search("Santiago", source_type="csv")] == [
+        "chile"
+    ]
+
+
+def test_batch_search_embeds_once(retriever):
+    results = retriever.batch_search(["Qapla' success", "sunny weather tomorrow"])
+    assert [docs[0].id for docs in results] == ["klingon", "weather"]
+    assert retriever.vectorstore.embeddings.calls == 1
@@ -0,0 +1,65 @@
+"""Resuming an interrupted QuantizedIndexWriter build."""
+
+import os
+import json
+import numpy as np
+from utils.quantized_index import QuantizedIndexWriter
+
+
+def vector(seed: int) -> list:
+    return list(np.random.default_rng(seed).normal(size=8))
+
+
+def upsert(writer, *ids):
+    writer.upsert(
+        ids=list(ids),
+        embeddings=[vector(ord(i)) for i in ids],
+        metadatas=[{"source_type": "txt"}] * len(ids),
+    )
+
+
+def stored(path, ids="abcd") -> list:
+    return QuantizedIndexWriter(path).get(ids=list(ids))["ids"]
+
+
+def test_resume_replays_additions_and_deletions(tmp_path):
+    path = str(tmp_path)
+    writer = QuantizedIndexWriter(path)
+    upsert(writer, "a", "b")
+    writer.finalize()
+    writer.delete(["a"])
+    upsert(writer, "c")
+
+    resumed = QuantizedIndexWriter(path)
+    assert resumed.get(ids=list("abcd"))["ids"] == ["b", "c"]
+    resumed.finalize()
+    assert stored(path) == ["b", "c"]
+
+
+def test_resume_keeps_chunk_added_again_after_deletion(tmp_path):
+    path = str(tmp_path)
+    writer = QuantizedIndexWriter(path)
+    upsert(writer, "a", "b")
+    writer.finalize()
+    writer.delete(["a", "b"])
+    upsert(writer, "a")
+    upsert(writer, "c")
+    writer.delete(["c"])
+
+    resumed = QuantizedIndexWriter(path)
+    assert resumed.get(ids=list("abcd"))["ids"] == ["a"]
+    resumed.finalize()
+    assert stored(path) == ["a"]
+
+
+def test_resume_drops_addition_without_its_vector(tmp_path):
+    path = str(tmp_path)
+    writer = QuantizedIndexWriter(path)
+    upsert(writer, "a", "b")
+    # An interrupted upsert: the log line was written, not the vector.
+    with open(os.path.join(path, "pending.jsonl"), "a", encoding="utf-8") as file:
+        file.write(json.dumps(["c", "txt"]) + "\n")
+
+    resumed = QuantizedIndexWriter(path)
+    resumed.finalize()
+    assert stored(path) == ["a", "b"]
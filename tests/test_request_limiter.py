@@ -0,0 +1,78 @@
+"""RequestLimiter: slots, the wait queue, and 429/503 rejections."""
+
+import threading
+import time
+import pytest
+from utils.request_limiter import RequestLimiter, ServerBusy
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.005)
+
+
+def start_waiter(limiter, results):
+    """Acquire a slot in a thread, recording whether it was admitted."""
+
+    def wait():
+        try:
+            with limiter:
+                results.append("admitted")
+        except ServerBusy as e:
+            results.append(e.status)
+
+    thread = threading.Thread(target=wait)
+    thread.start()
+    return thread
+
+
+def test_slots_are_counted_and_released():
+    limiter = RequestLimiter(max_in_flight=2, max_queued=0, queue_timeout=1)
+    with limiter:
+        with limiter:
+            assert limiter.in_flight == 2
+        assert limiter.in_flight == 1
+    assert (limiter.in_flight, limiter.waiting) == (0, 0)
+
+
+def test_full_queue_is_rejected_with_429():
+    limiter = RequestLimiter(max_in_flight=1, max_queued=1, queue_timeout=5)
+    limiter.acquire()
+    results = []
+    waiter = start_waiter(limiter, results)
+    wait_until(lambda: limiter.waiting == 1)
+
+    with pytest.raises(ServerBusy) as excinfo:
+        limiter.acquire()
+    assert excinfo.value.status == 429
+
+    limiter.release()
+    waiter.join()
+    assert results == ["admitted"]
+    assert (limiter.in_flight, limiter.waiting) == (0, 0)
+
+
+def test_wait_timeout_is_rejected_with_503():
+    limiter = RequestLimiter(max_in_flight=1, max_queued=1, queue_timeout=0.05)
+    limiter.acquire()
+
+    with pytest.raises(ServerBusy) as excinfo:
+        limiter.acquire()
+    assert excinfo.value.status == 503
+    assert (limiter.in_flight, limiter.waiting) == (1, 0)
+    limiter.release()
+
+
+def test_queued_request_gets_the_freed_slot():
+    limiter = RequestLimiter(max_in_flight=1, max_queued=2, queue_timeout=5)
+    limiter.acquire()
+    results = []
+    waiters = [start_waiter(limiter, results) for _ in range(2)]
+    wait_until(lambda: limiter.waiting == 2)
+
+    limiter.release()
+    for waiter in waiters:
+        waiter.join()
+    assert results == ["admitted", "admitted"]
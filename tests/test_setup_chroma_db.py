@@ -0,0 +1,293 @@
+"""Incremental syncing: sync_source, flush_pending, remove_source and publishing."""
+
+import os
+import sys
+import json
+import sqlite3
+from contextlib import closing
+from unittest import mock
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from utils.keyword_index import KeywordIndex
+from utils.quantized_index import QuantizedIndexWriter
+
+# The script parses its command line on import.
+with mock.patch.object(sys, "argv", ["setup_chroma_db.py"]):
+    from utils import setup_chroma_db
+
+SOURCE = "/docs/notes.txt"
+
+
+class FakeEmbeddings(Embeddings):
+    """Records the texts it embeds, and fails on the texts in ``fail``."""
+
+    def __init__(self):
+        self.calls = []
+        self.fail = set()
+
+    def embed_documents(self, texts):
+        if self.fail & set(texts):
+            raise ConnectionError("embedding server unavailable")
+        self.calls.append(list(texts))
+        return [[float(len(text)), 1.0, 0.0, 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+@pytest.fixture
+def embedding():
+    return FakeEmbeddings()
+
+
+@pytest.fixture
+def ingestor(tmp_path, embedding):
+    keyword_index = KeywordIndex(str(tmp_path / "keywords.sqlite3"))
+    ingestor = setup_chroma_db.EmbeddingIngestor(
+        QuantizedIndexWriter(str(tmp_path / "vectors")),
+        keyword_index,
+        embedding,
+        batch_size=2,
+        max_concurrency=1,
+        max_retries=0,
+        retry_backoff=0,
+    )
+    yield ingestor
+    ingestor.close()
+    keyword_index.close()
+
+
+def chunk_id(text: str) -> str:
+    return setup_chroma_db.hash_text(f"{SOURCE}\0{setup_chroma_db.hash_text(text)}")
+
+
+def sync(ingestor, manifest, build_dir, splits, **entry):
+    """Sync the source from its splits and wait for its batches."""
+    pending = []
+    try:
+        setup_chroma_db.sync_source(
+            ingestor, manifest, pending, SOURCE, splits, **entry
+        )
+    finally:
+        setup_chroma_db.flush_pending(manifest, build_dir, pending, block=True)
+
+
+def docs(*texts):
+    return [Document(page_content=text, metadata={"source": SOURCE}) for text in texts]
+
+
+def stored_ids(ingestor, texts):
+    ids = [chunk_id(text) for text in texts]
+    return set(ingestor.collection.get(ids=ids)["ids"]) | {
+        doc.id for doc in ingestor.keyword_index.get(ids)
+    }
+
+
+def test_new_source_is_embedded_and_recorded(ingestor, embedding, tmp_path):
+    manifest = setup_chroma_db.new_manifest()
+    setup_chroma_db.save_manifest(manifest, str(tmp_path))
+    sync(ingestor, manifest, str(tmp_path), docs("a", "b", "c"), mtime=1.0)
+
+    entry = manifest["sources"][SOURCE]
+    assert entry["mtime"] == 1.0
+    assert set(entry["chunks"]) == {chunk_id(t) for t in "abc"}
+    assert stored_ids(ingestor, "abc") == {chunk_id(t) for t in "abc"}
+    assert sorted(sum(embedding.calls, [])) == ["a", "b", "c"]
+    assert setup_chroma_db.load_manifest(str(tmp_path)) == manifest
+
+
+def test_edited_source_only_embeds_new_chunks(ingestor, embedding, tmp_path):
+    manifest = setup_chroma_db.new_manifest()
+    sync(ingestor, manifest, str(tmp_path), docs("a", "b"), mtime=1.0)
+    embedding.calls.clear()
+
+    sync(ingestor, manifest, str(tmp_path), docs("a", "c"), mtime=2.0)
+
+    assert embedding.calls == [["c"]]
+    entry = manifest["sources"][SOURCE]
+    assert entry["mtime"] == 2.0
+    assert set(entry["chunks"]) == {chunk_id("a"), chunk_id("c")}
+    assert stored_ids(ingestor, "abc") == {chunk_id("a"), chunk_id("c")}
+
+
+def test_deleted_source_is_removed(ingestor, tmp_path):
+    manifest = setup_chroma_db.new_manifest()
+    setup_chroma_db.save_manifest(manifest, str(tmp_path))
+    sync(ingestor, manifest, str(tmp_path), docs("a", "b"), mtime=1.0)
+
+    setup_chroma_db.remove_source(ingestor, manifest, str(tmp_path), SOURCE)
+
+    assert SOURCE not in manifest["sources"]
+    assert not stored_ids(ingestor, "ab")
+    assert setup_chroma_db.load_manifest(str(tmp_path)) == manifest
+
+
+def test_manifest_journal_is_replayed_then_cleared(tmp_path):
+    build_dir = str(tmp_path)
+    manifest = setup_chroma_db.new_manifest()
+    setup_chroma_db.save_manifest(manifest, build_dir)
+    entry = {"mtime": 1.0, "chunks": {chunk_id("a"): "hash"}}
+    setup_chroma_db.record_manifest(build_dir, [("sources", SOURCE, entry)])
+    setup_chroma_db.record_manifest(build_dir, [("summaries", SOURCE, "summary")])
+    setup_chroma_db.record_manifest(build_dir, [("sources", "/docs/gone.txt", None)])
+    # A line cut short by an interrupted run.
+    journal_path = tmp_path / setup_chroma_db.MANIFEST_JOURNAL
+    with open(journal_path, "a", encoding="utf-8") as file:
+        file.write('["sources", "/docs/half')
+
+    manifest = setup_chroma_db.load_manifest(build_dir)
+    assert manifest["sources"] == {SOURCE: entry}
+    assert manifest["summaries"] == {SOURCE: "summary"}
+
+    setup_chroma_db.save_manifest(manifest, build_dir)
+    assert not journal_path.exists()
+    assert setup_chroma_db.load_manifest(build_dir) == manifest
+    with open(tmp_path / setup_chroma_db.MANIFEST_FILE, encoding="utf-8") as file:
+        assert json.load(file) == manifest
+
+
+def test_failed_batch_is_retried_next_sync(ingestor, embedding, tmp_path):
+    manifest = setup_chroma_db.new_manifest()
+    embedding.fail = {"b"}
+    # Batches of two: ("a", "b") fails, ("c",) is committed.
+    sync(ingestor, manifest, str(tmp_path), docs("a", "b", "c"), mtime=1.0)
+
+    entry = manifest["sources"][SOURCE]
+    assert "mtime" not in entry
+    assert set(entry["chunks"]) == {chunk_id("c")}
+    assert stored_ids(ingestor, "abc") == {chunk_id("c")}
+
+    embedding.fail = set()
+    embedding.calls.clear()
+    sync(ingestor, manifest, str(tmp_path), docs("a", "b", "c"), mtime=1.0)
+
+    assert embedding.calls == [["a", "b"]]
+    assert manifest["sources"][SOURCE]["mtime"] == 1.0
+    assert stored_ids(ingestor, "abc") == {chunk_id(t) for t in "abc"}
+
+
+def test_failing_loader_keeps_old_chunks(ingestor, tmp_path):
+    manifest = setup_chroma_db.new_manifest()
+    sync(ingestor, manifest, str(tmp_path), docs("a", "b"), mtime=1.0)
+
+    def splits():
+        yield from docs("c")
+        raise ValueError("truncated file")
+
+    with pytest.raises(ValueError):
+        sync(ingestor, manifest, str(tmp_path), splits(), mtime=2.0)
+
+    entry = manifest["sources"][SOURCE]
+    assert "mtime" not in entry
+    assert set(entry["chunks"]) == {chunk_id(t) for t in "abc"}
+    assert stored_ids(ingestor, "abc") == {chunk_id(t) for t in "abc"}
+
+
+@pytest.fixture
+def published(tmp_path, monkeypatch):
+    """A published build indexing one file of a rag_docs directory."""
+    persist_directory = tmp_path / "chroma"
+    rag_docs = tmp_path / "rag_docs"
+    rag_docs.mkdir()
+    monkeypatch.setattr(setup_chroma_db, "persist_directory", str(persist_directory))
+    monkeypatch.setattr(setup_chroma_db, "rag_docs_directory", str(rag_docs))
+    monkeypatch.setitem(setup_chroma_db.config_wiki, "queries", ["Klingon"])
+    monkeypatch.setitem(setup_chroma_db.config_summaries, "enabled", False)
+
+    notes = rag_docs / "notes.txt"
+    notes.write_text("a", encoding="utf-8")
+    build_dir = persist_directory / "builds" / "1"
+    build_dir.mkdir(parents=True)
+    manifest = setup_chroma_db.new_manifest()
+    manifest["sources"][str(notes)] = {
+        "mtime": notes.stat().st_mtime,
+        "chunks": {chunk_id("a"): setup_chroma_db.hash_text("a")},
+    }
+    setup_chroma_db.save_manifest(manifest, str(build_dir))
+    setup_chroma_db.write_pointer(str(persist_directory), str(build_dir))
+    return rag_docs
+
+
+def test_unchanged_sources_are_up_to_date(published):
+    assert setup_chroma_db.is_up_to_date(skip_wikipedia=True)
+    # Articles are only known once loaded.
+    assert not setup_chroma_db.is_up_to_date(skip_wikipedia=False)
+
+    # Files no loader handles are never indexed.
+    (published / "blob").write_bytes(b"\0\1\2binary")
+    assert setup_chroma_db.is_up_to_date(skip_wikipedia=True)
+
+
+@pytest.mark.parametrize("change", ["edit", "add", "delete"])
+def test_changed_sources_are_not_up_to_date(published, change):
+    notes = published / "notes.txt"
+    if change == "edit":
+        stat = notes.stat()
+        os.utime(notes, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    elif change == "add":
+        (published / "more.txt").write_text("b", encoding="utf-8")
+    else:
+        notes.unlink()
+
+    assert not setup_chroma_db.is_up_to_date(skip_wikipedia=True)
+
+
+def test_copied_build_links_files_replaced_whole(tmp_path):
+    source_dir = tmp_path / "1"
+    (source_dir / "quantized").mkdir(parents=True)
+    (source_dir / "manifest.json").write_text("{}", encoding="utf-8")
+    (source_dir / "quantized" / "ids.npy").write_bytes(b"ids")
+    with closing(sqlite3.connect(source_dir / "keywords.sqlite3")) as conn:
+        conn.execute("CREATE TABLE chunks (id TEXT)")
+        conn.execute("INSERT INTO chunks VALUES ('a')")
+        conn.commit()
+
+    build_dir = tmp_path / "2"
+    setup_chroma_db.copy_index(str(source_dir), str(build_dir))
+
+    assert os.path.samefile(source_dir / "manifest.json", build_dir / "manifest.json")
+    assert os.path.samefile(
+        source_dir / "quantized" / "ids.npy", build_dir / "quantized" / "ids.npy"
+    )
+    # SQLite files are modified in place, so each build has its own.
+    assert not os.path.samefile(
+        source_dir / "keywords.sqlite3", build_dir / "keywords.sqlite3"
+    )
+    with closing(sqlite3.connect(build_dir / "keywords.sqlite3")) as conn:
+        assert conn.execute("SELECT id FROM chunks").fetchall() == [("a",)]
+
+
+def test_sync_only_checks_the_changed_files(published, embedding, monkeypatch):
+    monkeypatch.setattr(setup_chroma_db, "vector_backend", "quantized")
+    monkeypatch.setattr(
+        setup_chroma_db,
+        "index_version_path",
+        os.path.join(setup_chroma_db.persist_directory, "index_version"),
+    )
+    monkeypatch.setitem(setup_chroma_db.config_wiki, "queries", [])
+    monkeypatch.setitem(setup_chroma_db.config_ingest, "file_workers", 1)
+    notes, todo = published / "notes.txt", published / "todo.txt"
+    todo.write_text("buy milk", encoding="utf-8")
+    assert setup_chroma_db.sync(embedding, rebuild=True, skip_wikipedia=True)
+
+    notes.write_text("edited notes", encoding="utf-8")
+    todo.write_text("edited todo", encoding="utf-8")
+    embedding.calls.clear()
+    assert setup_chroma_db.sync(
+        embedding, rebuild=False, skip_wikipedia=True, changed={str(notes)}
+    )
+    assert embedding.calls == [["edited notes"]]
+
+    notes.unlink()
+    embedding.calls.clear()
+    assert setup_chroma_db.sync(
+        embedding, rebuild=False, skip_wikipedia=True, changed={str(notes)}
+    )
+    assert not embedding.calls
+    build_dir = setup_chroma_db.read_pointer(setup_chroma_db.persist_directory)
+    manifest = setup_chroma_db.load_manifest(build_dir)
+    assert list(manifest["sources"]) == [str(todo)]
+    # The edit to todo.txt was not part of a batch, so it waits for the next one.
+    assert len(manifest["sources"][str(todo)]["chunks"]) == 1
+    assert not setup_chroma_db.is_up_to_date(skip_wikipedia=True)
@@ -0,0 +1,127 @@
+"""SummaryStore search, and routing questions to summaries or chunks."""
+
+import re
+import zlib
+from contextlib import contextmanager
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from utils.summary_store import SummaryStore, SummaryTierRetriever
+
+SUMMARIES = {
+    "/docs/Brochure.docx": "A brochure for the spring language course in Berlin.",
+    "/docs/Resume.docx": "A resume listing work experience as a software engineer.",
+}
+# Words carrying no topic, which a real embedding model mostly discounts.
+STOPWORDS = set("a the for in as is what me tell about can you please".split())
+
+
+class WordEmbeddings(Embeddings):
+    """Hashes each word to a dimension, so texts sharing words are similar."""
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        vector = [0.0] * 64
+        for word in re.findall(r"\w+", text.lower()):
+            if word not in STOPWORDS:
+                vector[zlib.crc32(word.encode()) % 64] += 1.0
+        return vector
+
+
+class ChunkRetriever:
+    def invoke(self, query, config=None):  # pylint: disable=W0613
+        return [Document(page_content=f"chunk for {query}")]
+
+    def batch_search(self, queries):
+        return [self.invoke(query) for query in queries]
+
+
+class Service:
+    """Serves one build, like RetrievalService."""
+
+    def __init__(self, summaries):
+        self.embedding = WordEmbeddings()
+        self.summaries = summaries
+
+    @contextmanager
+    def build(self):
+        yield self
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = str(tmp_path / "summaries.sqlite3")
+    store = SummaryStore(path)
+    embedding = WordEmbeddings()
+    for source, summary in SUMMARIES.items():
+        title = source.rsplit("/", 1)[1]
+        vector = embedding.embed_query(f"{title}\n\n{summary}")
+        store.put(source, "docx", title.split(".")[0], summary, vector)
+    store.close()
+    return path
+
+
+@pytest.fixture
+def retriever(path):
+    store = SummaryStore(path, readonly=True)
+    yield SummaryTierRetriever(
+        retriever=ChunkRetriever(), service=Service(store), min_score=0.3
+    )
+    store.close()
+
+
+def test_search_ranks_and_filters_by_score(path):
+    store = SummaryStore(path, readonly=True)
+    vector = WordEmbeddings().embed_query("resume of a software engineer")
+
+    (doc,) = store.search(vector, k=1)
+    assert doc.metadata["source"] == "/docs/Resume.docx"
+    assert doc.metadata["summary"] is True
+    assert [d.metadata["source"] for d in store.search(vector, k=2)] == [
+        "/docs/Resume.docx",
+        "/docs/Brochure.docx",
+    ]
+    assert not store.search(vector, k=2, min_score=0.99)
+    store.close()
+
+
+def test_removed_summaries_are_not_found(path):
+    store = SummaryStore(path)
+    store.remove(["/docs/Resume.docx"])
+    vector = WordEmbeddings().embed_query("resume of a software engineer")
+
+    assert [d.metadata["source"] for d in store.search(vector, k=2)] == [
+        "/docs/Brochure.docx"
+    ]
+    assert store.sources() == ["/docs/Brochure.docx"]
+    store.close()
+
+
+@pytest.mark.parametrize(
+    "question, source",
+    [
+        ("tell me what Brochure.docx is about", "/docs/Brochure.docx"),
+        ("What is in Resume.docx?", "/docs/Resume.docx"),
+        ("Can you summarise the resume please?", "/docs/Resume.docx"),
+    ],
+)
+def test_questions_about_a_source_get_its_summary(retriever, question, source):
+    (doc,) = retriever.invoke(question)
+    assert doc.metadata["source"] == source
+
+
+def test_other_questions_get_chunks(retriever):
+    question = "How many customers are in Chile?"
+    assert retriever.invoke(question)[0].page_content == f"chunk for {question}"
+    contexts = retriever.batch_search([question, "What is in Resume.docx?"])
+    assert contexts[0][0].page_content == f"chunk for {question}"
+    assert contexts[1][0].metadata["source"] == "/docs/Resume.docx"
+
+
+def test_builds_without_summaries_get_chunks():
+    retriever = SummaryTierRetriever(retriever=ChunkRetriever(), service=Service(None))
+    assert retriever.invoke("What is in Resume.docx?")[0].page_content == (
+        "chunk for What is in Resume.docx?"
+    )
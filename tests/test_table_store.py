@@ -0,0 +1,61 @@
+"""TableStore.query only runs reads, within its row and time limits."""
+
+import sqlite3
+import pytest
+from utils.table_store import TableStore
+
+ROWS = [(None, ["name", "qty"]), (None, ["apple", "3"]), (None, ["pear", "5"])]
+
+
+@pytest.fixture
+def store(tmp_path):
+    # Writable, so the authorizer alone has to stop writes.
+    store = TableStore(str(tmp_path / "tables.sqlite3"))
+    store.write_source("/docs/fruit.csv", ROWS)
+    yield store
+    store.close()
+
+
+def test_select(store):
+    result = store.query("SELECT name FROM fruit WHERE qty > 4", 10, 1.0)
+    assert result == {"columns": ["name"], "rows": [["pear"]], "truncated": False}
+
+
+def test_rows_are_truncated(store):
+    result = store.query("SELECT name FROM fruit ORDER BY name", 1, 1.0)
+    assert result["rows"] == [["apple"]]
+    assert result["truncated"]
+
+
+@pytest.mark.parametrize(
+    "sql",
+    [
+        "DELETE FROM fruit",
+        "UPDATE fruit SET qty = 0",
+        "INSERT INTO fruit VALUES ('plum', 1)",
+        "DROP TABLE fruit",
+        "CREATE TABLE other (x)",
+        "ATTACH DATABASE ':memory:' AS other",
+        "PRAGMA journal_mode = DELETE",
+    ],
+)
+def test_writes_are_denied(store, sql):
+    with pytest.raises(sqlite3.DatabaseError):
+        store.query(sql, 10, 1.0)
+    assert store.query("SELECT COUNT(*) FROM fruit", 10, 1.0)["rows"] == [[2]]
+
+
+def test_slow_query_is_interrupted(store):
+    sql = (
+        "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n) "
+        "SELECT COUNT(*) FROM n"
+    )
+    with pytest.raises(sqlite3.OperationalError):
+        store.query(sql, 10, 0.1)
+
+
+def test_authorizer_is_removed_after_query(store):
+    with pytest.raises(sqlite3.DatabaseError):
+        store.query("DELETE FROM fruit", 10, 1.0)
+    store.write_source("/docs/fruit.csv", ROWS[:2])
+    assert store.query("SELECT name FROM fruit", 10, 1.0)["rows"] == [["apple"]]
@@ -0,0 +1,69 @@
+"""Streaming CSV and XLSX files as row groups with their header."""
+
+import pytest
+from utils.tabular_loader import load_tabular
+
+HEADER = "id,country,note"
+
+
+@pytest.fixture
+def customers(tmp_path):
+    path = tmp_path / "customers.csv"
+    rows = [HEADER, ",,"] + [f"{i},Chile,row {i}" for i in range(10)]
+    path.write_text("\n".join(rows) + "\n", encoding="utf-8")
+    return str(path)
+
+
+def test_row_groups_repeat_the_header_and_fit_the_chunk_size(customers):
+    docs = list(load_tabular(customers, chunk_size=60))
+
+    assert all(doc.page_content.startswith(HEADER + "\n") for doc in docs)
+    assert all(len(doc.page_content) <= 60 for doc in docs)
+    rows = [line for doc in docs for line in doc.page_content.split("\n")[1:]]
+    assert rows == [f"{i},Chile,row {i}" for i in range(10)]
+    assert [(doc.metadata["row"], doc.metadata["end_row"]) for doc in docs] == [
+        (0, 2),
+        (3, 5),
+        (6, 8),
+        (9, 9),
+    ]
+    assert {doc.metadata["source"] for doc in docs} == {customers}
+
+
+def test_documents_are_produced_lazily(customers):
+    docs = load_tabular(customers, chunk_size=60)
+
+    assert next(docs).metadata["row"] == 0
+    docs.close()
+
+
+def test_long_rows_get_a_document_of_their_own(tmp_path):
+    path = tmp_path / "notes.csv"
+    note = "a long note, with a comma " * 5
+    path.write_text(f'id,note\n1,short\n2,"{note}"\n3,short\n', encoding="utf-8")
+
+    docs = list(load_tabular(str(path), chunk_size=40))
+    assert [doc.page_content.split("\n")[1] for doc in docs] == [
+        "1,short",
+        f'2,"{note}"',
+        "3,short",
+    ]
+
+
+def test_each_sheet_has_its_own_header(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    path = str(tmp_path / "book.xlsx")
+    workbook = openpyxl.Workbook()
+    workbook.active.title = "customers"
+    workbook.active.append(["id", "country"])
+    workbook.active.append([1, "Chile"])
+    orders = workbook.create_sheet("orders")
+    orders.append(["order", "total"])
+    orders.append([7, 9.5])
+    workbook.save(path)
+
+    docs = list(load_tabular(path, chunk_size=1000))
+    assert [(doc.metadata["sheet"], doc.page_content) for doc in docs] == [
+        ("customers", "id,country\n1,Chile"),
+        ("orders", "order,total\n7,9.5"),
+    ]
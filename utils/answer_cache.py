@@ -0,0 +1,132 @@
+"""Semantic cache of RAG answers, invalidated whenever the index changes."""
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_question(text: str) -> str:
+    """Normalize a question for exact matching (case, whitespace, end punctuation)."""
+    return re.sub(r"\s+", " ", text).strip().rstrip("?!. ").casefold()
+
+
+class AnswerCache:
+    """LRU cache of answers with TTL, exact and near-duplicate lookups.
+
+    Questions are matched exactly on their normalized text first, then by
+    cosine similarity of their embeddings against every live entry. The cache
+    is cleared whenever the index version file written by
+    ``setup_chroma_db.py`` changes, so answers never outlive the documents
+    they were built from. Callers take the :meth:`version` before retrieving
+    and pass it to :meth:`put`, so an answer built while a new index was
+    published is not cached under the new version.
+
+    Args:
+        embedding (Embeddings): Embeds questions for near-duplicate matching.
+        version_path (str): The index version file to watch.
+        similarity_threshold (float): Minimum cosine similarity for a near hit.
+        ttl (float): Seconds an entry stays valid.
+        max_entries (int): Maximum number of entries before LRU eviction.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        version_path: str,
+        similarity_threshold: float,
+        ttl: float,
+        max_entries: int,
+    ):
+        self.embedding = embedding
+        self.version_path = version_path
+        self.similarity_threshold = similarity_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = self._read_version()
+        self.hits = 0
+        self.misses = 0
+
+    def _read_version(self):
+        try:
+            return os.stat(self.version_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def version(self):
+        """Return the current index version, to pass to :meth:`put`."""
+        return self._read_version()
+
+    def _check_version(self):
+        """Drop every entry if the index was rebuilt since they were cached."""
+        version = self._read_version()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def _embed(self, question: str) -> np.ndarray:
+        # Embed the raw question, which the retriever embeds (and caches) too.
+        vector = np.asarray(self.embedding.embed_query(question), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def _hit(self, key: str) -> dict:
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return self._entries[key][1]
+
+    def get(self, question: str):
+        """Return the cached result for a question or a near duplicate of it.
+
+        Args:
+            question (str): The user's question.
+
+        Returns:
+            dict: The cached result, or None on a miss.
+        """
+        key = normalize_question(question)
+        with self._lock:
+            self._check_version()
+            now = time.monotonic()
+            for expired in [k for k, e in self._entries.items() if e[2] <= now]:
+                del self._entries[expired]
+            if key in self._entries:
+                return self._hit(key)
+            if self.similarity_threshold >= 1 or not self._entries:
+                self.misses += 1
+                return None
+
+        vector = self._embed(question)
+        with self._lock:
+            candidates = list(self._entries)
+            if candidates:
+                scores = np.stack([self._entries[k][0] for k in candidates]) @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.similarity_threshold:
+                    return self._hit(candidates[best])
+            self.misses += 1
+            return None
+
+    def put(self, question: str, result: dict, version):
+        """Cache the result for a question, evicting the least recently used.
+
+        Args:
+            question (str): The user's question.
+            result (dict): The result to cache.
+            version: The :meth:`version` taken before the result was retrieved;
+                the result is dropped if the index changed since.
+        """
+        key = normalize_question(question)
+        vector = self._embed(question)
+        with self._lock:
+            self._check_version()
+            if version != self._version:
+                return
+            self._entries[key] = (vector, result, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,101 @@
+"""Pooled HTTP client the Dash app uses to talk to the RAG API."""
+
+import os
+import json
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class RagApiClient:
+    """Keep-alive client for the RAG API with timeouts and bounded retries.
+
+    Connections are pooled in one ``requests.Session`` per process, so
+    background callback processes never share sockets with their parent.
+    Connection errors and 429/502/503/504 responses are retried with backoff;
+    read timeouts are not, since the request may still be running.
+
+    Args:
+        base_url (str): The API root, e.g. ``http://127.0.0.1:5000``.
+        connect_timeout (float): Seconds to wait for a connection.
+        read_timeout (float): Seconds to wait between bytes of the response.
+        max_retries (int): Retries for failed connections and busy responses.
+        pool_size (int): Maximum number of kept-alive connections.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        connect_timeout: float,
+        read_timeout: float,
+        max_retries: int,
+        pool_size: int,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.pool_size = pool_size
+        self._session = None
+        self._pid = None
+
+    @property
+    def session(self) -> requests.Session:
+        """The pooled session of the current process."""
+        if self._session is None or self._pid != os.getpid():
+            # A read timeout means the API may already be generating the
+            # answer: retrying it would only pile a duplicate onto a busy
+            # server, so only connection errors and busy statuses are retried.
+            retry = Retry(
+                total=self.max_retries,
+                connect=self.max_retries,
+                read=0,
+                status=self.max_retries,
+                backoff_factor=0.5,
+                status_forcelist=[429, 502, 503, 504],
+                allowed_methods=["POST"],
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(
+                max_retries=retry,
+                pool_connections=1,
+                pool_maxsize=self.pool_size,
+            )
+            self._session = requests.Session()
+            self._session.mount("http://", adapter)
+            self._session.mount("https://", adapter)
+            self._pid = os.getpid()
+        return self._session
+
+    def post(self, path: str, payload: dict, **kwargs) -> requests.Response:
+        """POST a JSON payload to an API path and raise for HTTP errors."""
+        response = self.session.post(
+            f"{self.base_url}{path}", json=payload, timeout=self.timeout, **kwargs
+        )
+        response.raise_for_status()  # Raise an error for HTTP issues
+        return response
+
+    def query(self, input_text: str, session_id: str = None) -> dict:
+        """Ask the RAG API a question and return its formatted result.
+
+        Questions sent with the same ``session_id`` share a conversation.
+        """
+        payload = {"input": input_text, "session_id": session_id}
+        data = self.post("/query", payload).json()
+        return data.get("response", "No response received")
+
+    def search(self, input_text: str, source_type: str = None) -> list:
+        """Search the RAG API's index, returning the matching chunks, best first."""
+        payload = {"input": input_text, "source_type": source_type}
+        return self.post("/search", payload).json()["results"]
+
+    def stream(self, input_text: str, session_id: str = None):
+        """Ask the RAG API a question, yielding each NDJSON event as it arrives."""
+        payload = {"input": input_text, "session_id": session_id}
+        with self.post("/query/stream", payload, stream=True) as response:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                data = json.loads(line)
+                if "error" in data:
+                    raise RuntimeError(data["error"])
+                yield data
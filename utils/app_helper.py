@@ -1,16 +1,18 @@
 """Helper functions and variables for the Dash app."""
 
 import os
-import requests
-from urllib.parse import urlparse
+import json
 import tomllib
 from itertools import cycle
-from langchain_ollama import OllamaEmbeddings
-from langchain_chroma import Chroma
+from functools import lru_cache
 import pandas as pd
 from dash import html
 from dash_iconify import DashIconify
 import dash_mantine_components as dmc
+from utils.api_client import RagApiClient
+from utils.sources import get_source_type
+from utils.retrieval import CATALOG_FILE, close_vectorstore, current_index_dir
+from utils import tracing
 
 # Load config
 with open("config.toml", "rb") as f:
@@ -26,67 +28,40 @@ COLOR_PALETTE = cycle(
     ]
 )
 
-# Get vectorstore
-embedding_model_id = config["utils"]["chroma"]["embedding_model_id"]
-collection_name = config["utils"]["chroma"]["collection_name"]
-embedding_model = OllamaEmbeddings(model=embedding_model_id)
-vectorstore = Chroma(
-    collection_name=collection_name,
-    embedding_function=embedding_model,
-    persist_directory="chroma",
-)
 EXT_COLOR_MAP = {}
+INDEX_VERSION_PATH = os.path.join("chroma", "index_version")
+FILES_PER_PAGE = config["app"]["files_per_page"]
+_catalog_cache = {}
+
+# RAG API client, reaching a wildcard bind address through localhost. Searches go
+# through the API too, so only the API process loads the index.
+api_host = config["llm"]["host"]
+if api_host in ("0.0.0.0", "::"):
+    api_host = "127.0.0.1"
+api_client = RagApiClient(
+    f"http://{api_host}:{config['llm']['port']}", **config["llm"]["client"]
+)
 
 
-def chat_ai(input_text):
-    api_url = "http://127.0.0.1:5000/query"  # Replace with your Flask app URL
-    response = requests.post(api_url, json={"input": input_text})
-    response.raise_for_status()  # Raise an error for HTTP issues
-    data = response.json()
-    data_out = data.get("response", "No response received")
+def chat_ai(input_text, session_id=None):
+    data_out = api_client.query(input_text, session_id)
     return data_out["answer"]
 
 
-def is_url(input_string: str) -> bool:
+def stream_chat_ai(input_text, session_id=None):
     """
-    Determines if the input string is a file path or a URL.
+    Streams Weaver's answer to a chat message from the RAG API.
 
     Args:
-        input_string (str): The string to evaluate.
+        input_text (str): The user's message.
+        session_id (str): The chat's id; the API keeps its history under it.
 
-    Returns:
-        str: "file_path" if the input is a file path,
-             "url" if the input is a URL,
-             "unknown" if it doesn't match either.
+    Yields:
+        str: Answer tokens, as soon as the model generates them.
     """
-    # Check for URL using urlparse
-    parsed = urlparse(input_string)
-    if parsed.scheme in ["http", "https", "ftp"] and parsed.netloc:
-        return True
-
-    return False
-
-
-def get_file_extension(file_path: str, default_ext: str = "unknown") -> str:
-    """
-    Returns the file extension from a file path without the dot.
-    If no extension is found, returns 'unknown'.
-
-    Args:
-        file_path (str): The file path string.
-
-    Returns:
-        str: The file extension (e.g., 'docx'), or 'unknown' if none is found.
-    """
-    _, ext = os.path.splitext(file_path)
-    return ext[1:] if ext else default_ext
-
-
-def get_source_type(source: str) -> str:
-    if is_url(source):
-        return "url"
-    else:
-        return get_file_extension(source)
+    for data in api_client.stream(input_text, session_id):
+        if "answer" in data:
+            yield data["answer"]
 
 
 def get_file_icon(file_name):
@@ -171,40 +146,179 @@ def create_user_message(message):
     return create_message(message, "mdi:account", True)
 
 
-def make_ext_button(ext):
+def get_ext_button_class(ext, selected=False):
     """
-    Creates a button for a file extension with a unique color.
+    Returns the classes of an extension button, highlighting it when selected.
 
     Args:
         ext (str): The file extension.
+        selected (bool): Whether the extension is the active filter.
 
     Returns:
-        dmc.Button: A styled button with a unique color for the extension.
+        str: The button's class names.
     """
     # Assign a color to the extension if not already assigned
     if ext not in EXT_COLOR_MAP:
         EXT_COLOR_MAP[ext] = next(COLOR_PALETTE)
 
+    class_name = f"text-center text-white {EXT_COLOR_MAP[ext]}"
+    if selected:
+        class_name += " ring-4 ring-indigo-800"
+    return class_name
+
+
+def make_ext_button(ext):
+    """
+    Creates a button for a file extension with a unique color.
+
+    Args:
+        ext (str): The file extension.
+
+    Returns:
+        dmc.Button: A styled button with a unique color for the extension.
+    """
     # Create the button with the assigned color
     return dmc.Button(
         ext,
         id={"type": "ext-button", "index": ext},
         radius="xl",
-        className=f"text-center text-white {EXT_COLOR_MAP[ext]}",
+        className=get_ext_button_class(ext),
     )
 
 
-def make_df_from_vectorstore(search: str = None):
-    if search:
-        sources = [
-            doc.metadata["source"] for doc in vectorstore.similarity_search(search)
-        ]
-    else:
-        sources = [v["source"] for v in vectorstore.get()["metadatas"]]
+def _scan_legacy_index(index_dir: str) -> pd.DataFrame:
+    """Counts the chunks per source of an index with no catalog."""
+    from langchain_chroma import Chroma
+
+    vectorstore = Chroma(
+        collection_name=config["utils"]["chroma"]["collection_name"],
+        persist_directory=index_dir,
+    )
+    try:
+        metadatas = vectorstore.get(include=["metadatas"])["metadatas"]
+    finally:
+        close_vectorstore(vectorstore)
+    _catalog_df = pd.DataFrame([m["source"] for m in metadatas], columns=["source"])
+    _catalog_df = _catalog_df.value_counts("source").rename("chunk_count")
+    _catalog_df = _catalog_df.reset_index()
+    _catalog_df["ext"] = _catalog_df.source.apply(get_source_type)
+    return _catalog_df
+
+
+def load_catalog() -> pd.DataFrame:
+    """
+    Loads the source catalog of the published index build.
+
+    The catalog is re-read only when a new build is published. An index
+    built before builds were versioned, with no catalog, is scanned once
+    instead; otherwise, without a catalog (no index built yet), it is empty.
+
+    Returns:
+        pd.DataFrame: One row per source with its ``ext`` and ``chunk_count``.
+    """
+    index_dir = current_index_dir("chroma")
+    catalog_path = os.path.join(index_dir, CATALOG_FILE)
+    try:
+        mtime = os.path.getmtime(catalog_path)
+    except OSError:
+        mtime = None
+
+    key = (catalog_path, mtime)
+    if _catalog_cache.get("key") != key or "df" not in _catalog_cache:
+        if mtime is None and os.path.exists(os.path.join(index_dir, "chroma.sqlite3")):
+            _catalog_df = _scan_legacy_index(index_dir)
+        elif mtime is None:
+            _catalog_df = pd.DataFrame()
+        else:
+            with open(catalog_path, "r", encoding="utf-8") as file:
+                _catalog_df = pd.DataFrame(json.load(file))
+        _catalog_df = _catalog_df.reindex(columns=["source", "ext", "chunk_count"])
+        _catalog_cache.update(key=key, df=_catalog_df)
+
+    return _catalog_cache["df"]
+
+
+def make_df_from_vectorstore(search: str = None, source_type: str = None):
+    """
+    Lists the sources matching a search, optionally of a single source type.
+
+    Searches go to the RAG API's hybrid retriever (BM25 and/or vectors, see
+    ``[utils.chroma.retrieval]``). The type filter is pushed down to both
+    indexes, so only chunks of that type are scanned.
+
+    Args:
+        search (str): The search text; lists every source when empty.
+        source_type (str): Only keep sources of this type (e.g. 'pdf', 'url').
+
+    Returns:
+        pd.DataFrame: The matching ``source`` and ``ext`` columns.
+    """
+    if not search:
+        _catalog_df = load_catalog()
+        if source_type:
+            _catalog_df = _catalog_df[_catalog_df.ext == source_type]
+        return _catalog_df
+
+    results = api_client.search(search, source_type)
+    sources = [result["metadata"]["source"] for result in results]
     _chroma_df = pd.DataFrame(sources, columns=["source"])
     _chroma_df["ext"] = _chroma_df.source.apply(get_source_type)
 
     return _chroma_df
 
 
-chroma_df = make_df_from_vectorstore()
+def get_index_version():
+    """Returns a token that changes whenever setup_chroma_db.py updates the index."""
+    try:
+        return os.stat(INDEX_VERSION_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+@lru_cache(maxsize=config["app"]["search_cache_size"])
+def _search_sources(search: str, source_type: str, index_version) -> tuple:
+    # index_version is only part of the key, so a re-index misses the cache
+    return tuple(make_df_from_vectorstore(search, source_type).source.unique())
+
+
+tracing.watch_cache("search", lambda: _search_sources.cache_info()[:2])
+
+
+def search_sources(search: str = None, source_type: str = None) -> tuple:
+    """
+    Lists the unique sources matching a search, in ranked order.
+
+    Searches are cached per index version, so repeated queries skip both the
+    embedding call and the vector lookup until the index changes.
+
+    Args:
+        search (str): The search text; lists every source when empty.
+        source_type (str): Only keep sources of this type (e.g. 'pdf', 'url').
+
+    Returns:
+        tuple: The matching sources.
+    """
+    search = (search or "").strip()
+    if not search:
+        return tuple(make_df_from_vectorstore(None, source_type).source.unique())
+    return _search_sources(search, source_type, get_index_version())
+
+
+def get_page(sources, page: int = 1) -> list:
+    """
+    Renders one page of the file grid.
+
+    Args:
+        sources (Sequence): The sources to display.
+        page (int): The 1-based page number.
+
+    Returns:
+        list: The file displays of that page.
+    """
+    start = (page - 1) * FILES_PER_PAGE
+    return [make_file_display(file) for file in sources[start : start + FILES_PER_PAGE]]
+
+
+def get_page_count(sources) -> int:
+    """Returns the number of file grid pages needed for the sources (at least 1)."""
+    return max(1, -(-len(sources) // FILES_PER_PAGE))
@@ -0,0 +1,198 @@
+"""Assemble retrieved chunks into a deduplicated, reranked, token-budgeted context."""
+
+import re
+import math
+from typing import Any
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.tracing import span
+
+# Shortest shared text taken as the overlap of two neighbouring chunks.
+_MIN_OVERLAP = 20
+
+
+def _terms(text: str) -> set:
+    return set(re.findall(r"\w{2,}", text.casefold()))
+
+
+def _join(first: str, second: str):
+    """Return ``first`` extended by ``second`` if ``second`` overlaps its end.
+
+    Returns:
+        str: The joined text, or None if the texts don't overlap.
+    """
+    if second in first:
+        return first
+    probe = second[:_MIN_OVERLAP]
+    if len(probe) < _MIN_OVERLAP:
+        return None
+    start = first.find(probe)
+    while start != -1:
+        if second.startswith(first[start:]):
+            return first + second[len(first) - start :]
+        start = first.find(probe, start + 1)
+    return None
+
+
+def merge_overlapping(docs: list) -> list:
+    """Drop duplicate chunks and merge overlapping chunks of the same source.
+
+    Neighbouring chunks share ``chunk_overlap`` characters, so a chunk that
+    starts with the end of another one from the same source is appended to it
+    without the shared text, and a chunk contained in another is dropped, as
+    is a chunk identical to one of another source.
+
+    Args:
+        docs (list): Retrieved documents, best first.
+
+    Returns:
+        list: ``(document, rank)`` pairs, where a merged document keeps the
+        metadata and the best retrieval rank of its parts.
+    """
+    merged = []
+    for rank, doc in enumerate(docs):
+        entry = {"text": doc.page_content, "doc": doc, "rank": rank}
+        while True:
+            for other in merged:
+                sources = [e["doc"].metadata.get("source") for e in (other, entry)]
+                same_source = sources[0] == sources[1]
+                if not same_source and other["text"] != entry["text"]:
+                    continue
+                text = _join(other["text"], entry["text"]) or _join(
+                    entry["text"], other["text"]
+                )
+                if text is not None:
+                    break
+            else:
+                break
+            merged.remove(other)
+            entry = {**min(other, entry, key=lambda e: e["rank"]), "text": text}
+        merged.append(entry)
+
+    return [
+        (
+            Document(
+                id=e["doc"].id, page_content=e["text"], metadata=e["doc"].metadata
+            ),
+            e["rank"],
+        )
+        for e in merged
+    ]
+
+
+def rerank(query: str, candidates: list, rerank_weight: float) -> list:
+    """Order chunks by their overlap with the query's terms and their retrieval rank.
+
+    The lexical score is the IDF-weighted share of the query's terms found in
+    the chunk, with IDF taken over the candidates, and the rank score is
+    ``1 / (1 + rank)``.
+
+    Args:
+        query (str): The question.
+        candidates (list): ``(document, rank)`` pairs.
+        rerank_weight (float): Weight of the lexical score, between 0 and 1;
+            the rank score gets the rest.
+
+    Returns:
+        list: The documents, best first.
+    """
+    query_terms = _terms(query)
+    doc_terms = [_terms(doc.page_content) for doc, _ in candidates]
+    idf = {
+        term: math.log(
+            1 + len(candidates) / (1 + sum(term in terms for terms in doc_terms))
+        )
+        for term in query_terms
+    }
+    total = sum(idf.values()) or 1.0
+
+    scores = []
+    for (doc, rank), terms in zip(candidates, doc_terms):
+        lexical = sum(weight for term, weight in idf.items() if term in terms) / total
+        scores.append(rerank_weight * lexical + (1 - rerank_weight) / (1 + rank))
+    order = sorted(range(len(candidates)), key=lambda i: scores[i], reverse=True)
+    return [candidates[i][0] for i in order]
+
+
+def pack(docs: list, max_tokens: int, chars_per_token: float) -> list:
+    """Keep the best documents that fit in a token budget.
+
+    Documents that don't fit are skipped in favour of smaller ones further
+    down. If even the best one doesn't fit, it is truncated to the budget.
+
+    Args:
+        docs (list): Documents, best first.
+        max_tokens (int): The token budget.
+        chars_per_token (float): Characters per token, to estimate sizes.
+
+    Returns:
+        list: The documents that fit, best first.
+    """
+    budget = int(max_tokens * chars_per_token)
+    packed = []
+    used = 0
+    for doc in docs:
+        # Count the blank line the stuff chain puts between documents.
+        size = len(doc.page_content) + 2
+        if used + size <= budget:
+            packed.append(doc)
+            used += size
+
+    if not packed and docs:
+        best = docs[0]
+        cut = best.page_content.rfind(" ", 0, budget)
+        packed.append(
+            Document(
+                id=best.id,
+                page_content=best.page_content[: cut if cut > 0 else budget],
+                metadata=best.metadata,
+            )
+        )
+    return packed
+
+
+class ContextAssemblyRetriever(BaseRetriever):
+    """Retrieve candidate chunks, then dedupe, merge, rerank and pack them.
+
+    Keeps the prompt, and so the model's prefill time, within
+    ``max_tokens`` of context however much the retrieved chunks overlap.
+    """
+
+    retriever: Any
+    candidates: int = 12
+    max_tokens: int = 1024
+    chars_per_token: float = 4.0
+    rerank_weight: float = 0.5
+
+    def assemble(self, query: str, docs: list) -> list:
+        """Turn retrieved chunks into the context for a question.
+
+        Args:
+            query (str): The question.
+            docs (list): Retrieved documents, best first.
+
+        Returns:
+            list: The context documents, best first.
+        """
+        with span("assemble"):
+            candidates = merge_overlapping(docs)
+            ranked = rerank(query, candidates, self.rerank_weight)
+            return pack(ranked, self.max_tokens, self.chars_per_token)
+
+    def batch_search(self, queries: list) -> list:
+        """Retrieve and assemble the contexts of several questions at once.
+
+        Args:
+            queries (list): The questions.
+
+        Returns:
+            list: The context documents of each question, best first.
+        """
+        results = self.retriever.batch_search(queries, k=self.candidates)
+        return [self.assemble(query, docs) for query, docs in zip(queries, results)]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return self.assemble(query, self.retriever.search(query, k=self.candidates))
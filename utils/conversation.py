@@ -0,0 +1,174 @@
+"""Per-session chat history for the RAG API, kept within a fixed token budget."""
+
+import time
+import threading
+from typing import Callable
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+
+class ConversationStore:
+    """Chat history per session: a window of recent turns and a summary of the rest.
+
+    The newest turns are kept word for word, up to ``window_turns`` of them
+    and within ``max_history_tokens`` together with the summary. Older turns
+    are folded into the summary by ``summarize`` in a background thread, so a
+    reply never waits on it; until a fold finishes, the newest of its turns
+    that fit the budget are still replayed as they were. A session has one
+    fold running at a time, and turns arriving meanwhile are folded together
+    by the next one. The summary is cut to ``summary_tokens``, and a turn too
+    long for the budget on its own is truncated, so the history sent with
+    every question stays bounded however long the chat.
+
+    Sessions idle for ``ttl`` seconds are dropped, and the least recently
+    used ones past ``max_sessions``.
+
+    Args:
+        summarize (Callable): Takes the current summary and a list of
+            ``(question, answer)`` turns, returns the new summary.
+        window_turns (int): Maximum number of turns kept word for word.
+        max_history_tokens (int): Token budget of the whole history.
+        summary_tokens (int): Token budget of the summary, within the above.
+        chars_per_token (float): Characters per token, to estimate sizes.
+        max_sessions (int): Maximum number of sessions kept.
+        ttl (float): Seconds a session is kept after its last turn.
+        fold_workers (int): Sessions folded at once.
+    """
+
+    def __init__(
+        self,
+        summarize: Callable[[str, list], str],
+        window_turns: int,
+        max_history_tokens: int,
+        summary_tokens: int,
+        chars_per_token: float,
+        max_sessions: int,
+        ttl: float,
+        fold_workers: int = 1,
+    ):
+        self.summarize = summarize
+        self.window_turns = window_turns
+        self.max_history_chars = int(max_history_tokens * chars_per_token)
+        self.max_summary_chars = int(summary_tokens * chars_per_token)
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        # At most one fold per session is queued, so the queue is bounded by
+        # max_sessions.
+        self._pool = ThreadPoolExecutor(fold_workers)
+
+    def _session(self, session_id: str, create: bool = False):
+        now = time.monotonic()
+        with self._lock:
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if now - oldest["used"] <= self.ttl:
+                    break
+                del self._sessions[oldest_id]
+
+            session = self._sessions.get(session_id)
+            if session is None and create:
+                session = {
+                    "summary": "",
+                    "folding": [],
+                    "turns": [],
+                    "fold_running": False,
+                    "lock": threading.Lock(),
+                }
+                self._sessions[session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            if session is not None:
+                session["used"] = now
+                self._sessions.move_to_end(session_id)
+            return session
+
+    def history(self, session_id: str) -> list:
+        """Return a session's history as chat messages, oldest first.
+
+        Returns:
+            list: A system message with the summary, if any, then the human
+            and AI messages of the recent turns. Empty for unknown sessions.
+        """
+        session = self._session(session_id)
+        if session is None:
+            return []
+        with session["lock"]:
+            messages = []
+            if session["summary"]:
+                messages.append(
+                    SystemMessage(
+                        f"Summary of the earlier conversation: {session['summary']}"
+                    )
+                )
+            # Turns still being folded fill what the budget leaves, newest first;
+            # older ones are dropped, the summary will cover them.
+            room = self.max_history_chars - len(session["summary"])
+            room -= sum(len(q) + len(a) for q, a in session["turns"])
+            folding = []
+            for question, answer in reversed(session["folding"]):
+                room -= len(question) + len(answer)
+                if room < 0:
+                    break
+                folding.insert(0, (question, answer))
+            for question, answer in folding + session["turns"]:
+                messages += [HumanMessage(question), AIMessage(answer)]
+            return messages
+
+    @staticmethod
+    def _truncate(text: str, limit: int) -> str:
+        if len(text) <= limit:
+            return text
+        if limit <= 0:
+            return ""
+        cut = text.rfind(" ", 0, limit - 1)
+        return text[: cut if cut > 0 else limit - 1] + "…"
+
+    def add_turn(self, session_id: str, question: str, answer: str):
+        """Record a question and its answer, folding old turns into the summary."""
+        budget = self.max_history_chars - self.max_summary_chars
+        if len(question) + len(answer) > budget:
+            # The question gets at least half the budget, the answer the rest.
+            question = self._truncate(question, max(budget // 2, budget - len(answer)))
+            answer = self._truncate(answer, budget - len(question))
+        session = self._session(session_id, create=True)
+        with session["lock"]:
+            turns = session["turns"] + [(question, answer)]
+            keep = 0
+            size = 0
+            for turn_question, turn_answer in reversed(turns):
+                size += len(turn_question) + len(turn_answer)
+                if keep == self.window_turns or size > budget:
+                    break
+                keep += 1
+            session["turns"] = turns[len(turns) - keep :]
+            session["folding"] += turns[: len(turns) - keep]
+            start = session["folding"] and not session["fold_running"]
+            if start:
+                session["fold_running"] = True
+        if start:
+            self._pool.submit(self._fold, session)
+
+    def _fold(self, session: dict):
+        while True:
+            with session["lock"]:
+                turns = list(session["folding"])
+                previous = session["summary"]
+                if not turns:
+                    session["fold_running"] = False
+                    return
+            try:
+                summary = self.summarize(previous, turns)
+            except Exception:  # pylint: disable=W0718
+                # Without a model, keep the latest turns' text as the summary.
+                summary = " ".join([previous, *(f"Q: {q} A: {a}" for q, a in turns)])[
+                    -self.max_summary_chars :
+                ]
+            if len(summary) > self.max_summary_chars:
+                cut = summary.rfind(" ", 0, self.max_summary_chars)
+                summary = summary[: cut if cut > 0 else self.max_summary_chars]
+            with session["lock"]:
+                session["summary"] = summary.strip()
+                del session["folding"][: len(turns)]
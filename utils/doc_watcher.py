@@ -0,0 +1,115 @@
+"""Background watcher turning changes to a directory's files into batches."""
+
+import os
+import time
+import queue
+import threading
+from typing import Iterator
+
+
+class DirectoryWatcher:
+    """Watches the files of a directory from a background thread.
+
+    The directory is scanned every ``poll_interval`` seconds, and a file
+    counts as changed when it appears, disappears, or its size or mtime
+    changes. Changes are collected until the directory has been quiet for
+    ``debounce`` seconds, so a burst (copying a folder of files, an editor
+    saving through a temporary file) becomes a single batch. Batches wait in
+    a queue of at most ``max_batches``; while it is full, new changes are
+    merged into the batch being collected, so a slow consumer never makes
+    the watcher fall behind or grow without bound.
+
+    Scanning needs no file system event API, so it also works on network
+    and container mounts, at the cost of one ``stat`` per file per poll.
+    Hidden files (``.name``) and Office lock files (``~$name``) are ignored.
+
+    Args:
+        directory (str): The directory to watch (not recursively).
+        poll_interval (float): Seconds between scans.
+        debounce (float): Seconds without changes before a batch is queued.
+        max_batches (int): Maximum number of batches waiting to be consumed.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        poll_interval: float = 1.0,
+        debounce: float = 2.0,
+        max_batches: int = 1,
+    ):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self._queue = queue.Queue(max_batches)
+        self._snapshot = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """Take the first snapshot and start watching."""
+        self._snapshot = self._scan()
+        self._thread.start()
+
+    def stop(self):
+        """Stop watching; :meth:`batches` returns once it notices."""
+        self._stop.set()
+        self._thread.join()
+
+    def _scan(self) -> dict:
+        snapshot = {}
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return snapshot
+        for entry in entries:
+            if entry.name.startswith((".", "~$")):
+                continue
+            try:
+                if entry.is_file():
+                    stat = entry.stat()
+                    snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                # Deleted between listing and stat; the next scan notices.
+                continue
+        return snapshot
+
+    def _run(self):
+        changed = set()
+        last_change = 0.0
+        while not self._stop.wait(self.poll_interval):
+            snapshot = self._scan()
+            diff = {
+                path
+                for path in self._snapshot.keys() | snapshot.keys()
+                if self._snapshot.get(path) != snapshot.get(path)
+            }
+            self._snapshot = snapshot
+            now = time.monotonic()
+            if diff:
+                changed |= diff
+                last_change = now
+            elif changed and now - last_change >= self.debounce:
+                try:
+                    self._queue.put_nowait(changed)
+                    changed = set()
+                except queue.Full:
+                    # Keep collecting; the batch is queued once there's room.
+                    pass
+
+    def batches(self) -> Iterator[set]:
+        """Yield the paths changed in each batch, until the watcher is stopped.
+
+        Batches queued while the previous one was being handled are merged,
+        so the consumer always works from the latest state of the directory.
+        """
+        while not self._stop.is_set():
+            try:
+                batch = self._queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+            while True:
+                try:
+                    batch |= self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            yield batch
@@ -0,0 +1,204 @@
+"""Registry of the loaders turning local files into documents, by MIME type.
+
+A file's type is taken from its extension, or sniffed from its first bytes
+when the extension is missing or unknown. Loaders are generators, so pages
+are produced one at a time. Formats with pages (PDF) also say how to cut a
+file into parts, which the indexer loads in separate processes, so a large
+PDF is extracted on every core instead of one.
+
+Add a format with :func:`register_loader`:
+
+```python
+@register_loader("application/rtf", extensions=(".rtf",))
+def load_rtf(file_path, part=None):
+    yield Document(page_content=rtf_to_text(file_path), metadata={"source": file_path})
+```
+"""
+
+import os
+import codecs
+import zipfile
+import mimetypes
+from typing import Callable, Iterator
+from langchain_core.documents import Document
+from langchain_community.document_loaders import (
+    Docx2txtLoader,
+    UnstructuredEPubLoader,
+    UnstructuredMarkdownLoader,
+)
+
+# Bytes read to sniff the type of a file without a known extension.
+_SNIFF_BYTES = 8_192
+
+DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+XLSX = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_loaders = {}
+_extensions = {}
+
+
+def register_loader(
+    mime_type: str, extensions: tuple = (), parts: Callable[[str, int], list] = None
+):
+    """Register a loader for a MIME type (decorator).
+
+    The loader is called as ``load(file_path, part)`` and yields documents.
+
+    Args:
+        mime_type (str): The MIME type loaded, e.g. ``application/pdf``.
+        extensions (tuple): Extensions (``.pdf``) of files with this type.
+        parts (Callable): Takes a file path and a part size and returns the
+            parts (e.g. page ranges) to load separately; by default a file is
+            one part, None.
+    """
+
+    def decorator(load):
+        _loaders[mime_type] = (load, parts)
+        for extension in extensions:
+            _extensions[extension] = mime_type
+        return load
+
+    return decorator
+
+
+def sniff_mime_type(file_path: str):
+    """Guess a file's MIME type from its content.
+
+    Recognizes PDF, the ZIP-based DOCX, XLSX and EPUB formats, and UTF-8
+    text (no NUL bytes). Returns None for anything else.
+    """
+    with open(file_path, "rb") as file:
+        head = file.read(_SNIFF_BYTES)
+    if head.startswith(b"%PDF-"):
+        return "application/pdf"
+    if head.startswith(b"PK\x03\x04"):
+        try:
+            with zipfile.ZipFile(file_path) as archive:
+                names = set(archive.namelist())
+                if "mimetype" in names:
+                    return archive.read("mimetype").decode("ascii").strip()
+        except (zipfile.BadZipFile, UnicodeDecodeError):
+            return None
+        if "word/document.xml" in names:
+            return DOCX
+        if "xl/workbook.xml" in names:
+            return XLSX
+        return None
+    if b"\0" in head:
+        return None
+    try:
+        # Not final: the read may have cut a multi-byte character in half.
+        codecs.getincrementaldecoder("utf-8")().decode(head, final=False)
+    except UnicodeDecodeError:
+        return None
+    return "text/plain"
+
+
+def get_mime_type(file_path: str):
+    """Return a file's MIME type, by extension or else by content."""
+    extension = os.path.splitext(file_path)[-1].lower()
+    mime_type = _extensions.get(extension) or mimetypes.guess_type(file_path)[0]
+    if mime_type not in _loaders:
+        mime_type = sniff_mime_type(file_path) or mime_type
+    return mime_type
+
+
+def _lookup(mime_type: str):
+    if mime_type in _loaders:
+        return _loaders[mime_type]
+    # Source code, logs, CSS and the like are read as plain text.
+    if mime_type and mime_type.startswith("text/"):
+        return _loaders["text/plain"]
+    return None
+
+
+def get_parts(file_path: str, part_size: int = 8) -> list:
+    """Return the parts a file is loaded in; empty if its type is unsupported.
+
+    Each part is passed to :func:`load_document`, possibly in another process.
+
+    Args:
+        file_path (str): The file path.
+        part_size (int): Units (pages for PDFs) per part.
+    """
+    loader = _lookup(get_mime_type(file_path))
+    if loader is None:
+        return []
+    _, parts = loader
+    return parts(file_path, part_size) if parts else [None]
+
+
+def load_document(file_path: str, part=None) -> Iterator[Document]:
+    """Yield the documents of a file, or of one of its parts.
+
+    Raises:
+        ValueError: If no loader handles the file's type.
+    """
+    mime_type = get_mime_type(file_path)
+    loader = _lookup(mime_type)
+    if loader is None:
+        raise ValueError(f"Unsupported file type {mime_type or 'unknown'}")
+    load, _ = loader
+    return load(file_path, part)
+
+
+def pdf_page_ranges(file_path: str, pages_per_part: int = 8) -> list:
+    """Cut a PDF into ``(start, stop)`` page ranges of ``pages_per_part`` pages."""
+    import pypdf
+
+    page_count = len(pypdf.PdfReader(file_path).pages)
+    return [
+        (start, min(start + pages_per_part, page_count))
+        for start in range(0, page_count, pages_per_part)
+    ] or [(0, 0)]
+
+
+@register_loader("application/pdf", extensions=(".pdf",), parts=pdf_page_ranges)
+def load_pdf(file_path: str, part: tuple = None) -> Iterator[Document]:
+    """Yield one document per page, like ``PyPDFLoader``, for a range of pages."""
+    import pypdf
+
+    reader = pypdf.PdfReader(file_path)
+    # Document info (title, author...) under the keys PyPDFLoader uses.
+    metadata = {
+        key.lstrip("/").lower(): str(value)
+        for key, value in (reader.metadata or {}).items()
+    }
+    metadata.update(source=file_path, total_pages=len(reader.pages))
+    start, stop = part or (0, len(reader.pages))
+    # Read once: pypdf rebuilds the whole list on every access.
+    page_labels = reader.page_labels
+    for page_number in range(start, stop):
+        yield Document(
+            page_content=reader.pages[page_number].extract_text().strip(),
+            metadata={
+                **metadata,
+                "page": page_number,
+                "page_label": page_labels[page_number],
+            },
+        )
+
+
+@register_loader(DOCX, extensions=(".docx",))
+def load_docx(file_path: str, part=None) -> Iterator[Document]:
+    """Yield the text of a Word document (it has no pages to split on)."""
+    yield from Docx2txtLoader(file_path).lazy_load()
+
+
+@register_loader("application/epub+zip", extensions=(".epub",))
+def load_epub(file_path: str, part=None) -> Iterator[Document]:
+    """Yield the text of an EPUB book."""
+    yield from UnstructuredEPubLoader(file_path).lazy_load()
+
+
+@register_loader("text/markdown", extensions=(".md", ".markdown"))
+def load_markdown(file_path: str, part=None) -> Iterator[Document]:
+    """Yield the text of a Markdown file."""
+    yield from UnstructuredMarkdownLoader(file_path).lazy_load()
+
+
+@register_loader("text/plain", extensions=(".txt",))
+def load_text(file_path: str, part=None) -> Iterator[Document]:
+    """Yield the content of a UTF-8 text file."""
+    with open(file_path, "r", encoding="utf-8") as file:
+        yield Document(page_content=file.read(), metadata={"source": file_path})
@@ -0,0 +1,181 @@
+"""On-disk embedding cache shared by ingestion, the Dash app and the RAG API."""
+
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from langchain_core.embeddings import Embeddings
+
+# SQLite caps the number of bound parameters per statement.
+_LOOKUP_BATCH = 500
+
+
+class CachedEmbeddings(Embeddings):
+    """Wrap an embedding model with a persistent SQLite cache.
+
+    Vectors are keyed by the embedding model id and the SHA-256 of the text,
+    so every process using the same model shares the same entries. When the
+    stored vectors grow past ``max_size_mb`` the least recently used entries
+    are evicted. Triggers keep the total size of the vectors in a one-row
+    table, so checking the budget doesn't scan the cache.
+
+    Args:
+        embedding (Embeddings): The embedding model to cache.
+        model_id (str): The embedding model id, used as part of the key.
+        path (str): Path of the SQLite cache file.
+        max_size_mb (float): Maximum size of the stored vectors, in megabytes.
+    """
+
+    def __init__(
+        self, embedding: Embeddings, model_id: str, path: str, max_size_mb: float
+    ):
+        self.embedding = embedding
+        self.model_id = model_id
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._lock, self._conn:
+            # One transaction, so no process inserts before the triggers exist.
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    last_used REAL NOT NULL,
+                    PRIMARY KEY (model, text_hash)
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used "
+                "ON embeddings (last_used)"
+            )
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings_size (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    bytes INTEGER NOT NULL
+                )
+                """
+            )
+            self._conn.execute("INSERT OR IGNORE INTO embeddings_size VALUES (0, 0)")
+            for trigger in (
+                """
+                CREATE TRIGGER IF NOT EXISTS embeddings_size_insert
+                AFTER INSERT ON embeddings BEGIN
+                    UPDATE embeddings_size SET bytes = bytes + LENGTH(NEW.vector);
+                END
+                """,
+                """
+                CREATE TRIGGER IF NOT EXISTS embeddings_size_update
+                AFTER UPDATE OF vector ON embeddings BEGIN
+                    UPDATE embeddings_size
+                    SET bytes = bytes + LENGTH(NEW.vector) - LENGTH(OLD.vector);
+                END
+                """,
+                """
+                CREATE TRIGGER IF NOT EXISTS embeddings_size_delete
+                AFTER DELETE ON embeddings BEGIN
+                    UPDATE embeddings_size SET bytes = bytes - LENGTH(OLD.vector);
+                END
+                """,
+            ):
+                # Not executescript(), which would commit the transaction first.
+                self._conn.execute(trigger)
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _lookup(self, hashes: list) -> dict:
+        """Fetch cached vectors and mark them as recently used."""
+        found = {}
+        with self._lock, self._conn:
+            for start in range(0, len(hashes), _LOOKUP_BATCH):
+                batch = hashes[start : start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    "SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_id, *batch],
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = array("d")
+                    vector.frombytes(blob)
+                    found[text_hash] = vector.tolist()
+            self.hits += len(found)
+            self.misses += len(hashes) - len(found)
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? "
+                    "WHERE model = ? AND text_hash = ?",
+                    [(now, self.model_id, text_hash) for text_hash in found],
+                )
+        return found
+
+    def _store(self, vectors: dict):
+        """Insert new vectors, then evict the oldest entries if over budget."""
+        now = time.time()
+        with self._lock, self._conn:
+            # An upsert rather than INSERT OR REPLACE, whose implicit delete
+            # doesn't fire the size trigger.
+            self._conn.executemany(
+                "INSERT INTO embeddings VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (model, text_hash) DO UPDATE SET "
+                "vector = excluded.vector, last_used = excluded.last_used",
+                [
+                    (self.model_id, text_hash, array("d", vector).tobytes(), now)
+                    for text_hash, vector in vectors.items()
+                ],
+            )
+            (total,) = self._conn.execute(
+                "SELECT bytes FROM embeddings_size"
+            ).fetchone()
+            if total <= self.max_size:
+                return
+
+            # Evict down to 90% of the budget so every insert doesn't evict.
+            excess = total - int(self.max_size * 0.9)
+            evicted = []
+            for rowid, size in self._conn.execute(
+                "SELECT rowid, LENGTH(vector) FROM embeddings ORDER BY last_used"
+            ):
+                if excess <= 0:
+                    break
+                evicted.append((rowid,))
+                excess -= size
+            self._conn.executemany("DELETE FROM embeddings WHERE rowid = ?", evicted)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embed documents, only calling the model for texts not in the cache."""
+        hashes = [self._hash(text) for text in texts]
+        vectors = self._lookup(list(set(hashes)))
+
+        missing = {h: text for h, text in zip(hashes, texts) if h not in vectors}
+        if missing:
+            new_vectors = dict(
+                zip(missing, self.embedding.embed_documents(list(missing.values())))
+            )
+            self._store(new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[h] for h in hashes]
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embed a query, only calling the model if it is not in the cache."""
+        text_hash = self._hash(text)
+        vector = self._lookup([text_hash]).get(text_hash)
+        if vector is None:
+            vector = self.embedding.embed_query(text)
+            self._store({text_hash: vector})
+        return vector
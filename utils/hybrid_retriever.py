@@ -0,0 +1,138 @@
+"""Retriever fusing BM25 keyword results with dense vector results."""
+
+# pylint: disable=W0212
+
+from typing import Any, Literal
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.tracing import span
+from utils.quantized_index import QuantizedIndex
+
+
+def reciprocal_rank_fusion(result_lists: list, k: int, rrf_k: int = 60) -> list:
+    """Merge ranked document lists with reciprocal rank fusion.
+
+    Each document scores ``1 / (rrf_k + rank)`` in every list it appears in.
+    Documents are identified by their chunk id, or their content without one.
+
+    Args:
+        result_lists (list): Ranked lists of documents, best first.
+        k (int): Number of documents to return.
+        rrf_k (int): Damping constant; larger values flatten rank differences.
+
+    Returns:
+        list: The ``k`` best documents by fused score.
+    """
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = doc.id or doc.page_content
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    ranked = sorted(scores, key=scores.get, reverse=True)
+    return [docs[key] for key in ranked[:k]]
+
+
+class HybridRetriever(BaseRetriever):
+    """Retrieve chunks by BM25, by vector similarity, or both fused with RRF.
+
+    ``keyword`` mode only queries the inverted index and never calls the
+    embedding model, which keeps exact-term lookups in the milliseconds.
+    ``vectorstore`` is a Chroma collection or a ``QuantizedIndex``, whose
+    chunk texts are read from the keyword index.
+    """
+
+    vectorstore: Any
+    keyword_index: Any
+    mode: Literal["hybrid", "vector", "keyword"] = "hybrid"
+    k: int = 4
+    fetch_k: int = 20
+    rrf_k: int = 60
+
+    def search(self, query: str, source_type: str = None, k: int = None) -> list:
+        """Retrieve the best chunks for a query.
+
+        Args:
+            query (str): The search text.
+            source_type (str): Only return chunks of this source type.
+            k (int): Number of chunks to return, defaults to ``self.k``.
+
+        Returns:
+            list: The matching documents, best first.
+        """
+        return self.batch_search([query], source_type, k)[0]
+
+    def batch_search(
+        self, queries: list, source_type: str = None, k: int = None
+    ) -> list:
+        """Retrieve the best chunks for several queries at once.
+
+        The queries are embedded in one call and looked up in one Chroma query.
+
+        Args:
+            queries (list): The search texts.
+            source_type (str): Only return chunks of this source type.
+            k (int): Number of chunks to return per query, defaults to ``self.k``.
+
+        Returns:
+            list: The matching documents of each query, best first.
+        """
+        k = k or self.k
+        with span("retrieve", mode=self.mode):
+            if self.mode == "keyword":
+                return [self._keyword_search(q, k, source_type) for q in queries]
+            if self.mode == "vector":
+                return self._vector_search(queries, k, source_type)
+            keyword_results = [
+                self._keyword_search(q, self.fetch_k, source_type) for q in queries
+            ]
+            vector_results = self._vector_search(queries, self.fetch_k, source_type)
+            return [
+                reciprocal_rank_fusion([keyword_docs, vector_docs], k, self.rrf_k)
+                for keyword_docs, vector_docs in zip(keyword_results, vector_results)
+            ]
+
+    def _keyword_search(self, query: str, k: int, source_type: str) -> list:
+        with span("keyword_search"):
+            return self.keyword_index.search(query, k=k, source_type=source_type)
+
+    def _vector_search(self, queries: list, k: int, source_type: str) -> list:
+        # Embed separately so the embedding and the HNSW lookup are timed apart.
+        embeddings = self.vectorstore.embeddings
+        with span("embed"):
+            if len(queries) == 1:
+                vectors = [embeddings.embed_query(queries[0])]
+            else:
+                vectors = embeddings.embed_documents(queries)
+        if isinstance(self.vectorstore, QuantizedIndex):
+            with span("vector_search"):
+                id_lists = self.vectorstore.query(vectors, k, source_type)
+            docs = {
+                doc.id: doc
+                for doc in self.keyword_index.get([i for ids in id_lists for i in ids])
+            }
+            return [[docs[i] for i in ids if i in docs] for ids in id_lists]
+
+        with span("vector_search"):
+            results = self.vectorstore._collection.query(
+                query_embeddings=vectors,
+                n_results=k,
+                where={"source_type": source_type} if source_type else None,
+                include=["documents", "metadatas"],
+            )
+        return [
+            [
+                Document(id=chunk_id, page_content=content, metadata=metadata or {})
+                for chunk_id, content, metadata in zip(ids, contents, metadatas)
+            ]
+            for ids, contents, metadatas in zip(
+                results["ids"], results["documents"], results["metadatas"]
+            )
+        ]
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return self.search(query)
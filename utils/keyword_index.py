@@ -0,0 +1,156 @@
+"""On-disk inverted index of the chunks, scored with BM25 (SQLite FTS5)."""
+
+import os
+import re
+import json
+import sqlite3
+import threading
+from langchain_core.documents import Document
+
+# SQLite caps the number of bound parameters per statement.
+_LOOKUP_BATCH = 500
+
+
+class KeywordIndex:
+    """BM25 keyword index kept alongside the Chroma collection.
+
+    Chunks are stored once in a plain table and indexed by an external-content
+    FTS5 table, so lookups never touch the embedding model. Chunk ids are the
+    same as in Chroma, which lets results be fused with vector results.
+
+    Args:
+        path (str): Path of the SQLite index file.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS chunks (
+                    id INTEGER PRIMARY KEY,
+                    chunk_id TEXT UNIQUE NOT NULL,
+                    source_type TEXT,
+                    content TEXT NOT NULL,
+                    metadata TEXT NOT NULL
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                    content,
+                    content='chunks',
+                    content_rowid='id',
+                    tokenize='porter unicode61'
+                );
+                CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+                    INSERT INTO chunks_fts (rowid, content)
+                    VALUES (new.id, new.content);
+                END;
+                CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+                    INSERT INTO chunks_fts (chunks_fts, rowid, content)
+                    VALUES ('delete', old.id, old.content);
+                END;
+                """
+            )
+
+    def close(self):
+        """Close the connection."""
+        with self._lock:
+            self._conn.close()
+
+    def add(self, ids: list, docs: list):
+        """Index chunks; chunks already indexed under the same id are kept."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chunks "
+                "(chunk_id, source_type, content, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (
+                        chunk_id,
+                        doc.metadata.get("source_type"),
+                        doc.page_content,
+                        json.dumps(doc.metadata),
+                    )
+                    for chunk_id, doc in zip(ids, docs)
+                ],
+            )
+
+    def delete(self, ids: list):
+        """Remove chunks from the index."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM chunks WHERE chunk_id = ?", [(i,) for i in ids]
+            )
+
+    def clear(self):
+        """Remove every chunk from the index."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM chunks")
+
+    def get(self, ids: list = None, limit: int = None) -> list:
+        """Return chunks by id, in the order given, or the first ``limit`` chunks.
+
+        Args:
+            ids (list): Chunk ids; ids that aren't indexed are skipped.
+            limit (int): Without ids, the number of chunks to return.
+
+        Returns:
+            list: Documents (with their chunk ``id``).
+        """
+        rows = []
+        with self._lock:
+            if ids is None:
+                rows = self._conn.execute(
+                    "SELECT chunk_id, content, metadata FROM chunks "
+                    "ORDER BY id LIMIT ?",
+                    (-1 if limit is None else limit,),
+                ).fetchall()
+            for start in range(0, len(ids or []), _LOOKUP_BATCH):
+                batch = ids[start : start + _LOOKUP_BATCH]
+                rows += self._conn.execute(
+                    "SELECT chunk_id, content, metadata FROM chunks "
+                    f"WHERE chunk_id IN ({', '.join('?' * len(batch))})",
+                    batch,
+                ).fetchall()
+        docs = {
+            chunk_id: Document(
+                id=chunk_id, page_content=content, metadata=json.loads(metadata)
+            )
+            for chunk_id, content, metadata in rows
+        }
+        return [docs[i] for i in (ids if ids is not None else docs) if i in docs]
+
+    def search(self, query: str, k: int = 4, source_type: str = None) -> list:
+        """Return the chunks that best match the query's terms, by BM25.
+
+        Args:
+            query (str): The search text; any of its terms may match.
+            k (int): Maximum number of chunks to return.
+            source_type (str): Only return chunks of this source type.
+
+        Returns:
+            list: Documents (with their chunk ``id``), best match first.
+        """
+        terms = re.findall(r"\w+", query)
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+
+        sql = (
+            "SELECT c.chunk_id, c.content, c.metadata FROM chunks_fts "
+            "JOIN chunks c ON c.id = chunks_fts.rowid WHERE chunks_fts MATCH ?"
+        )
+        params = [match]
+        if source_type:
+            sql += " AND c.source_type = ?"
+            params.append(source_type)
+        sql += " ORDER BY bm25(chunks_fts) LIMIT ?"
+        params.append(k)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [
+            Document(id=chunk_id, page_content=content, metadata=json.loads(metadata))
+            for chunk_id, content, metadata in rows
+        ]
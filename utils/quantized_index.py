@@ -0,0 +1,379 @@
+"""Int8-quantized, memory-mapped vector index, an alternative to Chroma's HNSW.
+
+An index is a directory of ``.npy`` arrays, one row per chunk:
+
+- ``codes.npy``: the vectors quantized to int8, one scale per vector;
+- ``scales.npy`` and ``norms.npy``: each vector's scale and squared norm;
+- ``vectors.npy``: the float32 vectors, only read to rerank candidates;
+- ``ids.npy`` and ``types.npy``: the chunk ids and source type codes.
+
+Searches open the arrays with ``mmap_mode="r"``, so every process serving
+the same build shares one copy in the page cache, and only the int8 codes
+(a quarter of the float32 size) need to stay resident.
+"""
+
+import os
+import json
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+META_FILE = "meta.json"
+_ARRAYS = ("codes", "scales", "norms", "vectors", "ids", "types")
+# Chunk ids are hex SHA-256 digests.
+_ID_DTYPE = "S64"
+# Rows quantized per block while an index is written.
+_WRITE_BLOCK = 4_096
+
+
+def _read_meta(path: str) -> dict:
+    try:
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {"count": 0, "dim": None, "source_types": []}
+
+
+def quantize(vectors: np.ndarray) -> tuple:
+    """Quantize float32 vectors to int8 with one symmetric scale per vector.
+
+    Returns:
+        tuple: The int8 codes and the float32 scales, such that
+        ``codes * scales[:, None]`` approximates ``vectors``.
+    """
+    scales = np.abs(vectors).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+class QuantizedIndexWriter:
+    """Fill a quantized index during ingestion, like a Chroma collection.
+
+    Implements the ``get``/``upsert``/``delete`` calls ``EmbeddingIngestor``
+    makes on a collection. Added vectors are appended to a staging file and
+    deletions to a log, both replayed when an interrupted build is resumed;
+    :meth:`finalize` then writes the arrays searches read. Chunk texts and
+    metadata are not stored: they live in the keyword index.
+
+    Args:
+        path (str): The index directory.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._meta = _read_meta(path)
+        self._pending_vectors = os.path.join(path, "pending.f32")
+        self._pending_log = os.path.join(path, "pending.jsonl")
+        self._deleted_log = os.path.join(path, "deleted.jsonl")
+
+        ids = self._load("ids")
+        self._rows = {} if ids is None else {i.decode(): r for r, i in enumerate(ids)}
+        self._pending = []
+        self._pending_ids = set()
+        self._deleted = set()
+        self._replay()
+
+    def _load(self, name: str):
+        if not self._meta["count"]:
+            return None
+        return np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+
+    def _replay(self):
+        """Reload the additions and deletions of an interrupted build."""
+        if os.path.exists(self._pending_log):
+            with open(self._pending_log, "r", encoding="utf-8") as file:
+                entries = [json.loads(line) for line in file if line.strip()]
+            row_size = 4 * (self._meta["dim"] or 0)
+            stored = (
+                os.path.getsize(self._pending_vectors) // row_size if row_size else 0
+            )
+            # Drop a vector or a log line written without the other.
+            self._pending = [tuple(entry) for entry in entries[:stored]]
+            self._pending_ids = {chunk_id for chunk_id, _ in self._pending}
+            with open(self._pending_vectors, "ab") as file:
+                file.truncate(len(self._pending) * row_size)
+
+        if not os.path.exists(self._deleted_log):
+            return
+        # Each deletion is logged with the number of additions before it, so
+        # a chunk added again after its deletion stays.
+        with open(self._deleted_log, "r", encoding="utf-8") as file:
+            deletions = dict(json.loads(line) for line in file if line.strip())
+        last_added = {chunk_id: row for row, (chunk_id, _) in enumerate(self._pending)}
+        self._deleted = {
+            chunk_id
+            for chunk_id, position in deletions.items()
+            if last_added.get(chunk_id, -1) < position
+        }
+
+    def _alive(self, chunk_id: str) -> bool:
+        if chunk_id in self._deleted:
+            return False
+        return chunk_id in self._rows or chunk_id in self._pending_ids
+
+    def get(self, ids: list, include: list = None) -> dict:  # pylint: disable=W0613
+        """Return which of the given chunk ids are stored, as ``{"ids": [...]}``."""
+        with self._lock:
+            return {"ids": [chunk_id for chunk_id in ids if self._alive(chunk_id)]}
+
+    def upsert(self, ids: list, embeddings: list, metadatas: list, **kwargs):
+        """Add chunk vectors; ids already stored are kept as they are.
+
+        Chunk ids are derived from the chunk content, so an id always comes
+        with the same vector.
+        """
+        with self._lock:
+            new = [
+                (chunk_id, vector, metadata)
+                for chunk_id, vector, metadata in zip(ids, embeddings, metadatas)
+                if not self._alive(chunk_id)
+            ]
+            if not new:
+                return
+            vectors = np.asarray([vector for _, vector, _ in new], dtype=np.float32)
+            if self._meta["dim"] is None:
+                self._meta["dim"] = vectors.shape[1]
+            with open(self._pending_vectors, "ab") as file:
+                file.write(vectors.tobytes())
+            entries = [
+                (chunk_id, (metadata or {}).get("source_type", ""))
+                for chunk_id, _, metadata in new
+            ]
+            with open(self._pending_log, "a", encoding="utf-8") as file:
+                file.writelines(json.dumps(entry) + "\n" for entry in entries)
+            self._write_meta(self._meta)
+            for chunk_id, _ in entries:
+                self._deleted.discard(chunk_id)
+                self._pending_ids.add(chunk_id)
+            self._pending += entries
+
+    def delete(self, ids: list):
+        """Delete chunk vectors."""
+        with self._lock:
+            ids = [chunk_id for chunk_id in ids if self._alive(chunk_id)]
+            position = len(self._pending)
+            with open(self._deleted_log, "a", encoding="utf-8") as file:
+                file.writelines(
+                    json.dumps([chunk_id, position]) + "\n" for chunk_id in ids
+                )
+            self._deleted.update(ids)
+
+    def clear(self):
+        """Delete every vector."""
+        with self._lock:
+            for name in _ARRAYS:
+                path = os.path.join(self.path, f"{name}.npy")
+                if os.path.exists(path):
+                    os.remove(path)
+            for path in (self._pending_vectors, self._pending_log, self._deleted_log):
+                if os.path.exists(path):
+                    os.remove(path)
+            self._meta = {"count": 0, "dim": None, "source_types": []}
+            self._write_meta(self._meta)
+            self._rows, self._pending, self._deleted = {}, [], set()
+            self._pending_ids = set()
+
+    def _write_meta(self, meta: dict):
+        meta_path = os.path.join(self.path, META_FILE)
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        os.replace(tmp_path, meta_path)
+
+    def finalize(self):
+        """Write the searchable arrays: stored rows minus deletions, plus additions.
+
+        Rows are copied and quantized a block at a time, so memory stays flat
+        however large the index.
+        """
+        with self._lock:
+            if not self._pending and not self._deleted:
+                return
+            dim = self._meta["dim"]
+            old_rows = [r for i, r in self._rows.items() if i not in self._deleted]
+            old_rows.sort()
+            new_rows = []
+            seen = set(self._rows)
+            for row, (chunk_id, _) in enumerate(self._pending):
+                if chunk_id not in self._deleted and chunk_id not in seen:
+                    new_rows.append(row)
+                    seen.add(chunk_id)
+            count = len(old_rows) + len(new_rows)
+
+            old_vectors = self._load("vectors")
+            old_ids = self._load("ids")
+            old_types = self._load("types")
+            pending = (
+                np.memmap(
+                    self._pending_vectors,
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(len(self._pending), dim),
+                )
+                if self._pending
+                else None
+            )
+            source_types = list(self._meta["source_types"])
+            type_codes = {name: code for code, name in enumerate(source_types)}
+
+            def type_code(name):
+                if name not in type_codes:
+                    type_codes[name] = len(source_types)
+                    source_types.append(name)
+                return type_codes[name]
+
+            shapes = {
+                "codes": ((count, dim), np.int8),
+                "scales": ((count,), np.float32),
+                "norms": ((count,), np.float32),
+                "vectors": ((count, dim), np.float32),
+                "ids": ((count,), _ID_DTYPE),
+                "types": ((count,), np.uint16),
+            }
+            out = {
+                name: np.lib.format.open_memmap(
+                    os.path.join(self.path, f"{name}.tmp.npy"),
+                    mode="w+",
+                    dtype=dtype,
+                    shape=shape,
+                )
+                for name, (shape, dtype) in shapes.items()
+            }
+
+            def write(start, vectors, ids, types):
+                stop = start + len(vectors)
+                codes, scales = quantize(vectors)
+                out["codes"][start:stop] = codes
+                out["scales"][start:stop] = scales
+                out["norms"][start:stop] = np.einsum("ij,ij->i", vectors, vectors)
+                out["vectors"][start:stop] = vectors
+                out["ids"][start:stop] = ids
+                out["types"][start:stop] = types
+
+            for start in range(0, len(old_rows), _WRITE_BLOCK):
+                rows = old_rows[start : start + _WRITE_BLOCK]
+                write(
+                    start,
+                    np.asarray(old_vectors[rows], dtype=np.float32),
+                    old_ids[rows],
+                    old_types[rows],
+                )
+            for start in range(0, len(new_rows), _WRITE_BLOCK):
+                rows = new_rows[start : start + _WRITE_BLOCK]
+                write(
+                    len(old_rows) + start,
+                    np.asarray(pending[rows], dtype=np.float32),
+                    [self._pending[row][0].encode() for row in rows],
+                    [type_code(self._pending[row][1]) for row in rows],
+                )
+
+            for array in out.values():
+                array.flush()
+            del out, old_vectors, old_ids, old_types, pending
+            for name in _ARRAYS:
+                os.replace(
+                    os.path.join(self.path, f"{name}.tmp.npy"),
+                    os.path.join(self.path, f"{name}.npy"),
+                )
+            self._meta = {"count": count, "dim": dim, "source_types": source_types}
+            self._write_meta(self._meta)
+            for path in (self._pending_vectors, self._pending_log, self._deleted_log):
+                if os.path.exists(path):
+                    os.remove(path)
+
+            ids = self._load("ids")
+            self._rows = {i.decode(): r for r, i in enumerate(ids)} if count else {}
+            self._pending, self._deleted = [], set()
+            self._pending_ids = set()
+
+
+class QuantizedIndex:
+    """Search a quantized index: a coarse int8 scan, then an exact rerank.
+
+    Every vector is scored against the queries from its int8 codes, a block
+    of ``block_rows`` at a time with NumPy, keeping the
+    ``rerank_candidates`` nearest. Those are rescored with exact L2 distances
+    on their float32 vectors, which are only read for them. Distances are
+    squared L2, as in the Chroma collections this replaces.
+
+    Args:
+        path (str): The index directory.
+        embeddings (Embeddings): Embeds queries.
+        rerank_candidates (int): Candidates per query rescored exactly.
+        block_rows (int): Rows scored per block, bounding scratch memory.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        embeddings: Embeddings,
+        rerank_candidates: int = 100,
+        block_rows: int = 4_096,
+    ):
+        self.path = path
+        self.embeddings = embeddings
+        self.rerank_candidates = rerank_candidates
+        self.block_rows = block_rows
+        meta = _read_meta(path)
+        self.count = meta["count"]
+        self._type_codes = {
+            name: code for code, name in enumerate(meta["source_types"])
+        }
+        self._arrays = {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+            for name in _ARRAYS
+            if self.count
+        }
+
+    def query(self, vectors: list, k: int, source_type: str = None) -> list:
+        """Find the chunks nearest to each query vector.
+
+        Args:
+            vectors (list): Query embeddings.
+            k (int): Number of chunks per query.
+            source_type (str): Only return chunks of this source type.
+
+        Returns:
+            list: The chunk ids of each query, nearest first.
+        """
+        queries = np.asarray(vectors, dtype=np.float32)
+        code = self._type_codes.get(source_type) if source_type else None
+        if not self.count or (source_type and code is None):
+            return [[] for _ in queries]
+
+        arrays = self._arrays
+        keep = min(max(self.rerank_candidates, k), self.count)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, self.count, self.block_rows):
+            stop = min(start + self.block_rows, self.count)
+            codes = np.asarray(arrays["codes"][start:stop], dtype=np.float32)
+            # ||x||^2 - 2 x.q, the squared distance up to the query's own norm.
+            scores = arrays["norms"][start:stop] - 2 * arrays["scales"][start:stop] * (
+                queries @ codes.T
+            )
+            if code is not None:
+                scores[:, arrays["types"][start:stop] != code] = np.inf
+            scores = np.concatenate([best_scores, scores], axis=1)
+            block_rows = np.broadcast_to(
+                np.arange(start, stop), (len(queries), stop - start)
+            )
+            rows = np.concatenate([best_rows, block_rows], axis=1)
+            if scores.shape[1] > keep:
+                top = np.argpartition(scores, keep - 1, axis=1)[:, :keep]
+                scores = np.take_along_axis(scores, top, axis=1)
+                rows = np.take_along_axis(rows, top, axis=1)
+            best_scores, best_rows = scores, rows
+
+        results = []
+        for query, scores, rows in zip(queries, best_scores, best_rows):
+            rows = np.sort(rows[np.isfinite(scores)])
+            exact = np.square(arrays["vectors"][rows] - query).sum(axis=1)
+            order = np.argsort(exact, kind="stable")[:k]
+            results.append(
+                [chunk_id.decode() for chunk_id in arrays["ids"][rows[order]]]
+            )
+        return results
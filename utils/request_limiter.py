@@ -0,0 +1,74 @@
+"""Admission control for the RAG API: bounded in-flight requests and wait queue."""
+
+import threading
+
+
+class ServerBusy(Exception):
+    """Raised when a request can't be admitted.
+
+    Args:
+        message (str): Why the request was rejected.
+        status (int): The HTTP status to answer with (429 or 503).
+    """
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+
+class RequestLimiter:
+    """Limit how many requests run at once, with a bounded, timed wait queue.
+
+    Requests beyond ``max_in_flight`` wait for a slot. If ``max_queued``
+    requests are already waiting the request is rejected with a 429, and if no
+    slot frees up within ``queue_timeout`` seconds it is rejected with a 503.
+
+    Args:
+        max_in_flight (int): Maximum number of requests running at once.
+        max_queued (int): Maximum number of requests waiting for a slot.
+        queue_timeout (float): Seconds a request may wait for a slot.
+    """
+
+    def __init__(self, max_in_flight: int, max_queued: int, queue_timeout: float):
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+
+    def acquire(self):
+        """Take a slot, waiting in the queue if needed.
+
+        Raises:
+            ServerBusy: If the queue is full or the wait timed out.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.max_queued:
+                    raise ServerBusy("Too many requests, try again later", 429)
+                self.waiting += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                raise ServerBusy("Timed out waiting for a free worker", 503)
+
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        """Give a slot back."""
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,251 @@
+"""The index builds written by setup_chroma_db.py and the service searching them.
+
+Every run of ``setup_chroma_db.py`` writes a complete index build (Chroma
+collection or quantized index, keyword index, table store, source summaries,
+manifest and catalog) to its own directory under
+``<root>/builds``, then publishes it by atomically replacing the ``CURRENT``
+pointer file. Readers only ever open published builds, so they never see one
+being written.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from chromadb.api.shared_system_client import SharedSystemClient
+from langchain_chroma import Chroma
+from langchain_core.embeddings import Embeddings
+from utils.keyword_index import KeywordIndex
+from utils.hybrid_retriever import HybridRetriever
+from utils.quantized_index import QuantizedIndex
+from utils.summary_store import SummaryStore
+
+BUILDS_DIR = "builds"
+INDEX_POINTER = "CURRENT"
+STAGING_POINTER = "NEXT"
+CATALOG_FILE = "catalog.json"
+KEYWORD_INDEX_FILE = "keyword_index.sqlite3"
+TABLE_STORE_FILE = "tables.sqlite3"
+QUANTIZED_INDEX_DIR = "quantized"
+SUMMARY_STORE_FILE = "summaries.sqlite3"
+
+
+def read_pointer(root: str, name: str = INDEX_POINTER):
+    """Return the build directory a pointer file names, or None if it is unset."""
+    try:
+        with open(os.path.join(root, name), "r", encoding="utf-8") as file:
+            return os.path.join(root, file.read().strip())
+    except OSError:
+        return None
+
+
+def write_pointer(root: str, build_dir: str, name: str = INDEX_POINTER):
+    """Atomically point a pointer file at a build directory."""
+    pointer_path = os.path.join(root, name)
+    tmp_path = f"{pointer_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(os.path.relpath(build_dir, root))
+    os.replace(tmp_path, pointer_path)
+
+
+def current_index_dir(root: str) -> str:
+    """Return the directory of the published index build.
+
+    Indexes built before builds were versioned live directly in ``root``.
+    """
+    return read_pointer(root) or root
+
+
+def close_vectorstore(vectorstore):
+    """Release what a vector store holds open, so its build can be deleted.
+
+    Chroma keeps one client system (HNSW segments, SQLite connections) per
+    directory for the life of the process unless its client is closed.
+    """
+    client = getattr(vectorstore, "_client", None)
+    if client is None:
+        return
+    if hasattr(client, "close"):
+        client.close()
+        return
+    # Chroma before 1.0 has no close(): drop and stop the cached system.
+    system = SharedSystemClient._identifier_to_system.pop(  # pylint: disable=W0212
+        client._identifier, None  # pylint: disable=W0212
+    )
+    if system is not None:
+        system.stop()
+
+
+class IndexBuild:
+    """An opened index build: its retriever and source summaries.
+
+    Counts the searches using it, so a build swapped out by a newer one is
+    closed as soon as the last of them finishes.
+
+    Args:
+        index_dir (str): The build directory.
+        retriever (HybridRetriever): The build's retriever.
+        summaries (SummaryStore): The build's source summaries, or None.
+    """
+
+    def __init__(self, index_dir: str, retriever: HybridRetriever, summaries):
+        self.index_dir = index_dir
+        self.retriever = retriever
+        self.summaries = summaries
+        self.users = 0
+        self.retired = False
+
+    def close(self):
+        """Close the vector store, keyword index and summary store."""
+        close_vectorstore(self.retriever.vectorstore)
+        self.retriever.keyword_index.close()
+        if self.summaries is not None:
+            self.summaries.close()
+
+
+class RetrievalService:
+    """The current index build, and the one place it is opened and searched.
+
+    Owns the embedding client and, for the published build, the vector index
+    (the Chroma collection or the quantized index, per ``vector_backend``),
+    keyword index, hybrid retriever and source summaries. Every search first checks
+    the ``CURRENT`` pointer (a single ``stat``); when a new build has been
+    published it is opened and swapped in atomically, so searches always run
+    against one complete build and a rebuild never needs a restart. The build
+    it replaces is closed once the searches still using it finish, so memory
+    and file handles don't grow with every rebuild.
+
+    Args:
+        root (str): The index root directory.
+        collection_name (str): The Chroma collection name.
+        embedding (Embeddings): The embedding client.
+        vector_backend (str): ``chroma`` or ``quantized``.
+        quantized (dict): ``QuantizedIndex`` settings (``[utils.chroma.quantized]``).
+        **retrieval: ``HybridRetriever`` settings (``[utils.chroma.retrieval]``).
+    """
+
+    def __init__(
+        self,
+        root: str,
+        collection_name: str,
+        embedding: Embeddings,
+        vector_backend: str = "chroma",
+        quantized: dict = None,
+        **retrieval,
+    ):
+        self.root = root
+        self.collection_name = collection_name
+        self.embedding = embedding
+        self.vector_backend = vector_backend
+        self.quantized = quantized or {}
+        self.retrieval = retrieval
+        self._lock = threading.Lock()
+        self._stamp = None
+        self._build = None
+
+    def _pointer_stamp(self):
+        try:
+            return os.stat(os.path.join(self.root, INDEX_POINTER)).st_mtime_ns
+        except OSError:
+            return None
+
+    def _acquire(self) -> IndexBuild:
+        """Return the current build, swapping in a newly published one, and use it."""
+        stamp = self._pointer_stamp()
+        retired = None
+        with self._lock:
+            if self._build is None or stamp != self._stamp:
+                index_dir = current_index_dir(self.root)
+                if self._build is None or self._build.index_dir != index_dir:
+                    # Open the new build completely before anyone can use it.
+                    retired, self._build = self._build, self._open(index_dir)
+                    if retired is not None:
+                        retired.retired = True
+                        if retired.users:
+                            # Closed by the last search still using it.
+                            retired = None
+                self._stamp = stamp
+            build = self._build
+            build.users += 1
+        if retired is not None:
+            retired.close()
+        return build
+
+    def _release(self, build: IndexBuild):
+        with self._lock:
+            build.users -= 1
+            close = build.retired and not build.users
+        if close:
+            build.close()
+
+    @contextmanager
+    def build(self):
+        """Use the build being served; it stays open until the block exits."""
+        build = self._acquire()
+        try:
+            yield build
+        finally:
+            self._release(build)
+
+    def _open(self, index_dir: str) -> IndexBuild:
+        if self.vector_backend == "quantized":
+            vectorstore = QuantizedIndex(
+                os.path.join(index_dir, QUANTIZED_INDEX_DIR),
+                self.embedding,
+                **self.quantized,
+            )
+        else:
+            vectorstore = Chroma(
+                collection_name=self.collection_name,
+                embedding_function=self.embedding,
+                persist_directory=index_dir,
+            )
+        keyword_index = KeywordIndex(os.path.join(index_dir, KEYWORD_INDEX_FILE))
+        summaries_path = os.path.join(index_dir, SUMMARY_STORE_FILE)
+        summaries = None
+        if os.path.exists(summaries_path):
+            summaries = SummaryStore(summaries_path, readonly=True)
+        return IndexBuild(
+            index_dir,
+            HybridRetriever(
+                vectorstore=vectorstore, keyword_index=keyword_index, **self.retrieval
+            ),
+            summaries,
+        )
+
+    # The properties below are for one-off use: what they return is closed
+    # once a newer build is swapped in and no search holds it (see build()).
+
+    @property
+    def index_dir(self) -> str:
+        """The directory of the build being served."""
+        with self.build() as build:
+            return build.index_dir
+
+    @property
+    def retriever(self) -> HybridRetriever:
+        """The retriever of the build being served."""
+        with self.build() as build:
+            return build.retriever
+
+    @property
+    def summaries(self):
+        """The source summaries of the build being served, or None without any."""
+        with self.build() as build:
+            return build.summaries
+
+    @property
+    def vectorstore(self):
+        """The Chroma collection or quantized index of the build being served."""
+        return self.retriever.vectorstore
+
+    def search(self, query: str, source_type: str = None, k: int = None) -> list:
+        """Retrieve the best chunks for a query (see ``HybridRetriever.search``)."""
+        with self.build() as build:
+            return build.retriever.search(query, source_type, k)
+
+    def batch_search(
+        self, queries: list, source_type: str = None, k: int = None
+    ) -> list:
+        """Retrieve the best chunks for several queries from the same build."""
+        with self.build() as build:
+            return build.retriever.batch_search(queries, source_type, k)
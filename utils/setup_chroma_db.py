@@ -1,21 +1,33 @@
-# pylint: disable=C0114, W0718, W0719
+# pylint: disable=C0114, C0413, W0718, W0719
 
 import os
+import sys
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
 import tomllib
 import argparse
+import threading
+import urllib.request
+from typing import Iterable
+from functools import partial
+from itertools import batched, islice
+from contextlib import ExitStack, closing
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
 from langchain_chroma import Chroma
-from langchain_ollama import OllamaEmbeddings
+from langchain_ollama import ChatOllama, OllamaEmbeddings
 from langchain_core.documents import Document
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.output_parsers import StrOutputParser
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import (
-    WikipediaLoader,
-    Docx2txtLoader,
-    UnstructuredExcelLoader,
-    PyPDFLoader,
-    CSVLoader,
-    UnstructuredEPubLoader,
-    UnstructuredMarkdownLoader,
-)
+from langchain_community.document_loaders import WikipediaLoader
 
 # Ensure paths relative to this file's location.
 base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -23,14 +35,55 @@ parent_dir = os.path.dirname(base_dir)
 config_path = os.path.join(parent_dir, "config.toml")
 persist_directory = os.path.join(parent_dir, "chroma")
 rag_docs_directory = os.path.join(parent_dir, "assets", "rag_docs")
+index_version_path = os.path.join(persist_directory, "index_version")
+MANIFEST_FILE = "manifest.json"
+MANIFEST_JOURNAL = "manifest.journal"
+
+# Suffixes of the build files that are only ever replaced whole (written
+# aside, then renamed over), so a new build can hardlink them.
+SHARED_FILES = (".npy", ".json")
+
+# Bump when the stored chunks change shape (e.g. new metadata fields), so the
+# next run rebuilds the collection instead of keeping outdated chunks.
+MANIFEST_VERSION = 5
 
+# Make the shared utils package importable when run as a script.
+sys.path.insert(0, parent_dir)
+from utils.embedding_cache import CachedEmbeddings
+from utils.keyword_index import KeywordIndex
+from utils.sources import is_url, get_file_extension, get_source_type
+from utils.tabular_loader import TABULAR_EXTENSIONS, load_tabular, read_rows
+from utils.document_loaders import get_parts, load_document
+from utils.table_store import TableStore
+from utils.summary_store import SummaryStore
+from utils.quantized_index import QuantizedIndexWriter
+from utils.doc_watcher import DirectoryWatcher
+from utils.retrieval import (
+    BUILDS_DIR,
+    STAGING_POINTER,
+    CATALOG_FILE,
+    KEYWORD_INDEX_FILE,
+    TABLE_STORE_FILE,
+    QUANTIZED_INDEX_DIR,
+    SUMMARY_STORE_FILE,
+    close_vectorstore,
+    read_pointer,
+    write_pointer,
+)
 
 # Load config.
 with open(config_path, "rb") as f:
     config = tomllib.load(f)
 embedding_model_id = config["utils"]["chroma"]["embedding_model_id"]
 collection_name = config["utils"]["chroma"]["collection_name"]
+vector_backend = config["utils"]["chroma"]["vector_backend"]
 config_wiki = config["utils"]["chroma"]["wikipedia"]
+config_ingest = config["utils"]["chroma"]["ingest"]
+config_cache = config["utils"]["chroma"]["embedding_cache"]
+config_tabular = config["utils"]["chroma"]["tabular"]
+config_watch = config["utils"]["chroma"]["watch"]
+config_summaries = config["utils"]["chroma"]["summaries"]
+keep_builds = config["utils"]["chroma"]["keep_builds"]
 
 # Set up argument parser for verbose mode
 parser = argparse.ArgumentParser(
@@ -39,124 +92,1147 @@ parser = argparse.ArgumentParser(
 parser.add_argument(
     "-v", "--verbose", action="store_true", help="Enable verbose output for debugging"
 )
+parser.add_argument(
+    "--rebuild",
+    action="store_true",
+    help="Build the index from scratch instead of syncing changes into a copy of it",
+)
+parser.add_argument(
+    "--skip-wikipedia",
+    action="store_true",
+    help="Don't query Wikipedia (e.g. offline); keep the articles already indexed",
+)
+parser.add_argument(
+    "--watch",
+    action="store_true",
+    help="Keep running after the sync, syncing changes to rag_docs as they happen",
+)
 args = parser.parse_args()
 
+text_splitter = RecursiveCharacterTextSplitter(
+    chunk_size=config_wiki["chunk_size"], chunk_overlap=config_wiki["chunk_overlap"]
+)
+
+
+def load_wikipedia_query(query: str) -> list:
+    """Load and split the Wikipedia articles for a query (I/O-bound, run in a thread)."""
+    docs = WikipediaLoader(
+        query=query, load_max_docs=config_wiki["load_max_docs"]
+    ).load()
+    return text_splitter.split_documents(docs)
+
 
-def load_documents_from_directory(file_path: str) -> list:
-    """Load the documents from the given local directory.
+def load_and_split_part(job: tuple) -> list:
+    """Load and split a part of a local file (CPU-bound, run in a worker process).
 
     Args:
-        directory (str): Directory path.
+        job (tuple): The file path and the part to load (see ``get_parts``).
+    """
+    file_path, part = job
+    return text_splitter.split_documents(load_document(file_path, part))
+
+
+def run_bounded(jobs, max_pending: int):
+    """Run jobs on their executors, yielding each as soon as it finishes.
+
+    At most ``max_pending`` jobs are submitted at a time, so finished results
+    never pile up faster than the caller consumes them.
+
+    Args:
+        jobs (Iterable): ``(executor, fn, arg)`` tuples.
+        max_pending (int): Maximum number of submitted, unconsumed jobs.
+
+    Yields:
+        tuple: ``(arg, future)`` for every finished job.
+    """
+    jobs = iter(jobs)
+    pending = {}
+
+    def submit(count):
+        for executor, fn, arg in islice(jobs, count):
+            pending[executor.submit(fn, arg)] = arg
+
+    submit(max_pending)
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future
+        submit(len(done))
+
+
+def hash_text(text: str) -> str:
+    """Return the hex SHA-256 digest of the given text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def new_manifest() -> dict:
+    """Return an empty manifest for the current collection and embedding model."""
+    return {
+        "version": MANIFEST_VERSION,
+        "collection_name": collection_name,
+        "embedding_model_id": embedding_model_id,
+        "vector_backend": vector_backend,
+        "sources": {},
+    }
+
+
+def load_manifest(build_dir: str):
+    """Load the indexing manifest of an index build.
+
+    The manifest maps each indexed source to its modification time and the
+    content hashes of its chunks, keyed by chunk id. It is only reused when it
+    was built with the current manifest version, collection, embedding model
+    and vector backend. Changes recorded in the journal since it was last
+    saved (see :func:`record_manifest`) are replayed onto it.
+
+    Args:
+        build_dir (str): The build directory.
 
     Returns:
-        Documents: A list of documents loaded.
-    """
-    # Only process files
-    ext = os.path.splitext(file_path)[-1].lower()
-
-    # Use appropriate loader based on file extension
-    loader = False
-    match ext:
-        case ".docx":
-            loader = Docx2txtLoader(file_path)
-        case ".xlsx":
-            loader = UnstructuredExcelLoader(file_path)
-        case ".pdf":
-            loader = PyPDFLoader(file_path)
-        case ".csv":
-            loader = CSVLoader(file_path)
-        case ".epub":
-            loader = UnstructuredEPubLoader(file_path)
-        case ".md":
-            loader = UnstructuredMarkdownLoader(file_path)
-
-    if not loader:
-        try:
-            with open(file_path, "r", encoding="utf-8") as file:
-                content = file.read()
-            loader = type(
-                "loader",
-                (object,),
-                {
-                    "load": lambda: [
-                        Document(
-                            page_content=content,
-                            metadata={"source": file_path},
-                        )
-                    ]
-                },
+        dict: The manifest, or None if it is missing, unreadable or stale.
+    """
+    manifest_path = os.path.join(build_dir, MANIFEST_FILE)
+    if not os.path.isfile(manifest_path):
+        return None
+
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            manifest = json.load(file)
+    except (OSError, ValueError):
+        if args.verbose:
+            print(f"Ignoring unreadable manifest: {manifest_path}")
+        return None
+
+    if (
+        manifest.get("version") != MANIFEST_VERSION
+        or manifest.get("collection_name") != collection_name
+        or manifest.get("embedding_model_id") != embedding_model_id
+        or manifest.get("vector_backend") != vector_backend
+    ):
+        return None
+
+    journal_path = os.path.join(build_dir, MANIFEST_JOURNAL)
+    if os.path.exists(journal_path):
+        with open(journal_path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    section, key, value = json.loads(line)
+                except ValueError:
+                    # The last line of an interrupted run may be cut short.
+                    break
+                if value is None:
+                    manifest.setdefault(section, {}).pop(key, None)
+                else:
+                    manifest.setdefault(section, {})[key] = value
+    return manifest
+
+
+def save_manifest(manifest: dict, build_dir: str):
+    """Atomically write the manifest of an index build, and clear its journal."""
+    manifest_path = os.path.join(build_dir, MANIFEST_FILE)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, separators=(",", ":"))
+    os.replace(tmp_path, manifest_path)
+    journal_path = os.path.join(build_dir, MANIFEST_JOURNAL)
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+
+
+def record_manifest(build_dir: str, changes: list):
+    """Append changes to the manifest journal of an index build.
+
+    Recording a source costs the size of its entry rather than a rewrite of
+    the whole manifest, which :func:`save_manifest` does once per run.
+
+    Args:
+        build_dir (str): The build directory.
+        changes (list): ``(section, key, value)`` tuples setting a key of a
+            manifest section (e.g. ``("sources", source, entry)``), or
+            removing it when the value is None.
+    """
+    journal_path = os.path.join(build_dir, MANIFEST_JOURNAL)
+    with open(journal_path, "a", encoding="utf-8") as file:
+        file.writelines(
+            json.dumps(change, separators=(",", ":")) + "\n" for change in changes
+        )
+
+
+class EmbeddingIngestor:
+    """Embed chunks in concurrent batches and commit each batch to the indexes.
+
+    At most ``max_concurrency`` embedding requests run at once and at most
+    twice as many batches are queued; :meth:`add` blocks beyond that, which
+    pushes back on the loaders instead of buffering chunks. Failed batches are
+    retried with exponential backoff, and chunk ids already in the collection
+    are skipped, so an interrupted run resumes where it stopped. Committed
+    chunks are also added to the BM25 keyword index.
+
+    Vectors go to ``collection``: the Chroma collection, or a
+    ``QuantizedIndexWriter`` with the ``quantized`` vector backend.
+    """
+
+    def __init__(
+        self,
+        collection,
+        keyword_index: KeywordIndex,
+        embedding: OllamaEmbeddings,
+        batch_size: int,
+        max_concurrency: int,
+        max_retries: int,
+        retry_backoff: float,
+    ):
+        self.collection = collection
+        self.keyword_index = keyword_index
+        self.embedding = embedding
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self._pool = ThreadPoolExecutor(max_concurrency)
+        self._slots = threading.BoundedSemaphore(max_concurrency * 2)
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.queued = 0
+        self.embedded = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def add(self, ids: list, docs: list) -> list:
+        """Queue chunks for embedding.
+
+        Args:
+            ids (list): Chunk ids.
+            docs (list): Chunk documents, aligned with ``ids``.
+
+        Returns:
+            list: One future per batch, resolving to the ids that failed.
+        """
+        futures = []
+        for start in range(0, len(ids), self.batch_size):
+            self._slots.acquire()
+            with self._lock:
+                self.queued += len(ids[start : start + self.batch_size])
+            future = self._pool.submit(
+                self._embed_and_commit,
+                ids[start : start + self.batch_size],
+                docs[start : start + self.batch_size],
             )
-        except Exception:
+            future.add_done_callback(lambda _: self._slots.release())
+            futures.append(future)
+        return futures
+
+    def _embed_and_commit(self, ids: list, docs: list) -> list:
+        existing = set(self.collection.get(ids=ids, include=[])["ids"])
+        todo = [(i, doc) for i, doc in zip(ids, docs) if i not in existing]
+        if todo:
+            todo_ids, todo_docs = map(list, zip(*todo))
+            for attempt in range(self.max_retries + 1):
+                try:
+                    embeddings = self.embedding.embed_documents(
+                        [doc.page_content for doc in todo_docs]
+                    )
+                    self.collection.upsert(
+                        ids=todo_ids,
+                        embeddings=embeddings,
+                        documents=[doc.page_content for doc in todo_docs],
+                        metadatas=[doc.metadata for doc in todo_docs],
+                    )
+                    break
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        with self._lock:
+                            self.failed += len(todo)
+                            if args.verbose:
+                                sources = sorted(
+                                    {doc.metadata["source"] for doc in todo_docs}
+                                )
+                                print(
+                                    f"Embedding batch failed, {len(todo)} chunks "
+                                    f"of {', '.join(sources)} skipped: {e}"
+                                )
+                        return todo_ids
+                    time.sleep(self.retry_backoff * 2**attempt)
+
+        self.keyword_index.add(ids, docs)
+        with self._lock:
+            self.embedded += len(todo)
+            self.skipped += len(existing)
             if args.verbose:
-                print(f"Skipping unsupported file: {file_path}")
+                print(self.progress())
+        return []
 
-    # Load the document and append it to the list
-    docs = loader.load()
+    def delete(self, ids: list):
+        """Delete chunks from Chroma and the keyword index."""
+        if ids:
+            self.collection.delete(ids=ids)
+            self.keyword_index.delete(ids)
 
-    return docs
+    def progress(self) -> str:
+        """Describe the ingestion progress and embedding throughput."""
+        elapsed = time.monotonic() - self._started
+        done = self.embedded + self.skipped + self.failed
+        return (
+            f"Embedded {done}/{self.queued} chunks "
+            f"({self.skipped} already stored, {self.failed} failed, "
+            f"{self.embedded / elapsed if elapsed else 0:.1f} chunks/s)"
+        )
 
+    def close(self):
+        """Wait for every queued batch to finish."""
+        self._pool.shutdown(wait=True)
 
-def main():
-    """Load/refresh the chroma db locally based on articles from config and document search path."""
-    if args.verbose:
-        print("Verbose mode enabled.")
-        print(f"Loading configuration from {config_path}")
 
-    docs = []
+def write_index_version(manifest: dict):
+    """Record a fingerprint of every indexed chunk id and source summary.
+
+    The file is only rewritten when the indexed chunks changed, so readers
+    (e.g. the API's answer cache) can watch its mtime to drop stale state.
+    """
+    chunk_ids = sorted(
+        chunk_id
+        for entry in manifest["sources"].values()
+        for chunk_id in entry["chunks"]
+    )
+    summary_hashes = sorted(manifest.get("summaries", {}).values())
+    version = hash_text("\n".join(chunk_ids + summary_hashes))
+    try:
+        with open(index_version_path, "r", encoding="utf-8") as file:
+            if file.read() == version:
+                return
+    except OSError:
+        pass
+
+    tmp_path = f"{index_version_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(version)
+    os.replace(tmp_path, index_version_path)
     if args.verbose:
-        print("Starting Wikipedia article loading...")
+        print(f"Index version updated: {version}")
 
-    for query in config_wiki["queries"]:
-        if args.verbose:
-            print(f"Loading documents for query: {query}")
-        docs.extend(
-            WikipediaLoader(
-                query=query, load_max_docs=config_wiki["load_max_docs"]
-            ).load()
+
+def write_catalog(manifest: dict, build_dir: str):
+    """Write the source catalog (source, type and chunk count) the Dash app lists."""
+    catalog_path = os.path.join(build_dir, CATALOG_FILE)
+    catalog = [
+        {
+            "source": source,
+            "ext": get_source_type(source),
+            "chunk_count": len(entry["chunks"]),
+        }
+        for source, entry in sorted(manifest["sources"].items())
+    ]
+    tmp_path = f"{catalog_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(catalog, file, indent=2)
+    os.replace(tmp_path, catalog_path)
+
+
+def sync_source(
+    ingestor: EmbeddingIngestor,
+    manifest: dict,
+    pending: list,
+    source: str,
+    splits: Iterable,
+    **entry,
+):
+    """Bring the chunks stored for one source in line with its current splits.
+
+    Chunk ids are derived from the source and the chunk content, so unchanged
+    chunks keep their ids and only new or edited chunks are embedded. Chunks
+    that are no longer produced by the source are deleted. The manifest entry
+    is only recorded by :func:`flush_pending` once its batches are committed.
+
+    ``splits`` may be a generator: new chunks are handed to the ingestor a
+    batch at a time as they are produced, so only their ids and hashes are
+    kept for the whole source. If the generator fails part way, the chunks
+    already queued are recorded alongside the old ones, without an ``mtime``
+    so the next run loads the source again, and the error is re-raised.
+
+    Args:
+        ingestor (EmbeddingIngestor): Embeds, commits and deletes chunks.
+        manifest (dict): The manifest.
+        pending (list): Sources waiting on their batches, appended to.
+        source (str): The source path or URL.
+        splits (Iterable): The current chunks of the source.
+        **entry: Extra fields to record for the source (e.g. ``mtime``).
+    """
+    old_chunks = manifest["sources"].get(source, {}).get("chunks", {})
+
+    # Stored as metadata so searches can filter by type with a `where` clause.
+    source_metadata = {
+        "ext": "" if is_url(source) else get_file_extension(source),
+        "source_type": get_source_type(source),
+    }
+
+    new_chunks = {}
+    new_ids = []
+    new_docs = []
+    added = 0
+    futures = []
+    try:
+        for doc in splits:
+            doc.metadata.update(source_metadata)
+            content_hash = hash_text(doc.page_content)
+            chunk_id = hash_text(f"{source}\0{content_hash}")
+            if chunk_id in new_chunks:
+                continue
+            new_chunks[chunk_id] = content_hash
+            if chunk_id not in old_chunks:
+                new_ids.append(chunk_id)
+                new_docs.append(doc)
+            if len(new_ids) == ingestor.batch_size:
+                futures += ingestor.add(new_ids, new_docs)
+                added += len(new_ids)
+                new_ids, new_docs = [], []
+    except Exception:
+        futures += ingestor.add(new_ids, new_docs)
+        if old_chunks or new_chunks:
+            entry.pop("mtime", None)
+            pending.append(
+                (source, {**entry, "chunks": {**old_chunks, **new_chunks}}, futures)
+            )
+        raise
+
+    futures += ingestor.add(new_ids, new_docs)
+    added += len(new_ids)
+    stale_ids = [chunk_id for chunk_id in old_chunks if chunk_id not in new_chunks]
+    ingestor.delete(stale_ids)
+
+    if args.verbose and (added or stale_ids):
+        print(f"{source}: {added} chunks to add, {len(stale_ids)} removed")
+
+    pending.append((source, {**entry, "chunks": new_chunks}, futures))
+
+
+def flush_pending(
+    manifest: dict, build_dir: str, pending: list, block: bool = False
+) -> list:
+    """Record the sources whose batches have all finished in the manifest.
+
+    Chunks from failed batches are left out, and the source's mtime dropped,
+    so the next run loads the source again and retries them.
+
+    Args:
+        manifest (dict): The manifest, updated in place.
+        build_dir (str): The build directory whose manifest journal records them.
+        pending (list): ``(source, entry, futures)`` tuples from :func:`sync_source`.
+        block (bool): Wait for every pending source instead of only finished ones.
+
+    Returns:
+        list: The sources that are still pending.
+    """
+    still_pending = []
+    changes = []
+    for source, entry, futures in pending:
+        if not block and not all(future.done() for future in futures):
+            still_pending.append((source, entry, futures))
+            continue
+        failed_ids = [i for future in futures for i in future.result()]
+        for chunk_id in failed_ids:
+            entry["chunks"].pop(chunk_id, None)
+        if failed_ids:
+            entry.pop("mtime", None)
+        manifest["sources"][source] = entry
+        changes.append(("sources", source, entry))
+
+    if changes:
+        record_manifest(build_dir, changes)
+    return still_pending
+
+
+def table_summaries(table_store: TableStore, file_path: str) -> list:
+    """Return one chunk per table of a source too large to embed row by row.
+
+    Each chunk gives the table's columns, size and first rows, so searches
+    still find the source; its contents are queried through the table store.
+    """
+    return [
+        Document(
+            page_content=table_store.describe([table], config_tabular["sample_rows"]),
+            metadata={"source": file_path, "table": table["name"]},
         )
+        for table in table_store.tables(file_path)
+    ]
 
-    # Assuming load_documents_from_directory expects full file paths
-    for file_name in os.listdir(rag_docs_directory):
-        file_path = os.path.join(rag_docs_directory, file_name)
-        if os.path.isfile(file_path):
+
+def summary_hash(entry: dict) -> str:
+    """Hash the chunks of a source and the settings its summary is made from.
+
+    A change to any setting shaping the summaries makes them all stale.
+    """
+    settings = json.dumps(
+        {
+            key: config_summaries[key]
+            for key in ("model_id", "group_size", "max_chars", "prompt", "chat_kwargs")
+        },
+        sort_keys=True,
+    )
+    return hash_text("\n".join([settings, *entry["chunks"]]))
+
+
+def summarize_sources(
+    manifest: dict,
+    keyword_index: KeywordIndex,
+    summary_store: SummaryStore,
+    embedding: CachedEmbeddings,
+    build_dir: str,
+):
+    """Summarize the sources whose chunks changed since they were summarized.
+
+    A source's chunks are summarized ``group_size`` at a time, then those
+    summaries likewise, until a single summary of the whole source is left.
+    It is embedded along with the source's name, so the API can search the
+    summaries for questions about a whole source. The manifest's ``summaries`` map each source to a hash of the chunks and
+    settings its summary was made from, and is recorded after every source,
+    so an interrupted run carries on where it stopped. A source that can't be
+    summarized keeps no summary and is retried by the next run.
+
+    Args:
+        manifest (dict): The manifest.
+        keyword_index (KeywordIndex): The chunks of the build.
+        summary_store (SummaryStore): The summaries of the build.
+        embedding (CachedEmbeddings): The embedding client.
+        build_dir (str): The build directory.
+    """
+    chain = (
+        ChatPromptTemplate.from_messages([("human", config_summaries["prompt"])])
+        | ChatOllama(
+            model=config_summaries["model_id"], **config_summaries["chat_kwargs"]
+        )
+        | StrOutputParser()
+    )
+    max_chars = config_summaries["max_chars"]
+
+    def summarize(title: str, texts: tuple) -> str:
+        summary = chain.invoke({"title": title, "text": "\n\n".join(texts)}).strip()
+        if len(summary) > max_chars:
+            cut = summary.rfind(" ", 0, max_chars)
+            summary = summary[: cut if cut > 0 else max_chars]
+        return summary
+
+    summaries = manifest.setdefault("summaries", {})
+    for source in set(summaries) - set(manifest["sources"]):
+        del summaries[source]
+    summary_store.remove(
+        [source for source in summary_store.sources() if source not in summaries]
+    )
+
+    with ThreadPoolExecutor(config_summaries["workers"]) as pool:
+        for source, entry in manifest["sources"].items():
+            entry_hash = summary_hash(entry)
+            if summaries.get(source) == entry_hash:
+                continue
+            docs = keyword_index.get(list(entry["chunks"]))
+            if not docs:
+                summaries.pop(source, None)
+                summary_store.remove([source])
+                continue
+            title = (
+                docs[0].metadata.get("title")
+                or os.path.splitext(os.path.basename(source))[0]
+            )
+            texts = [doc.page_content for doc in docs]
+            try:
+                while True:
+                    texts = list(
+                        pool.map(
+                            partial(summarize, title),
+                            batched(texts, config_summaries["group_size"]),
+                        )
+                    )
+                    if len(texts) == 1:
+                        break
+                name = title if is_url(source) else os.path.basename(source)
+                vector = embedding.embed_documents([f"{name}\n\n{texts[0]}"])[0]
+            except Exception as e:
+                summaries.pop(source, None)
+                summary_store.remove([source])
+                if args.verbose:
+                    print(f"Unable to summarize {source!r}: {e}")
+                continue
+
+            summary_store.put(source, get_source_type(source), title, texts[0], vector)
+            summaries[source] = entry_hash
+            record_manifest(build_dir, [("summaries", source, entry_hash)])
             if args.verbose:
-                print(f"Loading documents from {file_path}")
-            docs.extend(load_documents_from_directory(file_path))
+                print(f"{source}: summarized {len(docs)} chunks")
+
 
+def remove_source(
+    ingestor: EmbeddingIngestor, manifest: dict, build_dir: str, source: str
+):
+    """Delete every chunk of a source that no longer exists."""
+    chunk_ids = list(manifest["sources"].pop(source, {}).get("chunks", {}))
+    ingestor.delete(chunk_ids)
     if args.verbose:
-        print(f"Total documents loaded: {len(docs)}")
-        print("Splitting documents into chunks...")
+        print(f"{source}: removed, {len(chunk_ids)} chunks deleted")
+    record_manifest(build_dir, [("sources", source, None)])
 
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=config_wiki["chunk_size"], chunk_overlap=config_wiki["chunk_overlap"]
-    )
-    splits = text_splitter.split_documents(docs)
 
+def clone_file(source_path: str, build_path: str):
+    """Copy a file, sharing its blocks where the filesystem supports it.
+
+    ``copy_file_range`` reflinks the file on copy-on-write filesystems (e.g.
+    Btrfs, XFS), so its data takes no extra disk until one copy is modified;
+    elsewhere it copies in the kernel. Other platforms fall back to a plain copy.
+    """
+    if hasattr(os, "copy_file_range"):
+        try:
+            with open(source_path, "rb") as src, open(build_path, "wb") as dst:
+                remaining = os.fstat(src.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                    if not copied:
+                        break
+                    remaining -= copied
+            if remaining <= 0:
+                return
+        except OSError:
+            pass
+    shutil.copyfile(source_path, build_path)
+
+
+def copy_index(source_dir: str, build_dir: str):
+    """Copy an index build, sharing the files a sync can't modify in place.
+
+    Files that are only ever replaced whole (the quantized index arrays, the
+    manifest and the catalog) are hardlinked; the rest (SQLite files, Chroma's
+    segments) are cloned, which shares their blocks on copy-on-write
+    filesystems. A SQLite file with a non-empty write-ahead log is read
+    through the backup API instead, which gives a consistent copy even while
+    the API or the Dash app hold it open.
+    """
+    for root, _, file_names in os.walk(source_dir):
+        target_dir = os.path.join(build_dir, os.path.relpath(root, source_dir))
+        os.makedirs(target_dir, exist_ok=True)
+        for file_name in file_names:
+            source_path = os.path.join(root, file_name)
+            build_path = os.path.join(target_dir, file_name)
+            if ".sqlite3-" in file_name:
+                continue
+            if file_name.endswith(SHARED_FILES):
+                try:
+                    os.link(source_path, build_path)
+                    continue
+                except OSError:
+                    pass
+            wal_path = f"{source_path}-wal"
+            if os.path.exists(wal_path) and os.path.getsize(wal_path):
+                with (
+                    closing(sqlite3.connect(source_path)) as src,
+                    closing(sqlite3.connect(build_path)) as dst,
+                ):
+                    src.backup(dst)
+            else:
+                clone_file(source_path, build_path)
+
+
+def prepare_build(rebuild: bool = False) -> tuple:
+    """Pick the directory this run builds the index in.
+
+    An unfinished build (from an interrupted run) is resumed. Otherwise the
+    published build is copied (see :func:`copy_index`), so only changed
+    sources need embedding, or a new directory is started when rebuilding or
+    when nothing is published. Published builds are never modified, since the
+    API and the app read them without locks.
+
+    Args:
+        rebuild (bool): Start from an empty build (``--rebuild``).
+
+    Returns:
+        tuple: The build directory, and the directory it was copied from or None.
+    """
+    staging_dir = read_pointer(persist_directory, STAGING_POINTER)
+    if staging_dir and os.path.isdir(staging_dir):
+        if not rebuild:
+            if args.verbose:
+                print(f"Resuming unfinished build {staging_dir}")
+            return staging_dir, None
+        shutil.rmtree(staging_dir)
+
+    # Milliseconds keep ids unique (and sortable) between quick syncs in --watch mode.
+    now = time.time()
+    build_id = (
+        f"{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}"
+        f"{int(now * 1000) % 1000:03d}-{os.getpid()}"
+    )
+    build_dir = os.path.join(persist_directory, BUILDS_DIR, build_id)
+    current_dir = read_pointer(persist_directory)
+    if current_dir and os.path.isdir(current_dir) and not rebuild:
+        copy_index(current_dir, build_dir)
+    else:
+        current_dir = None
+        os.makedirs(build_dir)
+    write_pointer(persist_directory, build_dir, STAGING_POINTER)
     if args.verbose:
-        print(f"Total document chunks created: {len(splits)}")
-        print(f"Embedding model: {embedding_model_id}")
+        print(f"Building index in {build_dir}")
+    return build_dir, current_dir
+
 
-    embedding = OllamaEmbeddings(model=embedding_model_id)
-    vectorstore = Chroma(
-        collection_name=collection_name,
-        embedding_function=embedding,
-        persist_directory=persist_directory,
+def prune_builds():
+    """Delete old builds, keeping the ``keep_builds`` newest ones.
+
+    Processes still reading a deleted build switch to the published one on
+    their next search.
+    """
+    builds_dir = os.path.join(persist_directory, BUILDS_DIR)
+    keep = {
+        read_pointer(persist_directory),
+        read_pointer(persist_directory, STAGING_POINTER),
+    }
+    build_dirs = sorted(
+        os.path.join(builds_dir, name) for name in os.listdir(builds_dir)
     )
+    for build_dir in build_dirs[: -keep_builds or None]:
+        if build_dir not in keep:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            if args.verbose:
+                print(f"Deleted old build {build_dir}")
 
-    try:
-        vectorstore.reset_collection()
+
+def is_up_to_date(skip_wikipedia: bool) -> bool:
+    """Whether the published build is in sync with rag_docs and the config.
+
+    Checked from the published manifest and the files' mtimes before any
+    build is copied, so a sync with nothing to do costs a directory listing.
+    Querying Wikipedia counts as a change, since articles can only be
+    compared once loaded, as do sources left to retry by an earlier run.
+
+    Args:
+        skip_wikipedia (bool): Keep the indexed articles instead of querying.
+    """
+    staging_dir = read_pointer(persist_directory, STAGING_POINTER)
+    if staging_dir and os.path.isdir(staging_dir):
+        return False
+    current_dir = read_pointer(persist_directory)
+    manifest = load_manifest(current_dir) if current_dir else None
+    if manifest is None:
+        return False
+
+    sources = manifest["sources"]
+    if not skip_wikipedia and (
+        config_wiki["queries"] or any("query" in entry for entry in sources.values())
+    ):
+        return False
+
+    file_paths = set()
+    for file_name in os.listdir(rag_docs_directory):
+        file_path = os.path.join(rag_docs_directory, file_name)
+        if not os.path.isfile(file_path):
+            continue
+        file_paths.add(file_path)
+        if file_path in sources:
+            if sources[file_path].get("mtime") != os.path.getmtime(file_path):
+                return False
+            continue
+        # Files no loader handles are never indexed.
+        try:
+            if file_path.lower().endswith(TABULAR_EXTENSIONS) or get_parts(file_path):
+                return False
+        except Exception:
+            return False
+    if any(
+        source not in file_paths
+        for source, entry in sources.items()
+        if "query" not in entry
+    ):
+        return False
+
+    if not config_summaries["enabled"]:
+        return "summaries" not in manifest and not os.path.exists(
+            os.path.join(current_dir, SUMMARY_STORE_FILE)
+        )
+    # Sources without chunks have nothing to summarize.
+    return manifest.get("summaries") == {
+        source: summary_hash(entry)
+        for source, entry in sources.items()
+        if entry["chunks"]
+    }
+
+
+def sync(
+    embedding: CachedEmbeddings,
+    rebuild: bool,
+    skip_wikipedia: bool,
+    changed: set = None,
+) -> bool:
+    """Build the index from the Wikipedia queries and rag_docs, and publish it.
+
+    Args:
+        embedding (CachedEmbeddings): The embedding client.
+        rebuild (bool): Start from an empty build instead of the published one.
+        skip_wikipedia (bool): Keep the indexed articles instead of querying.
+        changed (set): Paths of the rag_docs files known to have changed (e.g.
+            by ``--watch``). Only those, and files left to retry by an earlier
+            run, are checked; every other indexed file is kept as it is. None
+            checks every file.
+
+    Returns:
+        bool: Whether a new build was published (False if nothing changed).
+    """
+    if not rebuild and is_up_to_date(skip_wikipedia):
         if args.verbose:
-            print(f"Collection {collection_name} reset successfully.")
-    except Exception as e:
-        raise Exception("Unable to reset collection") from e
+            print("No changes, the published build is up to date.")
+        return False
 
-    if args.verbose:
-        print(f"Persisting documents to Chroma DB in {persist_directory}...")
+    build_dir, copied_from = prepare_build(rebuild)
+    # Close the build's clients even on failure: in --watch mode every batch
+    # opens new ones, and Chroma caches a client per directory until closed.
+    with ExitStack() as resources:
+        if vector_backend == "quantized":
+            collection = QuantizedIndexWriter(
+                os.path.join(build_dir, QUANTIZED_INDEX_DIR)
+            )
+        else:
+            vectorstore = Chroma(
+                collection_name=collection_name,
+                embedding_function=embedding,
+                persist_directory=build_dir,
+            )
+            resources.callback(close_vectorstore, vectorstore)
+            collection = vectorstore._collection  # pylint: disable=W0212
+
+        keyword_index = KeywordIndex(os.path.join(build_dir, KEYWORD_INDEX_FILE))
+        resources.callback(keyword_index.close)
+        table_store = TableStore(os.path.join(build_dir, TABLE_STORE_FILE))
+        resources.callback(table_store.close)
+
+        manifest = load_manifest(build_dir)
+        if manifest is None:
+            try:
+                if vector_backend == "quantized":
+                    collection.clear()
+                    # Drop the Chroma collection of a build copied from before the switch.
+                    if os.path.exists(os.path.join(build_dir, "chroma.sqlite3")):
+                        old_vectorstore = Chroma(
+                            collection_name=collection_name, persist_directory=build_dir
+                        )
+                        old_vectorstore.delete_collection()
+                        close_vectorstore(old_vectorstore)
+                else:
+                    vectorstore.reset_collection()
+                    collection = vectorstore._collection  # pylint: disable=W0212
+                keyword_index.clear()
+                table_store.clear()
+                # Summarized again from the new chunks, into a store of the current shape.
+                summaries_path = os.path.join(build_dir, SUMMARY_STORE_FILE)
+                if os.path.exists(summaries_path):
+                    os.remove(summaries_path)
+                if args.verbose:
+                    print(f"Collection {collection_name} reset successfully.")
+            except Exception as e:
+                raise Exception("Unable to reset collection") from e
+            manifest = new_manifest()
+            save_manifest(manifest, build_dir)
+        published_manifest = json.loads(json.dumps(manifest)) if copied_from else None
+
+        ingestor = EmbeddingIngestor(
+            collection,
+            keyword_index,
+            embedding,
+            batch_size=config_ingest["batch_size"],
+            max_concurrency=config_ingest["embed_workers"],
+            max_retries=config_ingest["max_retries"],
+            retry_backoff=config_ingest["retry_backoff"],
+        )
+
+        if args.verbose:
+            print(f"Syncing documents to Chroma DB in {build_dir}...")
+
+        seen_sources = set()
+        pending = []
+        wiki_queries = config_wiki["queries"]
+        if skip_wikipedia:
+            wiki_queries = []
+            seen_sources.update(
+                source
+                for source, entry in manifest["sources"].items()
+                if "query" in entry
+            )
+
+        if changed is None:
+            file_paths = [
+                os.path.join(rag_docs_directory, file_name)
+                for file_name in os.listdir(rag_docs_directory)
+            ]
+        else:
+            retry = {
+                source
+                for source, entry in manifest["sources"].items()
+                if "mtime" not in entry and "query" not in entry
+            }
+            file_paths = set(changed) | retry
+            seen_sources.update(
+                source for source in manifest["sources"] if source not in file_paths
+            )
+
+        file_mtimes = {}
+        for file_path in file_paths:
+            if not os.path.isfile(file_path):
+                continue
+            seen_sources.add(file_path)
+            mtime = os.path.getmtime(file_path)
+            if manifest["sources"].get(file_path, {}).get("mtime") != mtime:
+                file_mtimes[file_path] = mtime
+
+        if args.verbose:
+            print(
+                f"Loading {len(wiki_queries)} Wikipedia queries and "
+                f"{len(file_mtimes)} new or changed files..."
+            )
+
+        # Files are loaded in parts (page ranges for PDFs), so one large file is
+        # spread over every worker. Files no loader handles are skipped; like
+        # deleted ones, any chunks they had are dropped.
+        file_parts = {}
+        for file_path in file_mtimes:
+            if file_path.lower().endswith(TABULAR_EXTENSIONS):
+                continue
+            try:
+                parts = get_parts(file_path, config_ingest["part_pages"])
+            except Exception as e:
+                if args.verbose:
+                    print(f"Unable to load {file_path!r}, keeping indexed chunks: {e}")
+                continue
+            if parts:
+                file_parts[file_path] = parts
+            else:
+                seen_sources.discard(file_path)
+                if args.verbose:
+                    print(f"Skipping unsupported file: {file_path}")
+        loaded_parts = {}
+
+        file_workers = config_ingest["file_workers"] or os.cpu_count()
+        wiki_workers = config_ingest["wikipedia_workers"]
+        with (
+            ThreadPoolExecutor(wiki_workers) as wiki_pool,
+            ProcessPoolExecutor(file_workers) as file_pool,
+        ):
+            jobs = [
+                (wiki_pool, load_wikipedia_query, query) for query in wiki_queries
+            ] + [
+                (file_pool, load_and_split_part, (file_path, part))
+                for file_path, parts in file_parts.items()
+                for part in parts
+            ]
+
+            # Chunks are synced as each source finishes loading, while the pools
+            # keep working on the next ones.
+            for arg, future in run_bounded(jobs, file_workers + wiki_workers):
+                if isinstance(arg, tuple):
+                    file_path, part = arg
+                    results = loaded_parts.setdefault(file_path, {})
+                    results[part] = future
+                    if len(results) < len(file_parts[file_path]):
+                        continue
+                    del loaded_parts[file_path]
+                    try:
+                        # Parts finish in any order; their chunks go in file order.
+                        splits = [
+                            doc
+                            for part in file_parts[file_path]
+                            for doc in results[part].result()
+                        ]
+                    except Exception as e:
+                        # Keep what was indexed for this file rather than dropping it.
+                        if args.verbose:
+                            print(
+                                f"Unable to load {file_path!r}, keeping indexed chunks: {e}"
+                            )
+                        continue
+                    sync_source(
+                        ingestor,
+                        manifest,
+                        pending,
+                        file_path,
+                        splits,
+                        mtime=file_mtimes[file_path],
+                    )
+                else:
+                    try:
+                        splits = future.result()
+                    except Exception as e:
+                        # Keep what was indexed for this source rather than dropping it.
+                        if args.verbose:
+                            print(
+                                f"Unable to load {arg!r}, keeping indexed chunks: {e}"
+                            )
+                        seen_sources.update(
+                            source
+                            for source, entry in manifest["sources"].items()
+                            if entry.get("query") == arg
+                        )
+                        continue
+
+                    splits_by_source = {}
+                    for doc in splits:
+                        splits_by_source.setdefault(doc.metadata["source"], []).append(
+                            doc
+                        )
+                    for source, source_splits in splits_by_source.items():
+                        seen_sources.add(source)
+                        sync_source(
+                            ingestor,
+                            manifest,
+                            pending,
+                            source,
+                            source_splits,
+                            query=arg,
+                        )
+                pending = flush_pending(manifest, build_dir, pending)
+
+        # Tabular files are streamed into the table store, then a row group at a
+        # time straight into the ingestor, whose bounded queue holds the reader
+        # back, so memory stays flat however large they are. Tables too large to
+        # embed row by row only get a chunk describing them.
+        for file_path, mtime in file_mtimes.items():
+            if not file_path.lower().endswith(TABULAR_EXTENSIONS):
+                continue
+            try:
+                row_count = table_store.write_source(file_path, read_rows(file_path))
+                if row_count > config_tabular["embed_max_rows"]:
+                    splits = table_summaries(table_store, file_path)
+                else:
+                    splits = load_tabular(file_path, config_tabular["chunk_size"])
+                sync_source(ingestor, manifest, pending, file_path, splits, mtime=mtime)
+            except Exception as e:
+                if args.verbose:
+                    print(f"Unable to load {file_path!r}, keeping indexed chunks: {e}")
+            pending = flush_pending(manifest, build_dir, pending)
+
+        ingestor.close()
+        flush_pending(manifest, build_dir, pending, block=True)
+        if args.verbose:
+            print(ingestor.progress())
+
+        for source in set(manifest["sources"]) - seen_sources:
+            remove_source(ingestor, manifest, build_dir, source)
+            table_store.remove_source(source)
+        if vector_backend == "quantized":
+            collection.finalize()
+
+        summaries_path = os.path.join(build_dir, SUMMARY_STORE_FILE)
+        if config_summaries["enabled"]:
+            summary_store = resources.enter_context(
+                closing(SummaryStore(summaries_path))
+            )
+            summarize_sources(
+                manifest, keyword_index, summary_store, embedding, build_dir
+            )
+        elif "summaries" in manifest or os.path.exists(summaries_path):
+            # Drop the summaries of a copied build, which would otherwise go stale.
+            manifest.pop("summaries", None)
+            if os.path.exists(summaries_path):
+                os.remove(summaries_path)
+
+    save_manifest(manifest, build_dir)
+    if manifest == published_manifest:
+        # Nothing changed: keep serving the published build.
+        shutil.rmtree(build_dir, ignore_errors=True)
+        os.remove(os.path.join(persist_directory, STAGING_POINTER))
+        if args.verbose:
+            print("No changes, the published build is up to date.")
+        return False
 
-    vectorstore.add_documents(splits)
+    # Publish the build, then clear the staging pointer.
+    write_catalog(manifest, build_dir)
+    write_pointer(persist_directory, build_dir)
+    os.remove(os.path.join(persist_directory, STAGING_POINTER))
+    write_index_version(manifest)
+    prune_builds()
 
     if args.verbose:
+        print(
+            f"Total sources indexed: {len(manifest['sources'])}, chunks: "
+            f"{sum(len(e['chunks']) for e in manifest['sources'].values())}"
+        )
         print("Chroma DB updated successfully.")
+    return True
+
+
+def notify(build_dir: str):
+    """Tell the running API and app that a new build was published.
+
+    They'd switch to it on their next request anyway; this lets them open it
+    (and re-read the catalog) right away instead. Processes that aren't
+    running are skipped.
+    """
+    body = json.dumps({"index_dir": build_dir}).encode("utf-8")
+    for url in config_watch["notify_urls"]:
+        request = urllib.request.Request(
+            url, data=body, headers={"Content-Type": "application/json"}
+        )
+        try:
+            with urllib.request.urlopen(
+                request, timeout=config_watch["notify_timeout"]
+            ):
+                pass
+        except (OSError, ValueError) as e:
+            if args.verbose:
+                print(f"Unable to notify {url}: {e}")
+
+
+def watch(embedding: CachedEmbeddings):
+    """Keep the index in sync with rag_docs until interrupted.
+
+    Each batch of changes (see ``DirectoryWatcher``) runs one incremental
+    sync of the changed paths only: created and modified files are loaded,
+    split and embedded, deleted ones dropped, and the rest of rag_docs isn't
+    looked at. Changes made during a sync make up the next batch. A failed
+    sync leaves its build to be resumed by the next one, whose batch takes
+    over the failed batch's paths.
+    """
+    watcher = DirectoryWatcher(
+        rag_docs_directory,
+        poll_interval=config_watch["poll_interval"],
+        debounce=config_watch["debounce"],
+        max_batches=config_watch["max_batches"],
+    )
+    watcher.start()
+    if args.verbose:
+        print(f"Watching {rag_docs_directory} for changes...")
+    failed = set()
+    try:
+        for changed in watcher.batches():
+            if args.verbose:
+                print(f"{len(changed)} files changed: {sorted(changed)}")
+            changed |= failed
+            try:
+                if sync(embedding, rebuild=False, skip_wikipedia=True, changed=changed):
+                    notify(read_pointer(persist_directory))
+                failed = set()
+            except Exception as e:
+                failed = changed
+                print(
+                    f"Sync failed, retrying with the next change: {e}", file=sys.stderr
+                )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+
+
+def main():
+    """Load/refresh the chroma db locally based on articles from config and document search path."""
+    if args.verbose:
+        print("Verbose mode enabled.")
+        print(f"Loading configuration from {config_path}")
+
+    if args.verbose:
+        print(f"Embedding model: {embedding_model_id}")
+
+    embedding = CachedEmbeddings(
+        OllamaEmbeddings(model=embedding_model_id),
+        model_id=embedding_model_id,
+        path=os.path.join(parent_dir, config_cache["path"]),
+        max_size_mb=config_cache["max_size_mb"],
+    )
+
+    published = sync(embedding, args.rebuild, args.skip_wikipedia)
+    if args.watch:
+        if published:
+            notify(read_pointer(persist_directory))
+        watch(embedding)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+"""Precomputed per-source summaries, and the retrieval tier answering from them."""
+
+import os
+import sqlite3
+import threading
+from typing import Any
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from utils.tracing import span
+
+
+class SummaryStore:
+    """One summary per source, written by setup_chroma_db.py next to the index.
+
+    Each row keeps the source's type, its title (the Wikipedia article title,
+    or the file name without its extension), its summary and the embedding
+    of the summary, so the summaries can be searched like a small collection
+    of their own. The manifest records what each summary was made from, so
+    unchanged sources aren't summarized again.
+
+    Args:
+        path (str): Path of the SQLite file.
+        readonly (bool): Open an existing store for lookups only.
+    """
+
+    def __init__(self, path: str, readonly: bool = False):
+        self._lock = threading.Lock()
+        if readonly:
+            self._conn = sqlite3.connect(
+                f"file:{path}?mode=ro", uri=True, check_same_thread=False
+            )
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            with self._lock, self._conn:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    """
+                    CREATE TABLE IF NOT EXISTS summaries (
+                        source TEXT PRIMARY KEY,
+                        source_type TEXT,
+                        title TEXT NOT NULL,
+                        summary TEXT NOT NULL,
+                        vector BLOB NOT NULL
+                    )
+                    """
+                )
+        # One row per source, so every summary vector stays in memory.
+        with self._lock:
+            self._vectors = {
+                source: np.frombuffer(vector, dtype=np.float32)
+                for source, vector in self._conn.execute(
+                    "SELECT source, vector FROM summaries"
+                )
+            }
+        self._matrix = None
+
+    def close(self):
+        """Close the connection."""
+        self._conn.close()
+
+    def sources(self) -> list:
+        """Return the sources with a summary."""
+        return list(self._vectors)
+
+    def put(
+        self, source: str, source_type: str, title: str, summary: str, vector: list
+    ):
+        """Store a source's summary and its embedding, replacing any previous one."""
+        vector = np.asarray(vector, dtype=np.float32)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)",
+                (source, source_type, title, summary, vector.tobytes()),
+            )
+            self._vectors[source] = vector
+            self._matrix = None
+
+    def remove(self, sources: list):
+        """Drop the summaries of sources."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM summaries WHERE source = ?", [(s,) for s in sources]
+            )
+            for source in sources:
+                self._vectors.pop(source, None)
+            self._matrix = None
+
+    def search(self, vector: list, k: int = 1, min_score: float = 0.0) -> list:
+        """Return the summaries most similar to a query embedding.
+
+        Args:
+            vector (list): The query embedding.
+            k (int): Maximum number of summaries to return.
+            min_score (float): Cosine similarity a summary needs to be returned.
+
+        Returns:
+            list: Summary documents, best first, with the ``source``,
+            ``source_type``, ``title`` and ``score`` in their metadata.
+        """
+        with self._lock:
+            if self._matrix is None:
+                sources = list(self._vectors)
+                matrix = np.array([self._vectors[s] for s in sources], np.float32)
+                if sources:
+                    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                    matrix /= np.maximum(norms, 1e-12)
+                self._matrix = sources, matrix
+            sources, matrix = self._matrix
+        if not sources:
+            return []
+
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ (query / (np.linalg.norm(query) or 1.0))
+        best = [
+            (sources[i], float(scores[i]))
+            for i in np.argsort(-scores)[:k]
+            if scores[i] >= min_score
+        ]
+        if not best:
+            return []
+
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, source_type, title, summary FROM summaries "
+                f"WHERE source IN ({', '.join('?' * len(best))})",
+                [source for source, _ in best],
+            ).fetchall()
+        docs = {
+            source: Document(
+                page_content=summary,
+                metadata={
+                    "source": source,
+                    "source_type": source_type,
+                    "title": title,
+                    "summary": True,
+                },
+            )
+            for source, source_type, title, summary in rows
+        }
+        results = []
+        for source, score in best:
+            if source in docs:
+                docs[source].metadata["score"] = score
+                results.append(docs[source])
+        return results
+
+
+class SummaryTierRetriever(BaseRetriever):
+    """Answer questions about a whole source from its precomputed summary.
+
+    The build's summaries are a first retrieval tier: a question is embedded
+    and scored against every summary (cosine similarity), and when the best
+    scores at least ``min_score``, the ``max_summaries`` best summaries that
+    do are its whole context. A question about a whole source ("what is
+    Resume.docx about?") is then answered from one short text covering all of
+    it instead of from a few chunks. Every other question, or when the build
+    has no summaries, goes to ``retriever``.
+    """
+
+    retriever: Any
+    service: Any
+    max_summaries: int = 1
+    min_score: float = 0.75
+
+    def find(self, query: str) -> list:
+        """Return the summaries answering a question, or an empty list."""
+        with self.service.build() as build:
+            if not build.summaries:
+                return []
+            with span("summaries"):
+                vector = self.service.embedding.embed_query(query)
+                return build.summaries.search(
+                    vector, self.max_summaries, self.min_score
+                )
+
+    def batch_search(self, queries: list) -> list:
+        """Retrieve the contexts of several questions, summaries first."""
+        results = [self.find(query) for query in queries]
+        rest = [i for i, docs in enumerate(results) if not docs]
+        if rest:
+            contexts = self.retriever.batch_search([queries[i] for i in rest])
+            for i, docs in zip(rest, contexts):
+                results[i] = docs
+        return results
+
+    def _get_relevant_documents(
+        self, query: str, *, run_manager: CallbackManagerForRetrieverRun
+    ) -> list[Document]:
+        return self.find(query) or self.retriever.invoke(
+            query, config={"callbacks": run_manager.get_child()}
+        )
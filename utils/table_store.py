@@ -0,0 +1,345 @@
+"""SQLite copy of the tabular sources, queried with read-only SQL by the RAG API."""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+from typing import Iterable
+from itertools import groupby, islice
+from operator import itemgetter
+from utils.tabular_loader import format_row
+
+# Rows inserted per executemany call while a table is written.
+_INSERT_BATCH = 1_000
+
+# Statements generated SQL may run: reading tables and calling functions only.
+_READ_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+}
+
+_INTEGER = re.compile(r"-?(0|[1-9]\d*)")
+_REAL = re.compile(r"-?(0|[1-9]\d*)?\.\d+([eE][-+]?\d+)?|-?(0|[1-9]\d*)[eE][-+]?\d+")
+
+
+def _terms(text: str) -> set:
+    return set(re.findall(r"[^\W_]{2,}", text.casefold()))
+
+
+def _identifier(text: str, taken: set, default: str) -> str:
+    """Return a lowercase SQL identifier for ``text`` not already in ``taken``."""
+    name = re.sub(r"[^\w]+", "_", str(text).casefold()).strip("_") or default
+    if name[0].isdigit():
+        name = f"t_{name}"
+    unique = name
+    suffix = 2
+    while unique in taken:
+        unique = f"{name}_{suffix}"
+        suffix += 1
+    taken.add(unique)
+    return unique
+
+
+def _column(text, taken: set, position: int) -> str:
+    """Return a unique column name, keeping the header's own wording."""
+    name = str(text).strip() if text not in (None, "") else f"column_{position}"
+    unique = name
+    suffix = 2
+    while unique.casefold() in taken:
+        unique = f"{name}_{suffix}"
+        suffix += 1
+    taken.add(unique.casefold())
+    return unique
+
+
+def _quote(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _convert(value):
+    """Store numbers as numbers, so filters and aggregates compare them as such.
+
+    Strings with leading zeros (zip codes, ids) are kept as text.
+    """
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = value.strip()
+        if not value:
+            return None
+        if _INTEGER.fullmatch(value):
+            return int(value)
+        if _REAL.fullmatch(value):
+            return float(value)
+        return value
+    return str(value)
+
+
+def _fit(row, width: int) -> list:
+    """Convert a row's values, padded or cut to the table's width."""
+    values = [_convert(value) for value in row[:width]]
+    return values + [None] * (width - len(values))
+
+
+def extract_sql(text: str) -> str:
+    """Pull the SQL query out of a model's answer.
+
+    Drops Markdown code fences and anything before the first ``SELECT`` or
+    ``WITH``, and stops at the first semicolon.
+    """
+    text = re.sub(r"```(?:sql)?", "", text, flags=re.IGNORECASE)
+    match = re.search(r"\b(SELECT|WITH)\b", text, flags=re.IGNORECASE)
+    if match:
+        text = text[match.start() :]
+    return text.split(";")[0].strip()
+
+
+class TableStore:
+    """Every sheet of the CSV/XLSX sources as its own SQLite table.
+
+    The header row gives the column names and numeric values are stored as
+    numbers, so filter and aggregate questions are answered by SQLite over
+    whole columns instead of by the model over text chunks. A
+    ``source_tables`` table records the source, sheet, columns and row count
+    of each table.
+
+    Opened ``readonly``, the store refuses anything but ``SELECT`` queries,
+    which is how the API runs the SQL the model writes.
+
+    Args:
+        path (str): Path of the SQLite file.
+        readonly (bool): Open an existing store for queries only.
+    """
+
+    def __init__(self, path: str, readonly: bool = False):
+        self._lock = threading.Lock()
+        if readonly:
+            self._conn = sqlite3.connect(
+                f"file:{path}?mode=ro", uri=True, check_same_thread=False
+            )
+            return
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS source_tables (
+                    name TEXT PRIMARY KEY,
+                    source TEXT NOT NULL,
+                    sheet TEXT,
+                    columns TEXT NOT NULL,
+                    row_count INTEGER NOT NULL
+                )
+                """
+            )
+
+    def close(self):
+        """Close the connection."""
+        self._conn.close()
+
+    def _drop(self, source: str):
+        names = [
+            name
+            for (name,) in self._conn.execute(
+                "SELECT name FROM source_tables WHERE source = ?", (source,)
+            )
+        ]
+        for name in names:
+            self._conn.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        self._conn.execute("DELETE FROM source_tables WHERE source = ?", (source,))
+
+    def write_source(self, source: str, rows: Iterable) -> int:
+        """Replace the tables of a source, streaming its rows in.
+
+        The source is written in one transaction, so readers keep seeing its
+        previous tables until it is complete, and a failure leaves them as
+        they were.
+
+        Args:
+            source (str): The source path.
+            rows (Iterable): ``(sheet, row)`` tuples, the first row of each
+                sheet being its header (see ``tabular_loader.read_rows``).
+
+        Returns:
+            int: The number of data rows stored.
+        """
+        base = os.path.splitext(os.path.basename(source))[0]
+        total = 0
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._drop(source)
+            taken = {
+                name
+                for (name,) in self._conn.execute(
+                    "SELECT name FROM sqlite_master WHERE type = 'table'"
+                )
+            }
+            for sheet, sheet_rows in groupby(rows, key=itemgetter(0)):
+                values = (row for _, row in sheet_rows)
+                table = _identifier(
+                    base if sheet is None else f"{base}_{sheet}", taken, "table"
+                )
+                column_names = set()
+                columns = [
+                    _column(value, column_names, i + 1)
+                    for i, value in enumerate(next(values))
+                ]
+                self._conn.execute(
+                    f"CREATE TABLE {_quote(table)} "
+                    f"({', '.join(_quote(column) for column in columns)})"
+                )
+                insert = (
+                    f"INSERT INTO {_quote(table)} "
+                    f"VALUES ({', '.join('?' * len(columns))})"
+                )
+                count = 0
+                while batch := [
+                    _fit(row, len(columns)) for row in islice(values, _INSERT_BATCH)
+                ]:
+                    self._conn.executemany(insert, batch)
+                    count += len(batch)
+                self._conn.execute(
+                    "INSERT INTO source_tables VALUES (?, ?, ?, ?, ?)",
+                    (table, source, sheet, json.dumps(columns), count),
+                )
+                total += count
+        return total
+
+    def remove_source(self, source: str):
+        """Drop the tables of a source."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            self._drop(source)
+
+    def clear(self):
+        """Drop every table."""
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN")
+            for (source,) in self._conn.execute(
+                "SELECT DISTINCT source FROM source_tables"
+            ).fetchall():
+                self._drop(source)
+
+    def tables(self, source: str = None) -> list:
+        """List the stored tables, optionally only those of one source.
+
+        Returns:
+            list: Dicts with the ``name``, ``source``, ``sheet``, ``columns``
+            and ``row_count`` of each table.
+        """
+        sql = "SELECT name, source, sheet, columns, row_count FROM source_tables"
+        params = []
+        if source:
+            sql += " WHERE source = ?"
+            params.append(source)
+        with self._lock:
+            rows = self._conn.execute(sql + " ORDER BY name", params).fetchall()
+        return [
+            {
+                "name": name,
+                "source": table_source,
+                "sheet": sheet,
+                "columns": json.loads(columns),
+                "row_count": row_count,
+            }
+            for name, table_source, sheet, columns, row_count in rows
+        ]
+
+    def select_tables(self, question: str, names: list = None, k: int = 3) -> list:
+        """Pick the tables a question is most likely about.
+
+        Args:
+            question (str): The question.
+            names (list): Table names to use instead of picking.
+            k (int): Maximum number of tables to pick.
+
+        Returns:
+            list: Table dicts (see :meth:`tables`), best match first.
+        """
+        tables = self.tables()
+        if names:
+            return [table for table in tables if table["name"] in names]
+
+        question_terms = _terms(question)
+
+        def score(table):
+            terms = _terms(
+                " ".join(
+                    [
+                        table["name"],
+                        os.path.basename(table["source"]),
+                        table["sheet"] or "",
+                        *table["columns"],
+                    ]
+                )
+            )
+            return len(question_terms & terms)
+
+        return sorted(tables, key=score, reverse=True)[:k]
+
+    def describe(self, tables: list, sample_rows: int = 3) -> str:
+        """Describe tables for a prompt: their columns, size and first rows."""
+        parts = []
+        for table in tables:
+            with self._lock:
+                samples = self._conn.execute(
+                    f"SELECT * FROM {_quote(table['name'])} LIMIT ?", (sample_rows,)
+                ).fetchall()
+            columns = ", ".join(_quote(column) for column in table["columns"])
+            parts.append(
+                "\n".join(
+                    [
+                        f"CREATE TABLE {_quote(table['name'])} ({columns});",
+                        f"-- {table['row_count']} rows from "
+                        f"{os.path.basename(table['source'])}"
+                        + (f", sheet {table['sheet']}" if table["sheet"] else ""),
+                        "-- First rows:",
+                        *(f"-- {format_row(row)}" for row in samples),
+                    ]
+                )
+            )
+        return "\n\n".join(parts)
+
+    def query(self, sql: str, max_rows: int, timeout: float) -> dict:
+        """Run one read-only query.
+
+        Args:
+            sql (str): A single ``SELECT`` statement.
+            max_rows (int): Maximum number of rows returned.
+            timeout (float): Seconds after which the query is interrupted.
+
+        Returns:
+            dict: The result's ``columns`` and ``rows``, and whether it was
+            ``truncated`` to ``max_rows``.
+
+        Raises:
+            sqlite3.Error: If the query is invalid, writes or times out.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            self._conn.set_authorizer(
+                lambda action, *_: (
+                    sqlite3.SQLITE_OK
+                    if action in _READ_ACTIONS
+                    else sqlite3.SQLITE_DENY
+                )
+            )
+            self._conn.set_progress_handler(lambda: time.monotonic() > deadline, 10_000)
+            try:
+                cursor = self._conn.execute(sql)
+                rows = cursor.fetchmany(max_rows + 1)
+                columns = [column[0] for column in cursor.description or []]
+            finally:
+                self._conn.set_authorizer(None)
+                self._conn.set_progress_handler(None, 0)
+        return {
+            "columns": columns,
+            "rows": [list(row) for row in rows[:max_rows]],
+            "truncated": len(rows) > max_rows,
+        }
@@ -0,0 +1,252 @@
+"""Per-request stage traces, and the Prometheus metrics recorded from them."""
+
+import json
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import REGISTRY, Counter, Gauge, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Seconds, from sub-millisecond index lookups to minute-long generations.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    "rag_stage_seconds",
+    "Time spent in each stage of a request.",
+    ["stage"],
+    buckets=BUCKETS,
+)
+REQUEST_SECONDS = Histogram(
+    "rag_request_seconds",
+    "End-to-end time of requests.",
+    ["route", "status"],
+    buckets=BUCKETS,
+)
+IN_FLIGHT = Gauge(
+    "rag_requests_in_flight", "Requests currently being served.", ["route"]
+)
+LIMITER_REQUESTS = Gauge(
+    "rag_limiter_requests", "Requests holding or waiting for a slot.", ["state"]
+)
+TOKENS = Counter("rag_tokens", "Tokens read and generated by the LLM.", ["kind"])
+
+
+class CacheCollector:
+    """Exports the hits, misses and hit ratio of the watched caches at every scrape."""
+
+    def __init__(self):
+        self.caches = {}
+
+    def collect(self):
+        """Read every watched cache's ``(hits, misses)``."""
+        hits = CounterMetricFamily(
+            "rag_cache_hits", "Cache lookups that hit.", labels=["cache"]
+        )
+        misses = CounterMetricFamily(
+            "rag_cache_misses", "Cache lookups that missed.", labels=["cache"]
+        )
+        ratio = GaugeMetricFamily(
+            "rag_cache_hit_ratio",
+            "Share of cache lookups that hit since startup.",
+            labels=["cache"],
+        )
+        for name, stats in list(self.caches.items()):
+            hit_count, miss_count = stats()
+            hits.add_metric([name], hit_count)
+            misses.add_metric([name], miss_count)
+            total = hit_count + miss_count
+            ratio.add_metric([name], hit_count / total if total else 0.0)
+        return [hits, misses, ratio]
+
+
+CACHES = CacheCollector()
+REGISTRY.register(CACHES)
+
+
+def watch_cache(name: str, stats):
+    """Export the hits, misses and hit ratio of a cache at every scrape.
+
+    Args:
+        name (str): The ``cache`` label.
+        stats (callable): Returns the cache's ``(hits, misses)`` so far.
+    """
+    CACHES.caches[name] = stats
+
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_trace_log = {"path": None, "lock": threading.Lock()}
+
+
+def configure(trace_log: str = ""):
+    """Configure the per-request trace log.
+
+    Args:
+        trace_log (str): File to append one JSON line per request to, with the
+            timing of each of its stages. Empty disables the log.
+    """
+    _trace_log["path"] = trace_log or None
+
+
+class RequestTrace:
+    """The stage timings of one request.
+
+    Creating a trace makes it the current one, so ``span`` calls made while
+    serving the request are attached to it. Finishing it records the request
+    duration and appends the trace to the trace log, if one is configured.
+    It can also be used as a context manager.
+
+    Args:
+        route (str): The route or callback being served.
+        **attrs: Extra fields for the trace log.
+    """
+
+    def __init__(self, route: str, **attrs):
+        self.route = route
+        self.attrs = attrs
+        self.spans = []
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._finished = False
+        IN_FLIGHT.labels(route=route).inc()
+        _current_trace.set(self)
+
+    def add_span(self, stage: str, start: float, duration: float, **attrs):
+        """Attach a stage that started at ``start`` (a perf counter) to the trace."""
+        self.spans.append(
+            {
+                "stage": stage,
+                "offset_ms": round((start - self._start) * 1000, 3),
+                "duration_ms": round(duration * 1000, 3),
+                **attrs,
+            }
+        )
+
+    def finish(self, status="ok"):
+        """Record the request, once.
+
+        Args:
+            status: The ``status`` label, such as the HTTP status code.
+        """
+        if self._finished:
+            return
+        self._finished = True
+        duration = time.perf_counter() - self._start
+        IN_FLIGHT.labels(route=self.route).dec()
+        REQUEST_SECONDS.labels(route=self.route, status=status).observe(duration)
+        if _current_trace.get() is self:
+            _current_trace.set(None)
+
+        if _trace_log["path"]:
+            line = json.dumps(
+                {
+                    "time": self.started_at.isoformat(),
+                    "route": self.route,
+                    "status": status,
+                    "duration_ms": round(duration * 1000, 3),
+                    **self.attrs,
+                    "spans": self.spans,
+                },
+                default=str,
+            )
+            with _trace_log["lock"], open(
+                _trace_log["path"], "a", encoding="utf-8"
+            ) as f:
+                f.write(line + "\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.finish("ok" if exc_type is None else "error")
+
+
+def record_span(stage: str, start: float, duration: float, **attrs):
+    """Record a stage that started at ``start`` (a perf counter) and took ``duration``."""
+    STAGE_SECONDS.labels(stage=stage).observe(duration)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(stage, start, duration, **attrs)
+
+
+@contextmanager
+def span(stage: str, **attrs):
+    """Time a block of code as a stage of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(stage, start, time.perf_counter() - start, **attrs)
+
+
+# Tag of the chat model runs LLMMetricsHandler times as the ``rewrite`` stage.
+REWRITE_TAG = "rewrite"
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Time the prompt and generation stages of a RAG chain run, and count tokens.
+
+    ``prompt`` is the time from the retriever returning to the chat model
+    starting, which is spent stuffing the documents into the prompt.
+    ``first_token`` is the time from the chat model starting to its first
+    token, and ``generate`` the whole model call. Model calls tagged
+    ``REWRITE_TAG`` (rewriting a follow-up question for retrieval) are timed
+    as ``rewrite`` instead. Use one handler per request.
+    """
+
+    def __init__(self):
+        self._retrieved_at = None
+        self._started = {}
+        self._stages = {}
+        self._first_token_seen = set()
+
+    def on_retriever_end(self, documents, **kwargs):
+        self._retrieved_at = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+        now = time.perf_counter()
+        if REWRITE_TAG in (tags or []):
+            self._stages[run_id] = "rewrite"
+        else:
+            self._stages[run_id] = "generate"
+            if self._retrieved_at is not None:
+                record_span("prompt", self._retrieved_at, now - self._retrieved_at)
+        self._started[run_id] = now
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        if self._stages.get(run_id) != "generate":
+            return
+        if run_id in self._started and run_id not in self._first_token_seen:
+            self._first_token_seen.add(run_id)
+            start = self._started[run_id]
+            record_span("first_token", start, time.perf_counter() - start)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        start = self._started.pop(run_id, None)
+        stage = self._stages.pop(run_id, "generate")
+        self._first_token_seen.discard(run_id)
+        if start is None:
+            return
+
+        tokens = {}
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(
+                    getattr(generation, "message", None), "usage_metadata", None
+                )
+                for kind, key in [
+                    ("prompt", "input_tokens"),
+                    ("completion", "output_tokens"),
+                ]:
+                    if usage and usage.get(key):
+                        tokens[kind] = tokens.get(kind, 0) + usage[key]
+        for kind, count in tokens.items():
+            TOKENS.labels(kind=kind).inc(count)
+        record_span(
+            stage,
+            start,
+            time.perf_counter() - start,
+            **{f"{kind}_tokens": count for kind, count in tokens.items()},
+        )